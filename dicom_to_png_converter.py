@@ -1,31 +1,139 @@
 # dicom_debug_converter.py - Debug și fix pentru conversie DICOM
 import os
+import json
+import struct
+import zipfile
+import argparse
 import pydicom
 import numpy as np
 from PIL import Image
-import matplotlib.pyplot as plt
 
+from l3_window_lut import hu_index, window_lut, apply_lut, auto_window, header_window, rescale_parameters, \
+    LUT_OFFSET
 
-def debug_dicom_file(dicom_path):
-    """Debug pentru a înțelege datele DICOM"""
-    print(f"Analizez: {dicom_path}")
+# Formatele de ieșire pentru serii întregi (în plus față de PNG 8-bit per slice)
+VOLUME_FORMATS = ('npy', 'npz', 'nifti')
+OUTPUT_FORMATS = VOLUME_FORMATS + ('png16',)
+
+# QA pe serie: histograma agregată în HU și pragurile pentru anomalii
+QA_HU_RANGE = (-3072, 4096)
+QA_HU_BIN = 16  # Lățimea binului în histograma din JSON (divide intervalul)
+PADDING_HU = -2000  # Sub acest prag: valori de padding (în afara FOV)
+SATURATION_HU = 3071
+SATURATION_FRACTION = 0.001
+AIR_HU = -900  # Un CT fără pixeli sub acest prag are probabil rescale greșit
+MISSING_SLICE_HU = -1024  # Slice-urile ilizibile sau cu altă matrice intră în volum ca aer, nu ca apă (0 HU)
+
+NIFTI_HEADER_SIZE = 348
+NIFTI_VOX_OFFSET = 352  # Header + 4 octeți de extensie (fără extensii)
 
+
+def decode_dicom(dicom_path):
+    """O singură citire și decodare: (dataset, pixelii în HU ca indici LUT uint16)"""
     dicom = pydicom.dcmread(dicom_path)
-    img = dicom.pixel_array
+    return dicom, hu_index(dicom)
+
+
+def stored_histogram(pixels):
+    """
+    Histograma valorilor stocate cu np.bincount, fără copia din flatten:
+    întoarce (valoarea primului bin, numărători). int16 se numără prin view uint16.
+    """
+    if pixels.dtype in (np.uint8, np.uint16):
+        return 0, np.bincount(pixels.ravel())
+    if pixels.dtype == np.int16:
+        counts = np.bincount(pixels.view(np.uint16).ravel(), minlength=65536)
+        return -32768, np.roll(counts, 32768)  # Binurile negative (0x8000-0xFFFF) trec în față
+    values = pixels.astype(np.int64)
+    low = int(values.min())
+    return low, np.bincount((values - low).ravel())
+
+
+def histogram_stats(hu_values, counts):
+    """Statistici din histogramă (fără a reconstrui imaginea)"""
+    total = counts.sum()
+    mean = float((hu_values * counts).sum() / total)
+    std = float(np.sqrt((counts * (hu_values - mean) ** 2).sum() / total))
+    cdf = np.cumsum(counts)
+    p1, p99 = (float(hu_values[min(np.searchsorted(cdf, q * total), len(cdf) - 1)]) for q in (0.01, 0.99))
+    return {'min': float(hu_values[0]), 'max': float(hu_values[-1]), 'mean': mean, 'std': std,
+            'p1': p1, 'p99': p99, 'unique_values': int(len(counts))}
+
+
+def slice_qa(dicom):
+    """
+    QA pentru un slice: histograma HU (doar binurile nenule) și semnalizările
+    padding / saturat / constant / rescale suspect.
+    """
+    pixels = dicom.pixel_array
+    first, counts = stored_histogram(pixels)
+    nonzero = np.flatnonzero(counts)
+    counts = counts[nonzero]
+    stored = nonzero + first
+    slope, intercept = rescale_parameters(dicom)
+    hu_values = stored * slope + intercept
+    total = counts.sum()
+
+    record = histogram_stats(hu_values, counts)
+    record.update(rescale=[slope, intercept], shape=list(pixels.shape))
+
+    padding_value = dicom.get('PixelPaddingValue')
+    if padding_value is not None:
+        padding = counts[stored == int(padding_value)].sum()
+    else:
+        padding = counts[hu_values <= PADDING_HU].sum()
+    record['padding_fraction'] = float(padding / total)
+
+    bits_stored = int(dicom.get('BitsStored', pixels.dtype.itemsize * 8))
+    stored_max = 2 ** (bits_stored - 1) - 1 if pixels.dtype.kind == 'i' else 2 ** bits_stored - 1
+    saturated = counts[(stored >= stored_max) | (hu_values >= SATURATION_HU)].sum()
+    record['saturated_fraction'] = float(saturated / total)
+
+    flags = []
+    if len(counts) == 1:
+        flags.append('constant')
+    if padding > 0:
+        flags.append('padding')
+    if record['saturated_fraction'] > SATURATION_FRACTION:
+        flags.append('saturated')
+    if str(dicom.get('Modality', 'CT')) == 'CT' and len(counts) > 1 and hu_values[0] > AIR_HU:
+        flags.append('suspect_rescale')  # Niciun pixel de aer - lipsește probabil RescaleIntercept
+    record['flags'] = flags
+    return record, hu_values, counts
+
+
+def debug_dicom_file(dicom_path, decoded=None, show=True):
+    """
+    Debug pentru a înțelege datele DICOM (refolosește slice-ul deja decodat, dacă e dat).
+    Cu show=False rămâne headless: doar statisticile din histogramă, fără matplotlib.
+    """
+    print(f"Analizez: {dicom_path}")
+
+    dicom, _ = decoded or decode_dicom(dicom_path)
+    img = dicom.pixel_array  # Păstrat în cache de pydicom după prima decodare
+    record, hu_values, counts = slice_qa(dicom)
 
     print(f"Shape: {img.shape}")
     print(f"Dtype: {img.dtype}")
-    print(f"Min value: {np.min(img)}")
-    print(f"Max value: {np.max(img)}")
-    print(f"Mean value: {np.mean(img)}")
+    print(f"Min value (HU): {record['min']:.0f}")
+    print(f"Max value (HU): {record['max']:.0f}")
+    print(f"Mean value (HU): {record['mean']:.1f}")
+    if record['flags']:
+        print(f"Anomalii: {', '.join(record['flags'])}")
+
+    if not show:
+        return record
 
-    # Afișează histograma valorilor
+    # pyplot doar pentru funcțiile de debug - conversia în lot nu îl încarcă
+    import matplotlib.pyplot as plt
+
+    # Afișează histograma valorilor (din bincount, în 100 de binuri)
     plt.figure(figsize=(10, 4))
 
     plt.subplot(1, 2, 1)
-    plt.hist(img.flatten(), bins=100, alpha=0.7)
-    plt.title("Histograma valorilor pixel")
-    plt.xlabel("Valoare pixel")
+    plt.hist(hu_values, bins=100, weights=counts, alpha=0.7)
+    plt.title("Histograma valorilor pixel (HU)")
+    plt.xlabel("HU")
     plt.ylabel("Frecventa")
 
     plt.subplot(1, 2, 2)
@@ -37,91 +145,84 @@ def debug_dicom_file(dicom_path):
     plt.savefig("debug_dicom.png")
     plt.show()
 
-    return img
+    return record
 
 
-def convert_dicom_simple(dicom_path, output_path):
-    """Conversie simplă fără windowing complex"""
-    try:
-        dicom = pydicom.dcmread(dicom_path)
-        img = dicom.pixel_array.astype(np.float32)
+# Strategiile de windowing lucrează pe slice-ul decodat o singură dată: (dicom, index) -> (uint8, info)
 
-        # Metodă 1: Auto-contrast simplu
-        img_min = np.min(img)
-        img_max = np.max(img)
+def window_simple(dicom, index):
+    """Auto-contrast simplu: min-max"""
+    img_min, img_max = int(index.min()) - LUT_OFFSET, int(index.max()) - LUT_OFFSET
+    if img_max <= img_min:
+        return np.zeros(index.shape, dtype=np.uint8), f"Range: {img_min} to {img_max}"
+    return apply_lut(index, window_lut((img_min + img_max) / 2, img_max - img_min)), \
+        f"Range: {img_min} to {img_max}"
 
-        if img_max > img_min:
-            img_normalized = ((img - img_min) / (img_max - img_min) * 255).astype(np.uint8)
-        else:
-            img_normalized = np.zeros_like(img, dtype=np.uint8)
 
-        # Salvează
-        pil_image = Image.fromarray(img_normalized, mode='L')
-        pil_image.save(output_path)
+def window_percentile(dicom, index, low_percentile=1, high_percentile=99):
+    """Windowing cu percentile"""
+    window_center, window_width = auto_window(index, low_percentile, high_percentile)
+    p_low, p_high = window_center - window_width / 2, window_center + window_width / 2
+    return apply_lut(index, window_lut(window_center, window_width)), \
+        f"Percentile {low_percentile}%-{high_percentile}%: {p_low:.1f} to {p_high:.1f}"
 
-        return True, f"Range: {img_min:.1f} to {img_max:.1f}"
 
-    except Exception as e:
-        return False, str(e)
+def window_ct(dicom, index):
+    """Windowing CT: fereastra din header, altfel abdomen/soft tissue"""
+    window_center, window_width = header_window(dicom)
+    return apply_lut(index, window_lut(window_center, window_width)), \
+        f"CT Window: C={window_center}, W={window_width}"
 
 
-def convert_dicom_percentile(dicom_path, output_path, low_percentile=1, high_percentile=99):
-    """Conversie cu percentile pentru windowing"""
-    try:
-        dicom = pydicom.dcmread(dicom_path)
-        img = dicom.pixel_array.astype(np.float32)
+WINDOW_METHODS = {
+    'simple': window_simple,
+    'percentile': window_percentile,
+    'ct_window': window_ct
+}
 
-        # Windowing cu percentile
-        p_low = np.percentile(img, low_percentile)
-        p_high = np.percentile(img, high_percentile)
-
-        img_clipped = np.clip(img, p_low, p_high)
-        img_normalized = ((img_clipped - p_low) / (p_high - p_low) * 255).astype(np.uint8)
-
-        # Salvează
-        pil_image = Image.fromarray(img_normalized, mode='L')
-        pil_image.save(output_path)
-
-        return True, f"Percentile {low_percentile}%-{high_percentile}%: {p_low:.1f} to {p_high:.1f}"
 
+def convert_decoded(decoded, output_path, method='percentile', **options):
+    """Aplică o strategie de windowing pe un slice decodat și salvează PNG-ul"""
+    try:
+        img_normalized, info = WINDOW_METHODS[method](*decoded, **options)
+        Image.fromarray(img_normalized).save(output_path)
+        return True, info
     except Exception as e:
         return False, str(e)
 
 
-def convert_dicom_ct_window(dicom_path, output_path):
-    """Conversie cu windowing specific CT"""
+def convert_decoded_multi(decoded, output_paths):
+    """Toate metodele cerute ({metoda: cale PNG}) dintr-o singură decodare"""
+    return {method: convert_decoded(decoded, path, method) for method, path in output_paths.items()}
+
+
+def convert_dicom(dicom_path, output_path, method='percentile', **options):
+    """Citește un fișier și îl convertește cu metoda dată"""
     try:
-        dicom = pydicom.dcmread(dicom_path)
-        img = dicom.pixel_array.astype(np.float32)
+        decoded = decode_dicom(dicom_path)
+    except Exception as e:
+        return False, str(e)
+    return convert_decoded(decoded, output_path, method, **options)
 
-        # Încearcă să citească window din DICOM header
-        try:
-            window_center = float(dicom.WindowCenter[0] if hasattr(dicom, 'WindowCenter') else 40)
-            window_width = float(dicom.WindowWidth[0] if hasattr(dicom, 'WindowWidth') else 400)
-        except:
-            # Windowing pentru abdomen/soft tissue
-            window_center = 40
-            window_width = 400
 
-        # Aplică windowing
-        img_min = window_center - window_width // 2
-        img_max = window_center + window_width // 2
+def convert_dicom_simple(dicom_path, output_path):
+    """Conversie simplă fără windowing complex"""
+    return convert_dicom(dicom_path, output_path, 'simple')
 
-        img_windowed = np.clip(img, img_min, img_max)
-        img_normalized = ((img_windowed - img_min) / (img_max - img_min) * 255).astype(np.uint8)
 
-        # Salvează
-        pil_image = Image.fromarray(img_normalized, mode='L')
-        pil_image.save(output_path)
+def convert_dicom_percentile(dicom_path, output_path, low_percentile=1, high_percentile=99):
+    """Conversie cu percentile pentru windowing"""
+    return convert_dicom(dicom_path, output_path, 'percentile',
+                         low_percentile=low_percentile, high_percentile=high_percentile)
 
-        return True, f"CT Window: C={window_center}, W={window_width}"
 
-    except Exception as e:
-        return False, str(e)
+def convert_dicom_ct_window(dicom_path, output_path):
+    """Conversie cu windowing specific CT"""
+    return convert_dicom(dicom_path, output_path, 'ct_window')
 
 
 def test_conversion_methods():
-    """Testează diferite metode de conversie pe primul fișier"""
+    """Testează diferite metode de conversie pe primul fișier (o singură citire)"""
     input_dir = "data/images/"
 
     # Găsește primul fișier DICOM
@@ -137,30 +238,27 @@ def test_conversion_methods():
     print(f"Testez conversiile pe: {test_file}")
     print("=" * 50)
 
+    decoded = decode_dicom(dicom_path)
+
     # Debug info
-    debug_dicom_file(dicom_path)
+    debug_dicom_file(dicom_path, decoded)
 
-    # Testează metodele
-    methods = [
-        ("simple", convert_dicom_simple),
-        ("percentile", convert_dicom_percentile),
-        ("ct_window", convert_dicom_ct_window)
-    ]
+    # Testează metodele pe același slice decodat
+    outputs = convert_decoded_multi(decoded, {method: f"test_{method}.png" for method in WINDOW_METHODS})
 
     results = []
 
-    for method_name, method_func in methods:
-        output_path = f"test_{method_name}.png"
-        success, info = method_func(dicom_path, output_path)
-
+    for method_name, (success, info) in outputs.items():
         if success:
             print(f"✓ {method_name}: {info}")
-            results.append((method_name, output_path))
+            results.append((method_name, f"test_{method_name}.png"))
         else:
             print(f"✗ {method_name}: {info}")
 
     # Afișează rezultatele
     if results:
+        import matplotlib.pyplot as plt
+
         fig, axes = plt.subplots(1, len(results), figsize=(5 * len(results), 5))
         if len(results) == 1:
             axes = [axes]
@@ -178,6 +276,33 @@ def test_conversion_methods():
         print(f"\nComparația metodelor salvată în: conversion_comparison.png")
 
 
+def convert_all_methods(input_dir="data/images/", output_dir="png_methods/"):
+    """Fiecare slice al seriei, decodat o dată, scris cu toate metodele (output_dir/<metoda>/)"""
+    for method in WINDOW_METHODS:
+        os.makedirs(os.path.join(output_dir, method), exist_ok=True)
+
+    dicom_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.dcm'))
+    print(f"Convertesc {len(dicom_files)} fisiere cu {len(WINDOW_METHODS)} metode...")
+
+    for i, filename in enumerate(dicom_files):
+        png_name = filename.replace('.dcm', '.png')
+        try:
+            decoded = decode_dicom(os.path.join(input_dir, filename))
+        except Exception as e:
+            print(f"✗ {i + 1}/{len(dicom_files)}: {filename} - {e}")
+            continue
+
+        outputs = convert_decoded_multi(decoded, {method: os.path.join(output_dir, method, png_name)
+                                                  for method in WINDOW_METHODS})
+        failed = [f"{method}: {info}" for method, (success, info) in outputs.items() if not success]
+        if failed:
+            print(f"✗ {i + 1}/{len(dicom_files)}: {filename} - {'; '.join(failed)}")
+        else:
+            print(f"✓ {i + 1}/{len(dicom_files)}: {filename}")
+
+    print(f"\nComparatia metodelor pe toata seria: {output_dir}")
+
+
 def convert_all_with_best_method():
     """Convertește toate cu cea mai bună metodă"""
     input_dir = "data/images/"
@@ -205,13 +330,288 @@ def convert_all_with_best_method():
     print(f"\nConversie completă! Imaginile sunt în: {output_dir}")
 
 
-if __name__ == "__main__":
-    print("DICOM Debug Converter")
-    print("=" * 30)
+def read_series_geometry(input_dir, dicom_files):
+    """
+    Citește doar headerele și ordonează slice-urile de-a lungul normalei planului.
+    Întoarce (fișiere ordonate, (rânduri, coloane), spacing (x, y, z), afinul RAS 4x4).
+    Fișierele cu header ilizibil nu pot fi poziționate în serie și sunt omise.
+    """
+    headers, readable = [], []
+    for f in dicom_files:
+        try:
+            headers.append(pydicom.dcmread(os.path.join(input_dir, f), stop_before_pixels=True))
+            readable.append(f)
+        except Exception as e:
+            print(f"✗ {f} - header ilizibil, omis din volum: {e}")
+    if not headers:
+        raise ValueError("Niciun header DICOM lizibil in serie")
+    dicom_files = readable
+    first = headers[0]
+    shape = (int(first.Rows), int(first.Columns))
+
+    orientation = np.array(first.get('ImageOrientationPatient', [1, 0, 0, 0, 1, 0]), dtype=float)
+    row_dir, col_dir = orientation[:3], orientation[3:]
+    normal = np.cross(row_dir, col_dir)
+    spacing_row, spacing_col = [float(v) for v in first.get('PixelSpacing', [1, 1])]
+
+    positions = [h.get('ImagePositionPatient') for h in headers]
+    if all(p is not None for p in positions):
+        positions = np.array(positions, dtype=float)
+        order = np.argsort(positions @ normal, kind='stable')
+    else:
+        positions = None
+        order = np.arange(len(headers))
+
+    if positions is not None and len(order) > 1:
+        origin = positions[order[0]]
+        slice_step = (positions[order[-1]] - origin) / (len(order) - 1)
+        distances = np.diff(positions[order] @ normal)
+        if np.ptp(distances) > 0.01 * max(abs(np.mean(distances)), 1e-6):
+            print(f"ATENTIE: spatiere neuniforma intre slice-uri ({distances.min():.2f}-{distances.max():.2f}mm)")
+    else:
+        origin = positions[order[0]] if positions is not None else np.zeros(3)
+        slice_step = normal * float(first.get('SliceThickness', 1) or 1)
+
+    # Voxel (i = coloană, j = rând, k = slice) -> LPS, apoi LPS -> RAS pentru NIfTI
+    affine = np.eye(4)
+    affine[:3, 0] = row_dir * spacing_col
+    affine[:3, 1] = col_dir * spacing_row
+    affine[:3, 2] = slice_step
+    affine[:3, 3] = origin
+    affine = np.diag([-1, -1, 1, 1]) @ affine
+
+    spacing = (spacing_col, spacing_row, float(np.linalg.norm(slice_step)))
+    return [dicom_files[i] for i in order], shape, spacing, affine
+
+
+def read_hu_slice(dicom_path, shape):
+    """Slice-ul în HU (int16); None dacă are altă dimensiune decât volumul"""
+    index = hu_index(pydicom.dcmread(dicom_path))
+    if index.shape != shape:
+        return None
+    return (index.astype(np.int32) - LUT_OFFSET).astype(np.int16)
+
+
+def nifti_header(shape, num_slices, spacing, affine, description="DICOM -> NIfTI (HU)"):
+    """Headerul NIfTI-1 (single file, int16, sform din geometria DICOM)"""
+    header = bytearray(NIFTI_HEADER_SIZE)
+    rows, cols = shape
+    struct.pack_into('<i', header, 0, NIFTI_HEADER_SIZE)
+    struct.pack_into('<8h', header, 40, 3, cols, rows, num_slices, 1, 1, 1, 1)
+    struct.pack_into('<hh', header, 70, 4, 16)  # datatype int16, bitpix
+    struct.pack_into('<8f', header, 76, 1.0, *spacing, 0, 0, 0, 0)
+    struct.pack_into('<fff', header, 108, NIFTI_VOX_OFFSET, 1.0, 0.0)  # vox_offset, scl_slope, scl_inter
+    header[123] = 2  # xyzt_units: mm
+    header[148:148 + 80] = description.encode('ascii')[:80].ljust(80, b'\0')
+    struct.pack_into('<hh', header, 252, 0, 1)  # qform_code 0, sform_code 1 (scanner)
+    for row in range(3):
+        struct.pack_into('<4f', header, 280 + 16 * row, *affine[row])
+    header[344:348] = b'n+1\0'
+    return bytes(header)
+
+
+class NpzVolumeWriter:
+    """
+    Scrie volumul ca membru 'volume.npy' într-un .npz comprimat, slice cu slice;
+    la închidere adaugă 'missing_slices.npy' (indicii slice-urilor umplute)
+    """
+
+    def __init__(self, output_path, volume_shape, affine):
+        self.zip = zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        with self.zip.open('affine.npy', 'w') as f:
+            np.lib.format.write_array(f, affine)
+        self.stream = self.zip.open('volume.npy', 'w', force_zip64=True)
+        np.lib.format.write_array_header_2_0(self.stream, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.int16)),
+                                                           'fortran_order': False, 'shape': volume_shape})
+
+    def write(self, slice_idx, hu):
+        self.stream.write(hu.tobytes())  # Slice-urile vin în ordine
+
+    def close(self, missing):
+        self.stream.close()
+        with self.zip.open('missing_slices.npy', 'w') as f:
+            np.lib.format.write_array(f, missing)
+        self.zip.close()
+
+
+def convert_series_to_volume(input_dir, output_path, fmt='npy'):
+    """
+    Scrie toată seria într-un singur fișier de volum HU int16, slice cu slice:
+    'npy'   - memmap prealocat (n, rânduri, coloane), afinul RAS alături în .affine.npy
+    'npz'   - arhivă comprimată cu volume.npy, affine.npy și missing_slices.npy
+    'nifti' - .nii cu afinul din geometria DICOM (i = coloană, j = rând, k = slice)
+    Slice-urile ilizibile sau cu altă dimensiune sunt umplute cu MISSING_SLICE_HU; indicii lor
+    sunt scriși în .missing_slices.npy alături de volum (npy, nifti) sau în arhivă (npz).
+    """
+    if fmt not in VOLUME_FORMATS:
+        raise ValueError(f"Format necunoscut: {fmt} (acceptate: {', '.join(VOLUME_FORMATS)})")
+
+    dicom_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.dcm'))
+    if not dicom_files:
+        print("Nu s-au gasit fisiere DICOM!")
+        return None
+
+    files, shape, spacing, affine = read_series_geometry(input_dir, dicom_files)
+    volume_shape = (len(files),) + shape
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    sidecar = os.path.splitext(output_path)[0]
+    if fmt == 'npy':
+        volume = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.int16, shape=volume_shape)
+        np.save(sidecar + '.affine.npy', affine)
+
+        def write(slice_idx, hu):
+            volume[slice_idx] = hu
+
+        def close(missing):
+            volume.flush()
+            np.save(sidecar + '.missing_slices.npy', missing)
+    elif fmt == 'npz':
+        writer = NpzVolumeWriter(output_path, volume_shape, affine)
+        write, close = writer.write, writer.close
+    else:
+        f = open(output_path, 'wb')
+        f.write(nifti_header(shape, len(files), spacing, affine))
+        f.write(b'\0' * (NIFTI_VOX_OFFSET - NIFTI_HEADER_SIZE))
+        f.truncate(NIFTI_VOX_OFFSET + int(np.prod(volume_shape)) * 2)  # Fișier prealocat
+
+        def write(slice_idx, hu):
+            f.seek(NIFTI_VOX_OFFSET + slice_idx * hu.nbytes)
+            f.write(hu.tobytes())  # Ordinea C a slice-ului = i (coloana) variază cel mai repede
+
+        def close(missing):
+            f.close()
+            np.save(sidecar + '.missing_slices.npy', missing)
+
+    missing = []
+    try:
+        for slice_idx, filename in enumerate(files):
+            try:
+                hu = read_hu_slice(os.path.join(input_dir, filename), shape)
+                error = "dimensiune diferita de volum"
+            except Exception as e:
+                hu, error = None, str(e)
+            if hu is None:
+                print(f"✗ {slice_idx + 1}/{len(files)}: {filename} - {error} (slice umplut cu {MISSING_SLICE_HU} HU)")
+                hu = np.full(shape, MISSING_SLICE_HU, dtype=np.int16)
+                missing.append(slice_idx)
+            write(slice_idx, hu)
+    finally:
+        close(np.array(missing, dtype=np.int64))
+
+    print(f"Volum {volume_shape} ({fmt}) scris in: {output_path}")
+    if missing:
+        print(f"{len(missing)} slice-uri lipsa (umplute cu {MISSING_SLICE_HU} HU): {missing}")
+    return output_path
+
+
+def convert_series_to_png16(input_dir, output_dir):
+    """PNG 16-bit per slice, fără pierdere de precizie: valoare = HU + 32768 (codarea din l3_window_lut)"""
+    os.makedirs(output_dir, exist_ok=True)
+    dicom_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.dcm'))
+
+    for i, filename in enumerate(dicom_files):
+        try:
+            index = hu_index(pydicom.dcmread(os.path.join(input_dir, filename)))
+            Image.fromarray(index).save(os.path.join(output_dir, filename.replace('.dcm', '.png')))
+            print(f"✓ {i + 1}/{len(dicom_files)}: {filename}")
+        except Exception as e:
+            print(f"✗ {i + 1}/{len(dicom_files)}: {filename} - {e}")
 
-    # Pasul 1: Testează metodele
-    test_conversion_methods()
+    print(f"\nConversie PNG 16-bit completa: {output_dir}")
 
-    # Pasul 2: Convertește toate cu metoda cea mai bună
-    print("\n" + "=" * 50)
-    convert_all_with_best_method()
\ No newline at end of file
+
+def convert_series(input_dir, output_path, fmt):
+    """Conversie a unei serii întregi în unul dintre OUTPUT_FORMATS"""
+    if fmt == 'png16':
+        return convert_series_to_png16(input_dir, output_path)
+    return convert_series_to_volume(input_dir, output_path, fmt)
+
+
+def qa_series(input_dir):
+    """
+    QA headless pe o serie: statistici și semnalizări per slice, histograma HU
+    agregată pe serie și anomaliile de serie (rescale sau dimensiuni inconsistente).
+    """
+    dicom_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.dcm'))
+    low, high = QA_HU_RANGE
+    series_counts = np.zeros(high - low, dtype=np.int64)
+    slices = []
+
+    for filename in dicom_files:
+        try:
+            record, hu_values, counts = slice_qa(pydicom.dcmread(os.path.join(input_dir, filename)))
+        except Exception as e:
+            slices.append({'file': filename, 'error': str(e), 'flags': ['unreadable']})
+            continue
+        bins = np.clip(np.rint(hu_values).astype(np.int64) - low, 0, len(series_counts) - 1)
+        np.add.at(series_counts, bins, counts)
+        slices.append({'file': filename, **record})
+
+    readable = [s for s in slices if 'error' not in s]
+    rescales = sorted({tuple(s['rescale']) for s in readable})
+    shapes = sorted({tuple(s['shape']) for s in readable})
+    flag_counts = {}
+    for s in slices:
+        for flag in s['flags']:
+            flag_counts[flag] = flag_counts.get(flag, 0) + 1
+
+    anomalies = sorted(flag_counts)
+    if len(rescales) > 1:
+        anomalies.append('inconsistent_rescale')
+    if len(shapes) > 1:
+        anomalies.append('inconsistent_shape')
+
+    series = {'num_slices': len(slices), 'num_readable': len(readable), 'anomalies': anomalies,
+              'flag_counts': flag_counts, 'rescale_values': [list(r) for r in rescales],
+              'shapes': [list(shape) for shape in shapes]}
+    if series_counts.any():
+        hu_axis = np.arange(low, high)
+        series.update(histogram_stats(hu_axis[series_counts > 0], series_counts[series_counts > 0]))
+        series.pop('unique_values')
+        coarse = series_counts.reshape(-1, QA_HU_BIN).sum(axis=1)
+        series['histogram'] = {'hu_start': low, 'bin_width': QA_HU_BIN, 'counts': coarse.tolist()}
+
+    return {'input_dir': input_dir, 'series': series, 'slices': slices}
+
+
+def write_qa_report(report, output_path):
+    """Scrie raportul QA ca JSON"""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    anomalies = report['series']['anomalies']
+    print(f"QA {report['series']['num_slices']} slice-uri: "
+          f"{', '.join(anomalies) if anomalies else 'fara anomalii'} -> {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conversie DICOM -> PNG / volum")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=None,
+                        help="fara --format: test metode + PNG 8-bit percentile")
+    parser.add_argument("--qa", action="store_true", help="QA headless pe serie (histograme HU) ca JSON")
+    parser.add_argument("--all-methods", action="store_true",
+                        help="PNG cu fiecare metoda de windowing, dintr-o singura decodare per slice")
+    parser.add_argument("--input", default="data/images/")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    if args.qa:
+        write_qa_report(qa_series(args.input), args.output or "series_qa.json")
+    elif args.all_methods:
+        convert_all_methods(args.input, args.output or "png_methods/")
+    elif args.format is not None:
+        default_outputs = {'npy': 'volume.npy', 'npz': 'volume.npz', 'nifti': 'volume.nii', 'png16': 'png16/'}
+        convert_series(args.input, args.output or default_outputs[args.format], args.format)
+    else:
+        print("DICOM Debug Converter")
+        print("=" * 30)
+
+        # Pasul 1: Testează metodele
+        test_conversion_methods()
+
+        # Pasul 2: Convertește toate cu metoda cea mai bună
+        print("\n" + "=" * 50)
+        convert_all_with_best_method()
\ No newline at end of file
@@ -2,19 +2,22 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import customtkinter as ctk
-import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 import numpy as np
-import pydicom
 import os
 import cv2
-from threading import Thread
+from threading import Thread, Event
 import time
 from datetime import datetime
 
 # Import detector
 from l3_y3_detector_anatomic import AnatomicL3Detector
+from l3_detector_config import DetectorConfig, get_default_config
+from l3_result_export import build_study_result, write_study_json
+from l3_volume_cache import SeriesVolumeCache, build_filmstrip_atlas, build_pyramid, pyramid_view
+from l3_window_lut import WINDOW_PRESETS, LUT_OFFSET, window_lut, apply_lut
+from l3_review_export import export_review_package
 
 # Set theme
 ctk.set_appearance_mode("dark")
@@ -22,11 +25,12 @@ ctk.set_default_color_theme("blue")
 
 
 class OptimizedY3GUI:
-    def __init__(self):
+    def __init__(self, config_path=None):
         self.root = ctk.CTk()
         self.root.title("Y3 VERTEBRA ANALYZER - Progressive Zone Detection")
         # Reducere 30% de la dimensiunea originală (1600x1000 -> 1120x700)
         self.root.geometry("1120x700")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Date
         self.ct_directory = "data/images/"
@@ -34,8 +38,11 @@ class OptimizedY3GUI:
         self.dicom_files = []
         self.slice_data = {}
         self.detector = None
+        # Profilul de parametri al detectorului (ex. best_profile.json din tuning), implicit DEFAULT_DETECTOR_PARAMS
+        self.detector_config = DetectorConfig.load(config_path) if config_path else get_default_config()
         self.y3_detected = False
         self.best_y3_slice = None
+        self.y3_candidates = []  # Top K al detectorului, pentru exportul pachetului de revizuire
 
         # Zona Y3 progresivă - îmbunătățită
         self.y3_zone_start = None
@@ -43,6 +50,26 @@ class OptimizedY3GUI:
         self.y3_zone_slices = []
         self.y3_progression_quality = 0
         self.formation_stages = {}  # Stadiile formării Y3
+        self.rib_termination = None  # Primul slice fără coaste (analiza secvenței)
+
+        # Filmstrip - miniaturile seriei într-un singur atlas, generat în fundal
+        self.volume_cache = None
+        self.background_stop = Event()  # Oprește umplerea cache-ului la schimbarea seriei sau la închidere
+        self.filmstrip_atlas = None
+        self.filmstrip_artists = {}
+        self.filmstrip_visible = 24  # Miniaturi vizibile odată
+
+        # Vizualizarea slice-ului - un singur AxesImage, actualizat cu set_data
+        self.view_ax = None
+        self.view_image = None
+        self.view_pyramid = None
+        self.view_limits = None  # (xlim, ylim) la zoom, None = imaginea întreagă
+        self.pan_start = None
+        self.max_zoom = 16
+
+        # Window/level - None = fereastra automată a fiecărui slice
+        self.view_window = None
+        self.window_drag_start = None
 
         # Colors optimizate
         self.colors = {
@@ -261,10 +288,17 @@ class OptimizedY3GUI:
         self.center_panel = ctk.CTkFrame(self.content_frame, fg_color=self.colors['bg_primary'])
         self.center_panel.pack(side='left', fill='both', expand=True)
 
+        # Filmstrip sub vizualizare (împachetat primul ca să nu fie împins afară de canvas)
+        self.setup_filmstrip()
+
         # Matplotlib figure mai mică
         self.fig = Figure(figsize=(8, 6), facecolor=self.colors['bg_primary'])
         self.canvas = FigureCanvasTkAgg(self.fig, self.center_panel)
         self.canvas.get_tk_widget().pack(fill='both', expand=True, padx=8, pady=8)
+        self.canvas.mpl_connect('scroll_event', self.on_view_scroll)
+        self.canvas.mpl_connect('button_press_event', self.on_view_press)
+        self.canvas.mpl_connect('motion_notify_event', self.on_view_drag)
+        self.canvas.mpl_connect('button_release_event', self.on_view_release)
 
         # Controls compacte
         controls_frame = ctk.CTkFrame(self.center_panel, height=40, fg_color=self.colors['bg_secondary'])
@@ -284,6 +318,32 @@ class OptimizedY3GUI:
         self.reset_view_btn = ctk.CTkButton(controls_frame, text="↺", width=40, command=self.reset_view)
         self.reset_view_btn.pack(side='left', padx=2, pady=5)
 
+        # Window/level - preseturi sau drag cu click dreapta pe imagine
+        ctk.CTkLabel(controls_frame, text="W/L:", text_color=self.colors['text_secondary']).pack(side='left',
+                                                                                                 padx=(16, 4))
+        self.window_preset_menu = ctk.CTkOptionMenu(
+            controls_frame, width=110,
+            values=['AUTO'] + [name.upper() for name in WINDOW_PRESETS],
+            command=self.on_window_preset
+        )
+        self.window_preset_menu.pack(side='left', padx=2, pady=5)
+
+        self.window_label = ctk.CTkLabel(controls_frame, text="", text_color=self.colors['text_secondary'])
+        self.window_label.pack(side='left', padx=8)
+
+    def setup_filmstrip(self):
+        """Banda de miniaturi a seriei - click pentru salt, scroll pentru derulare"""
+        self.filmstrip_fig = Figure(figsize=(8, 0.8), facecolor=self.colors['bg_secondary'])
+        self.filmstrip_ax = self.filmstrip_fig.add_axes([0, 0, 1, 1])
+        self.filmstrip_ax.set_facecolor(self.colors['bg_secondary'])
+        self.filmstrip_ax.axis('off')
+
+        self.filmstrip_canvas = FigureCanvasTkAgg(self.filmstrip_fig, self.center_panel)
+        self.filmstrip_canvas.get_tk_widget().configure(height=80)
+        self.filmstrip_canvas.get_tk_widget().pack(side='bottom', fill='x', padx=8, pady=(0, 8))
+        self.filmstrip_canvas.mpl_connect('button_press_event', self.on_filmstrip_click)
+        self.filmstrip_canvas.mpl_connect('scroll_event', self.on_filmstrip_scroll)
+
     def setup_y3_zone_panel(self):
         """Panel dedicat pentru zona Y3 - cea mai importantă îmbunătățire"""
         self.right_panel = ctk.CTkFrame(self.content_frame, width=300, fg_color=self.colors['bg_primary'])
@@ -427,7 +487,7 @@ class OptimizedY3GUI:
             self.update_status("◆ INITIALIZING Y3 ZONE DETECTOR...")
 
             # Initialize detector
-            self.detector = AnatomicL3Detector(self.ct_directory)
+            self.detector = AnatomicL3Detector(self.ct_directory, params=self.detector_config)
 
             self.update_status("◆ SCANNING FOR Y3 PROGRESSIVE ZONE...")
             self.detector.load_and_analyze_all_slices()
@@ -444,26 +504,23 @@ class OptimizedY3GUI:
     def y3_zone_detection_complete(self, candidates):
         """Y3 Zone detection completă cu analiză progresivă îmbunătățită"""
         try:
-            total_slices = len(self.dicom_files)
-
-            # Calculează zona Y3 progresivă (ultimele 15% pentru mai multă precizie)
-            self.y3_zone_start = int(total_slices * 0.85)  # Start mai devreme
-            self.y3_zone_end = total_slices - 1
+            # Zona Y3 din analiza secvenței (terminarea coastelor + vârful scorului netezit)
+            sequence = self.detector.analyze_sequence()
+            if sequence is None:
+                raise ValueError("Nu exista slice-uri analizate")
+            self.y3_zone_start, self.y3_zone_end = sequence['zone']
             zone_size = self.y3_zone_end - self.y3_zone_start + 1
 
-            # Filtrează candidații din zona Y3
-            y3_zone_candidates = []
-            for slice_idx, filename, score, analysis in candidates:
-                if slice_idx >= self.y3_zone_start:
-                    y3_zone_candidates.append((slice_idx, filename, score, analysis))
+            # Candidații din zona Y3 (din tabelul de scoruri al detectorului, nu doar top K)
+            y3_zone_candidates = self.detector.get_candidates_in_range(self.y3_zone_start, self.y3_zone_end)
 
             # Analizează progresivitatea formării
             if y3_zone_candidates:
                 # Sortează după index pentru analiză progresivă
                 sorted_zone = sorted(y3_zone_candidates, key=lambda x: x[0])
 
-                # Analizează calitatea progresiei
-                self.analyze_formation_progression(sorted_zone)
+                # Calitatea progresiei și stadiile formării, calculate vectorizat de detector
+                self.apply_sequence_analysis(sequence)
 
                 # Găsește cel mai bun candidat
                 best_candidate = max(y3_zone_candidates, key=lambda x: x[2])
@@ -471,6 +528,7 @@ class OptimizedY3GUI:
 
                 self.best_y3_slice = filename
                 self.y3_detected = True
+                self.y3_candidates = candidates
                 self.y3_zone_slices = y3_zone_candidates
 
                 # Update status cu informații despre zonă
@@ -526,6 +584,9 @@ This may indicate:
 
 MANUAL REVIEW RECOMMENDED""")
 
+            # Colorează filmstrip-ul după scorurile Y3
+            self.update_filmstrip_scores()
+
             # Update progress
             self.progress_bar.set(1.0)
 
@@ -538,39 +599,16 @@ MANUAL REVIEW RECOMMENDED""")
         except Exception as e:
             self.y3_zone_detection_error(str(e))
 
-    def analyze_formation_progression(self, sorted_zone_candidates):
-        """Analizează progresivitatea formării Y3"""
-        if len(sorted_zone_candidates) < 2:
-            self.y3_progression_quality = 0
-            return
-
-        # Calculează trend-ul scorurilor
-        scores = [candidate[2] for candidate in sorted_zone_candidates]
-        positions = list(range(len(scores)))
-
-        # Calculează progresivitatea (trend crescător = bun)
-        if len(scores) >= 3:
-            # Verifică dacă scorurile cresc în general
-            increases = sum(1 for i in range(1, len(scores)) if scores[i] > scores[i - 1])
-            total_comparisons = len(scores) - 1
-            progression_ratio = increases / total_comparisons if total_comparisons > 0 else 0
-
-            # Calculează stabilitatea (variația nu e prea mare)
-            score_variance = np.var(scores) if len(scores) > 1 else 0
-            stability_factor = max(0, 1 - score_variance / 1000)  # Normalizat
-
-            # Calitatea finală a progresiei
-            self.y3_progression_quality = (progression_ratio * 0.7 + stability_factor * 0.3) * 100
-        else:
-            self.y3_progression_quality = 50  # Progresie limitată
+    def apply_sequence_analysis(self, sequence):
+        """Preia calitatea progresiei și stadiile formării Y3 din analiza secvenței"""
+        self.y3_progression_quality = sequence['progression_quality']
+        self.rib_termination = sequence['rib_termination']
 
         # Salvează stadiile formării pentru afișare
-        self.formation_stages = {
-            'early': sorted_zone_candidates[0] if sorted_zone_candidates else None,
-            'middle': sorted_zone_candidates[len(sorted_zone_candidates) // 2] if len(
-                sorted_zone_candidates) > 2 else None,
-            'optimal': sorted_zone_candidates[-1] if sorted_zone_candidates else None
-        }
+        self.formation_stages = {}
+        for stage, slice_idx in sequence['stages'].items():
+            candidates = self.detector.get_candidates([slice_idx]) if slice_idx is not None else []
+            self.formation_stages[stage] = candidates[0] if candidates else None
 
     def get_formation_quality_text(self):
         """Returnează textul pentru calitatea formării"""
@@ -593,6 +631,7 @@ ZONE COVERAGE:
 • Total slices in zone: {len(sorted_zone)}
 • Formation quality: {self.y3_progression_quality:.1f}%
 • Progression status: {self.get_formation_quality_text()}
+• Rib termination: {f'Slice {self.rib_termination + 1}' if self.rib_termination is not None else 'not found'}
 
 FORMATION STAGES:"""
 
@@ -721,9 +760,15 @@ QUALITY INDICATORS:
             # Update slider
             self.slice_slider.configure(to=len(self.dicom_files) - 1)
 
+            # Cache-ul de afișare al seriei (umplut în fundal pentru filmstrip)
+            self.volume_cache = SeriesVolumeCache(self.ct_directory, self.dicom_files)
+
             # Load first slice
             self.load_current_slice()
 
+            # Miniaturile pentru filmstrip se generează în fundal
+            self.start_filmstrip()
+
             self.update_status(f"◆ LOADED {len(self.dicom_files)} DICOM files - Ready for Y3 zone analysis")
 
         except Exception as e:
@@ -736,35 +781,45 @@ QUALITY INDICATORS:
 
         try:
             filename = self.dicom_files[self.current_slice_idx]
-            filepath = os.path.join(self.ct_directory, filename)
 
-            # Load DICOM
-            dicom = pydicom.dcmread(filepath)
-            img = dicom.pixel_array.astype(np.float32)
-
-            # Update displays
-            self.update_slice_display_with_zone_info(img, filename)
-            self.update_info_display(filename, img)
+            # Update displays (imaginea în HU vine din cache-ul de volum, fereastra se aplică prin LUT)
+            img_index = self.volume_cache.get_index(self.current_slice_idx)
+            self.update_slice_display_with_zone_info(img_index, filename)
+            self.update_info_display(filename, img_index)
             self.update_slice_counter_with_zone()
+            self.update_filmstrip_position()
 
-            # Analyze current slice if detector is ready
+            # Scorurile slice-ului curent din analiza detectorului (fără o nouă decodare)
             if self.detector and hasattr(self.detector, 'slice_data'):
-                self.analyze_current_slice_for_zone(img, filename)
+                self.analyze_current_slice_for_zone(filename)
 
         except Exception as e:
             self.update_status(f"❌ ERROR loading slice: {e}")
 
-    def update_slice_display_with_zone_info(self, img, filename):
+    def setup_slice_view(self, img_shape):
+        """Creează o singură dată axele și AxesImage-ul slice-ului"""
+        self.view_ax = self.fig.add_subplot(111)
+        self.view_ax.axis('off')
+        self.view_ax.set_facecolor(self.colors['bg_primary'])
+        self.view_image = self.view_ax.imshow(np.zeros(img_shape, dtype=np.uint8), cmap='gray', vmin=0, vmax=255)
+        self.fig.patch.set_facecolor(self.colors['bg_primary'])
+
+    def update_slice_display_with_zone_info(self, img_index, filename):
         """Actualizează afișajul slice-ului cu informații despre zonă"""
-        self.fig.clear()
+        if self.view_image is None:
+            self.setup_slice_view(img_index.shape)
+        ax = self.view_ax
+        img_shape = img_index.shape
 
-        # Auto-windowing
-        p1, p99 = np.percentile(img, [1, 99])
-        img_display = np.clip(img, p1, p99)
-        img_display = ((img_display - p1) / (p99 - p1) * 255).astype(np.uint8)
+        # Slice cu altă matrice - zoom-ul anterior nu mai are sens
+        if self.view_pyramid is not None and self.view_pyramid[0].shape != img_shape:
+            self.view_limits = None
+        # Piramida e pe indicii HU - fereastra se aplică doar pe porțiunea vizibilă
+        self.view_pyramid = build_pyramid(img_index)
 
-        ax = self.fig.add_subplot(111)
-        ax.imshow(img_display, cmap='gray')
+        # Overlay-urile slice-ului anterior
+        for artist in list(ax.patches) + list(ax.lines) + list(ax.texts):
+            artist.remove()
 
         # Determină tipul slice-ului
         slice_type = self.get_slice_type_info(filename)
@@ -773,18 +828,111 @@ QUALITY INDICATORS:
 
         ax.set_title(f"{title_text} {filename}",
                      color=title_color, fontsize=11, fontweight='bold')
-        ax.axis('off')
 
         # Add zone overlay dacă este în zona Y3
         if slice_type['in_zone'] and slice_type['is_best']:
-            self.add_y3_detection_overlay(ax, img_display.shape)
+            self.add_y3_detection_overlay(ax, img_shape)
         elif slice_type['in_zone']:
-            self.add_zone_highlight_overlay(ax, img_display.shape)
+            self.add_zone_highlight_overlay(ax, img_shape)
 
-        self.fig.patch.set_facecolor(self.colors['bg_primary'])
-        ax.set_facecolor(self.colors['bg_primary'])
+        self.render_view()
+
+    def full_view_limits(self):
+        h, w = self.view_pyramid[0].shape[:2]
+        return (-0.5, w - 0.5), (h - 0.5, -0.5)
+
+    def render_view(self):
+        """
+        Afișează doar porțiunea vizibilă, din nivelul de piramidă potrivit
+        zoom-ului - la pan/zoom nu se refac fereastra și imaginea completă
+        """
+        if self.view_image is None or self.view_pyramid is None:
+            return
+
+        xlim, ylim = self.view_limits or self.full_view_limits()
+        out_pixels = max(int(self.view_ax.bbox.width), 1)
+        data, extent = pyramid_view(self.view_pyramid, xlim, ylim, out_pixels)
+
+        center, width = self.current_window()
+        self.view_image.set_data(apply_lut(data, window_lut(center, width)))
+        self.window_label.configure(text=f"C {center:.0f} / W {width:.0f}")
+        self.view_image.set_extent(extent)
+        self.view_ax.set_xlim(xlim)
+        self.view_ax.set_ylim(ylim)
+        self.canvas.draw_idle()
+
+    def zoom_view(self, factor, center=None):
+        """Zoom cu factorul dat (<1 = apropiere) în jurul centrului (implicit centrul vederii)"""
+        if self.view_pyramid is None:
+            return
 
-        self.canvas.draw()
+        (fx0, fx1), (fy0, fy1) = self.full_view_limits()
+        (x0, x1), (y0, y1) = self.view_limits or ((fx0, fx1), (fy0, fy1))
+        cx, cy = center if center is not None else ((x0 + x1) / 2, (y0 + y1) / 2)
+
+        # Între imaginea întreagă și max_zoom
+        factor = min(max(factor, (fx1 - fx0) / self.max_zoom / (x1 - x0)), (fx1 - fx0) / (x1 - x0))
+        if factor * (x1 - x0) >= fx1 - fx0:
+            self.view_limits = None
+        else:
+            self.view_limits = ((cx + (x0 - cx) * factor, cx + (x1 - cx) * factor),
+                                (cy + (y0 - cy) * factor, cy + (y1 - cy) * factor))
+        self.render_view()
+
+    def on_view_scroll(self, event):
+        """Scroll pe imagine - zoom în jurul cursorului"""
+        if event.inaxes is not self.view_ax:
+            return
+        self.zoom_view(1 / 1.25 if event.button == 'up' else 1.25, (event.xdata, event.ydata))
+
+    def current_window(self):
+        """Fereastra activă (centru, lățime) în HU"""
+        if self.view_window is not None:
+            return self.view_window
+        return self.volume_cache.get_auto_window(self.current_slice_idx)
+
+    def on_window_preset(self, choice):
+        """Preset de fereastră din meniu (AUTO = percentilele fiecărui slice)"""
+        self.view_window = None if choice == 'AUTO' else WINDOW_PRESETS[choice.lower()]
+        self.render_view()
+        self.update_status(f"◆ WINDOW: {choice}")
+
+    def on_view_press(self, event):
+        """Click stânga - începe pan-ul; click dreapta - începe ajustarea ferestrei"""
+        if event.inaxes is not self.view_ax:
+            return
+        if event.button == 1 and self.view_limits is not None:
+            self.pan_start = (event.x, event.y, self.view_limits)
+        elif event.button == 3 and self.view_pyramid is not None:
+            self.window_drag_start = (event.x, event.y, self.current_window())
+
+    def on_view_drag(self, event):
+        """Pan - punctul de sub cursor rămâne sub cursor; drag dreapta - window/level"""
+        if self.window_drag_start is not None:
+            self.drag_window(event)
+            return
+        if self.pan_start is None:
+            return
+
+        px, py, ((x0, x1), (y0, y1)) = self.pan_start
+        bbox = self.view_ax.bbox
+        dx = (event.x - px) * (x1 - x0) / bbox.width
+        dy = (event.y - py) * (y1 - y0) / bbox.height
+        self.view_limits = ((x0 - dx, x1 - dx), (y0 - dy, y1 - dy))
+        self.render_view()
+
+    def drag_window(self, event):
+        """Orizontal - lățimea ferestrei, vertical - centrul (doar LUT-ul se reconstruiește)"""
+        px, py, (center, width) = self.window_drag_start
+        sensitivity = max(width, 100) / 200  # HU per pixel de ecran
+        self.view_window = (center + (event.y - py) * sensitivity,
+                            max(width + (event.x - px) * sensitivity, 1))
+        self.window_preset_menu.set('CUSTOM')
+        self.render_view()
+
+    def on_view_release(self, event):
+        self.pan_start = None
+        self.window_drag_start = None
 
     def get_slice_type_info(self, filename):
         """Determină tipul și statusul slice-ului"""
@@ -831,13 +979,16 @@ QUALITY INDICATORS:
 
         return info
 
+    def get_roi_geometry(self, img_shape):
+        """Geometria ROI a detectorului curent - overlay-urile folosesc aceleași zone ca detecția"""
+        if self.detector:
+            return self.detector.get_geometry(img_shape)
+        return self.detector_config.geometry(img_shape)
+
     def add_y3_detection_overlay(self, ax, img_shape):
         """Adaugă overlay pentru Y3 detectat"""
-        h, w = img_shape
-        center_h_start = int(h * 0.58)
-        center_h_end = int(h * 0.80)
-        center_w_start = int(w * 0.42)
-        center_w_end = int(w * 0.58)
+        geometry = self.get_roi_geometry(img_shape)
+        center_h_start, center_h_end, center_w_start, center_w_end = geometry.center_bounds
 
         # Draw detection box
         from matplotlib.patches import Rectangle
@@ -857,12 +1008,9 @@ QUALITY INDICATORS:
 
     def add_zone_highlight_overlay(self, ax, img_shape):
         """Adaugă highlight subtil pentru zona Y3"""
-        h, w = img_shape
         # Highlight zona centrală unde se formează Y3
-        center_h_start = int(h * 0.55)
-        center_h_end = int(h * 0.85)
-        center_w_start = int(w * 0.35)
-        center_w_end = int(w * 0.65)
+        geometry = self.get_roi_geometry(img_shape)
+        center_h_start, center_h_end, center_w_start, center_w_end = geometry.zone_highlight_bounds
 
         from matplotlib.patches import Rectangle
         rect = Rectangle((center_w_start, center_h_start),
@@ -888,8 +1036,8 @@ QUALITY INDICATORS:
 
         self.zone_indicator.configure(text=zone_text)
 
-    def update_info_display(self, filename, img):
-        """Actualizează afișajul informațiilor cu detalii zone"""
+    def update_info_display(self, filename, img_index):
+        """Actualizează afișajul informațiilor cu detalii zone (statistici în HU din indicii cache-ului)"""
         zone_info = ""
         if (self.y3_zone_start is not None and
                 self.current_slice_idx >= self.y3_zone_start and
@@ -897,21 +1045,23 @@ QUALITY INDICATORS:
             zone_info = f"\nZONE: Y3 Progressive Zone"
 
         info_text = f"""FILE: {filename}
-SIZE: {img.shape[0]} x {img.shape[1]}
-RANGE: {np.min(img):.0f} - {np.max(img):.0f}
-MEAN: {np.mean(img):.1f}{zone_info}"""
+SIZE: {img_index.shape[0]} x {img_index.shape[1]}
+RANGE: {int(img_index.min()) - LUT_OFFSET} - {int(img_index.max()) - LUT_OFFSET} HU
+MEAN: {img_index.mean() - LUT_OFFSET:.1f} HU{zone_info}"""
 
         self.info_display.delete("1.0", "end")
         self.info_display.insert("1.0", info_text)
 
-    def analyze_current_slice_for_zone(self, img, filename):
-        """Analizează slice-ul curent în contextul zonei Y3"""
+    def analyze_current_slice_for_zone(self, filename):
+        """Analizează slice-ul curent în contextul zonei Y3, din scorurile deja calculate de detector"""
         if not self.detector:
             return
 
         try:
-            # Quick analysis of current slice
-            analysis = self.detector.analyze_anatomic_criteria(img, self.current_slice_idx, filename)
+            data = self.detector.slice_data.get(self.current_slice_idx)
+            if data is None or data['filename'] != filename:
+                raise ValueError("slice-ul nu a fost analizat de detector")
+            analysis = data['analysis']
 
             # Determine zone context
             zone_context = "OUTSIDE Y3 ZONE"
@@ -996,16 +1146,121 @@ STATUS: {self.get_slice_status(analysis['y3_score'], zone_context)}"""
             self.slice_var.set(self.current_slice_idx)
             self.load_current_slice()
 
+    def start_filmstrip(self):
+        """Pornește umplerea cache-ului și generarea atlasului de miniaturi în fundal"""
+        # Firul seriei anterioare se oprește la următorul slice
+        self.background_stop.set()
+        self.background_stop = Event()
+        thread = Thread(target=self.build_filmstrip, args=(self.volume_cache, self.background_stop))
+        thread.daemon = True
+        thread.start()
+
+    def build_filmstrip(self, cache, stop_event):
+        """Firul de fundal: decodează seria o singură dată în cache și construiește atlasul"""
+        try:
+            cache.load_all(stop_event)
+            atlas = build_filmstrip_atlas(cache, stop_event=stop_event)
+            if atlas is not None and not stop_event.is_set():
+                self.root.after(0, self.show_filmstrip, cache, atlas)
+        except Exception as e:
+            if not stop_event.is_set():
+                self.root.after(0, self.update_status, f"❌ FILMSTRIP ERROR: {e}")
+
+    def show_filmstrip(self, cache, atlas):
+        """Afișează atlasul ca o singură imagine; miniatura i ocupă intervalul [i, i+1] pe x"""
+        if cache is not self.volume_cache:
+            return  # Seria s-a schimbat între timp
+
+        from matplotlib.patches import Rectangle
+
+        n = len(cache)
+        ax = self.filmstrip_ax
+        ax.clear()
+        ax.axis('off')
+        self.filmstrip_atlas = atlas
+        self.filmstrip_artists = {
+            'thumbs': ax.imshow(atlas, cmap='gray', vmin=0, vmax=255, aspect='auto',
+                                extent=(0, n, 1.0, 0), interpolation='bilinear'),
+            # Banda de scor sub miniaturi (NaN = neanalizat)
+            'scores': ax.imshow(np.full((1, n), np.nan), cmap='RdYlGn', vmin=0, vmax=100,
+                                aspect='auto', extent=(0, n, 1.2, 1.0), interpolation='nearest'),
+            'zone': ax.add_patch(Rectangle((0, 0), 0, 1.2, facecolor=self.colors['accent_green'],
+                                           alpha=0.25, visible=False)),
+            'current': ax.add_patch(Rectangle((0, 0), 1, 1.2, fill=False, linewidth=2,
+                                              edgecolor=self.colors['accent_cyan']))
+        }
+        ax.set_ylim(1.2, 0)
+
+        self.update_filmstrip_scores()
+        self.update_filmstrip_position()
+
+    def update_filmstrip_position(self):
+        """Marchează slice-ul curent și centrează banda pe el"""
+        if not self.filmstrip_artists:
+            return
+
+        n = len(self.dicom_files)
+        self.filmstrip_artists['current'].set_x(self.current_slice_idx)
+        half = self.filmstrip_visible / 2
+        start = min(max(self.current_slice_idx + 0.5 - half, 0), max(n - self.filmstrip_visible, 0))
+        self.filmstrip_ax.set_xlim(start, start + self.filmstrip_visible)
+        self.filmstrip_canvas.draw_idle()
+
+    def update_filmstrip_scores(self):
+        """Colorează banda de scor după y3_score și marchează zona Y3"""
+        if not self.filmstrip_artists or self.detector is None:
+            return
+
+        scores = np.full(len(self.dicom_files), np.nan)
+        detector_scores = self.detector.get_scores()[:len(scores)]
+        scores[:len(detector_scores)] = detector_scores
+        self.filmstrip_artists['scores'].set_data(scores[np.newaxis, :])
+
+        if self.y3_zone_start is not None:
+            zone = self.filmstrip_artists['zone']
+            zone.set_x(self.y3_zone_start)
+            zone.set_width(self.y3_zone_end - self.y3_zone_start + 1)
+            zone.set_visible(True)
+        self.filmstrip_canvas.draw_idle()
+
+    def on_filmstrip_click(self, event):
+        """Click pe o miniatură - salt la slice-ul respectiv"""
+        if event.inaxes is not self.filmstrip_ax or event.xdata is None or not self.filmstrip_artists:
+            return
+
+        slice_idx = min(max(int(event.xdata), 0), len(self.dicom_files) - 1)
+        self.current_slice_idx = slice_idx
+        self.slice_var.set(slice_idx)
+        self.load_current_slice()
+        self.update_status(f"◆ FILMSTRIP: Slice {slice_idx + 1}")
+
+    def on_filmstrip_scroll(self, event):
+        """Scroll pe filmstrip - derulează banda fără a schimba slice-ul"""
+        if not self.filmstrip_artists:
+            return
+
+        n = len(self.dicom_files)
+        step = -self.filmstrip_visible / 4 if event.button == 'up' else self.filmstrip_visible / 4
+        start = self.filmstrip_ax.get_xlim()[0] + step
+        start = min(max(start, 0), max(n - self.filmstrip_visible, 0))
+        self.filmstrip_ax.set_xlim(start, start + self.filmstrip_visible)
+        self.filmstrip_canvas.draw_idle()
+
     def zoom_in(self):
-        """Zoom in placeholder"""
+        """Zoom in"""
+        self.zoom_view(1 / 1.5)
         self.update_status("◆ ZOOM IN")
 
     def zoom_out(self):
-        """Zoom out placeholder"""
+        """Zoom out"""
+        self.zoom_view(1.5)
         self.update_status("◆ ZOOM OUT")
 
     def reset_view(self):
         """Reset view"""
+        self.view_limits = None
+        self.view_window = None
+        self.window_preset_menu.set('AUTO')
         self.load_current_slice()
         self.update_status("◆ VIEW RESET")
 
@@ -1036,37 +1291,71 @@ CLINICAL RECOMMENDATIONS:
 Generated by Y3 Progressive Analyzer
 """)
 
-            messagebox.showinfo("Success", f"Zone analysis saved: {filename}")
+            # Rezultatul structurat (scoruri per slice, zona, timpi) pentru analize ulterioare
+            json_filename = f"Y3_zone_analysis_{timestamp}.json"
+            zone_candidates = sorted(self.y3_zone_slices, key=lambda c: c[2], reverse=True)
+            result = build_study_result(self.detector, zone_candidates,
+                                        zone_bounds=(self.y3_zone_start, self.y3_zone_end))
+            write_study_json(result, json_filename)
+
+            messagebox.showinfo("Success", f"Zone analysis saved: {filename}\n{json_filename}")
             self.update_status(f"◆ ZONE ANALYSIS SAVED: {filename}")
 
         except Exception as e:
             messagebox.showerror("Error", f"Save failed: {e}")
 
     def export_y3_image(self):
-        """Exportă imaginea Y3 cu overlay"""
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"Y3_zone_slice_{timestamp}.png"
+        """Exportă pachetul de revizuire (cel mai bun slice, limitele zonei, top K) în fundal"""
+        if not self.y3_detected:
+            messagebox.showwarning("Warning", "No Y3 zone detected yet!")
+            return
 
-            self.fig.savefig(filename, dpi=300, bbox_inches='tight',
-                             facecolor=self.colors['bg_primary'], edgecolor='none')
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_dir = f"Y3_review_{timestamp}"
 
-            messagebox.showinfo("Success", f"Y3 image exported: {filename}")
-            self.update_status(f"◆ Y3 IMAGE EXPORTED: {filename}")
+        # Paginile folosesc fereastra aleasă în vizualizare (None = automată)
+        thread = Thread(target=self.run_review_export, args=(output_dir, self.view_window))
+        thread.daemon = True
+        thread.start()
+        self.update_status(f"◆ EXPORTING REVIEW PACKAGE: {output_dir}")
 
+    def run_review_export(self, output_dir, window):
+        """Compunerea paginilor cu OpenCV, în afara firului Tk"""
+        try:
+            start = time.perf_counter()
+            written = export_review_package(
+                self.detector, self.y3_candidates, output_dir,
+                zone_bounds=(self.y3_zone_start, self.y3_zone_end),
+                get_display=lambda slice_idx: self.volume_cache.get(slice_idx, window)
+            )
+            self.root.after(0, self.review_export_complete, output_dir, len(written),
+                            time.perf_counter() - start)
         except Exception as e:
-            messagebox.showerror("Error", f"Export failed: {e}")
+            self.root.after(0, messagebox.showerror, "Error", f"Export failed: {e}")
+
+    def review_export_complete(self, output_dir, num_pages, elapsed):
+        self.update_status(f"◆ REVIEW PACKAGE EXPORTED: {output_dir} ({num_pages} pages, {elapsed:.2f}s)")
+        messagebox.showinfo("Success", f"Review package exported: {output_dir}\n{num_pages} pages")
 
     def update_status(self, message):
         """Actualizează status-ul"""
         self.status_label.configure(text=message)
         self.root.update_idletasks()
 
+    def on_close(self):
+        """Oprește lucrul din fundal și închide fereastra"""
+        self.background_stop.set()
+        self.root.destroy()
+
     def run(self):
         """Pornește aplicația"""
         self.root.mainloop()
 
 
 if __name__ == "__main__":
-    app = OptimizedY3GUI()
+    import sys
+
+    # --params=PROFIL încarcă un profil de parametri JSON/YAML (ex. best_profile.json din tuning)
+    config_path = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--params=')), None)
+    app = OptimizedY3GUI(config_path)
     app.run()
\ No newline at end of file
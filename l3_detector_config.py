@@ -0,0 +1,189 @@
+# l3_detector_config.py - Configurația detectorului Y3 (praguri, ROI-uri, ponderi, kernel-uri)
+import os
+import json
+import cv2
+
+# Parametrii detectorului. Pragurile de intensitate se aplică pe imaginea fereastră uint8.
+# Intervalele [min, max, puncte] se verifică în ordine; primul potrivit dă punctele.
+DEFAULT_DETECTOR_PARAMS = {
+    'center_roi': [0.58, 0.80, 0.42, 0.58],  # h_start, h_end, w_start, w_end (fracții)
+    'zone_highlight_roi': [0.55, 0.85, 0.35, 0.65],  # Zona de formare Y3 evidențiată în GUI
+    'lateral_divisor': 6,  # Zonele laterale = w/6 din fiecare parte (din lățimea corpului în modul 'body')
+    'roi_mode': 'body',  # 'body' - ROI-uri poziționate după corp și coloană, 'fixed' - fracții din imagine
+    'body_sample_slices': 9,  # Slice-uri rare din serie pentru MIP-ul de localizare
+    'body_mip_size': 128,  # Latura maximă a MIP-ului redus
+    'body_hu_threshold': -500,  # Țesut (corp) vs aer
+    'bone_hu_threshold': 200,
+    'body_reference_width': 0.85,  # Lățimea tipică a corpului în FOV, la care ROI-ul central are mărimea fixă
+    'kernel_size': 3,  # Kernel eliptic pentru morfologie
+    'y_threshold': 140,  # Structuri dense în zona centrală
+    'rib_threshold': 220,  # Coastele sunt FOARTE dense/albe
+    'dense_threshold': 120,  # Pixeli denși pentru calitatea vertebrei
+    'min_y_area': 50,
+    'y_circularity_tiers': [[0.3, 0.7, 40], [0.2, 0.8, 20]],  # inclusiv
+    'y_aspect_tiers': [[1.0, 1.6, 30], [0.8, 1.8, 15]],  # inclusiv
+    'y_area_tiers': [[200, 1500, 30], [100, 2000, 15]],  # exclusiv
+    'rib_area': [300, 3000],  # exclusiv
+    'rib_aspect': [2.0, 10.0],  # exclusiv
+    'rib_min_intensity': 200,
+    'rib_count_scores': [[0, 100], [2, 70], [4, 40], [6, 20]],  # <= număr coaste -> scor, altfel 0
+    'weights': {'no_ribs': 0.5, 'y_shape': 0.3, 'position': 0.1, 'quality': 0.1},
+    'sequence_window': 5,  # Slice-uri în media mobilă de-a lungul lui z (impar)
+    'rib_free_fraction': 0.5,  # Fracția maximă de slice-uri cu coaste în fereastra netezită pentru "fără coaste"
+    'zone_tolerance': 3.0,  # Zona Y3 = slice-urile cu scorul netezit la cel mult atât sub vârf
+    'vertebra_pitch_mm': 35.0,  # Vertebră + disc în zona T12-L5 (tipic 30-40 mm), pentru etichetarea nivelurilor
+    'disc_min_prominence': 15.0  # Scăderea minimă a densității medii centrale (HU) la un disc față de corpurile vecine
+}
+
+
+def merge_detector_params(params=None):
+    """Parametrii impliciți suprascriși de cei dați (inclusiv ponderile parțiale)"""
+    merged = {key: (dict(value) if isinstance(value, dict) else value)
+              for key, value in DEFAULT_DETECTOR_PARAMS.items()}
+    for key, value in (params or {}).items():
+        if key not in merged:
+            raise KeyError(f"Parametru necunoscut: {key}")
+        if isinstance(merged[key], dict):
+            merged[key].update(value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _require_yaml():
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError("Profilele YAML necesita PyYAML (pip install pyyaml)")
+    return yaml
+
+
+def is_yaml_path(path):
+    return os.path.splitext(path)[1].lower() in ('.yaml', '.yml')
+
+
+def load_detector_params(path):
+    """Încarcă un profil de parametri salvat ca JSON sau YAML"""
+    with open(path, 'r', encoding='utf-8') as f:
+        params = _require_yaml().safe_load(f) if is_yaml_path(path) else json.load(f)
+    return merge_detector_params(params)
+
+
+def save_detector_params(params, path):
+    """Salvează un profil de parametri ca JSON sau YAML (după extensie)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if is_yaml_path(path):
+            _require_yaml().safe_dump(params, f, sort_keys=False)
+        else:
+            json.dump(params, f, indent=2)
+
+
+def fraction_bounds(shape, roi):
+    """Coordonatele (h_start, h_end, w_start, w_end) ale unui ROI dat în fracții"""
+    h, w = shape[:2]
+    return int(h * roi[0]), int(h * roi[1]), int(w * roi[2]), int(w * roi[3])
+
+
+def body_center_bounds(shape, params, body):
+    """
+    Zona vertebrei centrată pe coloană, cu mărimea zonei fixe scalată
+    după lățimea corpului (pacient mic / FOV mare -> ROI mai mic)
+    """
+    h, w = shape[:2]
+    _, _, x0, x1, cy, cx = body
+    roi = params['center_roi']
+    scale = min(max((x1 - x0) / w / params['body_reference_width'], 0.5), 1.5)
+    half_h = (roi[1] - roi[0]) * h * scale / 2
+    half_w = (roi[3] - roi[2]) * w * scale / 2
+    return (max(int(cy - half_h), 0), min(int(cy + half_h), h),
+            max(int(cx - half_w), 0), min(int(cx + half_w), w))
+
+
+class ROIGeometry:
+    """
+    Zonele detectorului pentru o dimensiune de imagine, calculate o singură dată.
+    body = (y0, y1, x0, x1, spine_y, spine_x) poziționează zonele după corpul pacientului;
+    fără body se folosesc fracțiile fixe din imagine.
+    """
+
+    def __init__(self, shape, params, body=None):
+        h, w = shape[:2]
+        self.shape = (h, w)
+        self.body = body
+        divisor = params['lateral_divisor']
+
+        if body is None:
+            self.center_bounds = fraction_bounds(shape, params['center_roi'])
+            # Zonele laterale ÎNGUSTE pentru detectarea coastelor - fără suprapunere
+            self.left_bounds = (0, h, 0, w // divisor)
+            self.right_bounds = (0, h, (divisor - 1) * w // divisor, w)
+        else:
+            y0, y1, x0, x1, _, _ = body
+            self.center_bounds = body_center_bounds(shape, params, body)
+            # Zonele laterale la marginile corpului, doar pe înălțimea lui
+            strip = (x1 - x0) // divisor
+            self.left_bounds = (y0, y1, x0, x0 + strip)
+            self.right_bounds = (y0, y1, x1 - strip, x1)
+
+        self.center = self.to_slices(self.center_bounds)
+        self.left = self.to_slices(self.left_bounds)
+        self.right = self.to_slices(self.right_bounds)
+        self.zone_highlight_bounds = fraction_bounds(shape, params['zone_highlight_roi'])
+
+    @staticmethod
+    def to_slices(bounds):
+        h0, h1, w0, w1 = bounds
+        return slice(h0, h1), slice(w0, w1)
+
+
+class DetectorConfig:
+    """
+    Configurația completă a detectorului: parametrii, kernel-urile de morfologie
+    construite o dată și geometria ROI precompilată pentru fiecare dimensiune de imagine.
+    Aceeași instanță e folosită de detector, rapoarte și overlay-urile din GUI.
+    """
+
+    def __init__(self, params=None):
+        self.params = merge_detector_params(params)
+        size = self.params['kernel_size']
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+        self._geometry = {}
+
+    @classmethod
+    def load(cls, path):
+        """Configurația dintr-un profil JSON/YAML"""
+        return cls(load_detector_params(path))
+
+    def save(self, path):
+        save_detector_params(self.params, path)
+
+    def geometry(self, shape, body=None):
+        """Geometria ROI pentru dimensiunea (și corpul) dat (din cache după primul apel)"""
+        key = (tuple(shape[:2]), body)
+        geometry = self._geometry.get(key)
+        if geometry is None:
+            geometry = self._geometry[key] = ROIGeometry(shape, self.params, body)
+        return geometry
+
+    def __getitem__(self, key):
+        return self.params[key]
+
+
+_default_config = None
+
+
+def get_default_config():
+    """Configurația implicită, creată o dată per proces"""
+    global _default_config
+    if _default_config is None:
+        _default_config = DetectorConfig()
+    return _default_config
+
+
+def as_detector_config(config):
+    """Acceptă o DetectorConfig, un dicționar de parametri sau None (implicit)"""
+    if config is None:
+        return get_default_config()
+    if isinstance(config, DetectorConfig):
+        return config
+    return DetectorConfig(config)
@@ -0,0 +1,304 @@
+# l3_dicom_output.py - Rezultatul L3 ca DICOM: Secondary Capture cu overlay și SEG pentru vertebra L3
+import os
+from datetime import datetime
+import numpy as np
+import cv2
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, PYDICOM_IMPLEMENTATION_UID, generate_uid
+
+from l3_report_renderer import window_for_display, draw_roi
+
+SECONDARY_CAPTURE_SOP_CLASS = '1.2.840.10008.5.1.4.1.1.7'
+SEGMENTATION_SOP_CLASS = '1.2.840.10008.5.1.4.1.1.66.4'
+CT_IMAGE_SOP_CLASS = '1.2.840.10008.5.1.4.1.1.2'
+
+SC_SERIES_NUMBER = 9901
+SEG_SERIES_NUMBER = 9902
+
+MANUFACTURER = 'L3 Vertebra Analysis'
+SOFTWARE_VERSION = '1'
+
+# Tag-urile de pacient și studiu copiate din headerul seriei sursă
+PATIENT_STUDY_TAGS = ('PatientName', 'PatientID', 'PatientBirthDate', 'PatientSex', 'StudyInstanceUID',
+                      'StudyDate', 'StudyTime', 'StudyID', 'AccessionNumber', 'ReferringPhysicianName',
+                      'StudyDescription')
+
+
+def code_item(value, scheme, meaning):
+    item = Dataset()
+    item.CodeValue = value
+    item.CodingSchemeDesignator = scheme
+    item.CodeMeaning = meaning
+    return item
+
+
+def source_header(detector):
+    """Headerul seriei citit deja de detector (fără a reciti fișierele sursă)"""
+    if detector.series_header is None:
+        raise ValueError("Detectorul nu are headerul seriei - analizati mai intai slice-urile")
+    return detector.series_header
+
+
+def base_dataset(header, sop_class_uid, modality, series_number, series_description):
+    """Dataset nou în studiul sursă: pacient, studiu, serie nouă, SOP common și file meta"""
+    now = datetime.now()
+    ds = Dataset()
+    for tag in PATIENT_STUDY_TAGS:
+        setattr(ds, tag, header.get(tag, ''))
+    if not ds.StudyInstanceUID:
+        ds.StudyInstanceUID = generate_uid()
+
+    ds.SOPClassUID = sop_class_uid
+    ds.SOPInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = modality
+    ds.SeriesNumber = series_number
+    ds.SeriesDescription = series_description
+    ds.InstanceNumber = 1
+    ds.ContentDate = now.strftime('%Y%m%d')
+    ds.ContentTime = now.strftime('%H%M%S')
+    ds.Manufacturer = MANUFACTURER
+    ds.SoftwareVersions = SOFTWARE_VERSION
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.ImplementationClassUID = PYDICOM_IMPLEMENTATION_UID
+    ds.file_meta = meta
+    return ds
+
+
+def source_reference(header, slice_data):
+    """Referința la slice-ul CT sursă (SOP class + instance)"""
+    item = Dataset()
+    item.ReferencedSOPClassUID = header.get('SOPClassUID', CT_IMAGE_SOP_CLASS)
+    item.ReferencedSOPInstanceUID = slice_data['sop_uid']
+    return item
+
+
+def slice_hu(detector, slice_idx):
+    """Imaginea în HU a unui slice din top K (păstrată de detector)"""
+    image = detector.slice_data[slice_idx].get('image')
+    if image is None:
+        raise ValueError(f"Slice-ul {slice_idx} nu mai este in memorie (doar top K isi pastreaza imaginea)")
+    header = source_header(detector)
+    return image * float(header.get('RescaleSlope', 1)) + float(header.get('RescaleIntercept', 0))
+
+
+def vertebra_mask(detector, slice_idx):
+    """
+    Masca vertebrei L3: pixelii de os (bone_hu_threshold) din ROI-ul vertebral,
+    cea mai mare componentă conexă, închisă morfologic.
+    """
+    hu = slice_hu(detector, slice_idx)
+    geometry = detector.get_geometry(hu.shape)
+    mask = np.zeros(hu.shape, dtype=np.uint8)
+    center = geometry.center
+    mask[center] = hu[center] >= detector.params['bone_hu_threshold']
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, detector.config.kernel)
+
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        return mask
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    return (labels == largest).astype(np.uint8)
+
+
+def compose_capture_image(detector, slice_idx, mask=None):
+    """Slice-ul ales cu ROI-urile detectorului, conturul vertebrei și scorul (RGB)"""
+    data = detector.slice_data[slice_idx]
+    img_display = window_for_display(data['image'])
+    geometry = detector.get_geometry(img_display.shape)
+
+    overlay = cv2.cvtColor(img_display, cv2.COLOR_GRAY2RGB)
+    draw_roi(overlay, geometry.left_bounds, (128, 128, 128), 2)
+    draw_roi(overlay, geometry.right_bounds, (128, 128, 128), 2)
+    draw_roi(overlay, geometry.center_bounds, (0, 255, 0), 2)
+    if mask is not None and mask.any():
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(overlay, contours, -1, (255, 200, 0), 1)
+
+    analysis = data['analysis']
+    cv2.putText(overlay, f"L3 - Score Y3 {analysis['y3_score']:.1f} - Coaste {analysis['ribs_detected']:.0f}",
+                (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2, cv2.LINE_AA)
+    return overlay
+
+
+def build_secondary_capture(detector, slice_idx, mask=None):
+    """Secondary Capture RGB cu slice-ul L3 și overlay-urile, în studiul sursă"""
+    header = source_header(detector)
+    data = detector.slice_data[slice_idx]
+    rgb = compose_capture_image(detector, slice_idx, mask)
+
+    ds = base_dataset(header, SECONDARY_CAPTURE_SOP_CLASS, 'OT', SC_SERIES_NUMBER, 'L3 Y3 detection')
+    ds.ConversionType = 'WSD'
+    ds.ImageType = ['DERIVED', 'SECONDARY']
+    ds.PatientOrientation = ''
+    ds.DerivationDescription = f"Slice L3 ales automat: {data['filename']}"
+    ds.SourceImageSequence = Sequence([source_reference(header, data)])
+
+    ds.Rows, ds.Columns = rgb.shape[:2]
+    ds.SamplesPerPixel = 3
+    ds.PhotometricInterpretation = 'RGB'
+    ds.PlanarConfiguration = 0
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    ds.PixelData = np.ascontiguousarray(rgb).tobytes()
+    return ds
+
+
+def build_segmentation(detector, slice_idx, mask, label='L3 vertebra'):
+    """DICOM SEG binar cu un singur segment și un singur frame, aliniat pe slice-ul sursă"""
+    header = source_header(detector)
+    data = detector.slice_data[slice_idx]
+
+    ds = base_dataset(header, SEGMENTATION_SOP_CLASS, 'SEG', SEG_SERIES_NUMBER, 'L3 segmentation')
+    ds.ImageType = ['DERIVED', 'PRIMARY']
+    ds.ContentLabel = 'L3'
+    ds.ContentDescription = label
+    ds.ContentCreatorName = ''
+    ds.ManufacturerModelName = MANUFACTURER
+    ds.DeviceSerialNumber = '0'
+    ds.FrameOfReferenceUID = header.get('FrameOfReferenceUID') or generate_uid()
+    ds.PositionReferenceIndicator = ''
+
+    segment = Dataset()
+    segment.SegmentNumber = 1
+    segment.SegmentLabel = label
+    segment.SegmentAlgorithmType = 'AUTOMATIC'
+    segment.SegmentAlgorithmName = 'L3 anatomic detector'
+    segment.SegmentedPropertyCategoryCodeSequence = Sequence([code_item('91723000', 'SCT', 'Anatomical Structure')])
+    # Cod local (schemă privată 99...) pentru ROI-ul vertebral derivat din praguri
+    segment.SegmentedPropertyTypeCodeSequence = Sequence([code_item('L3V', '99L3', label)])
+    ds.SegmentSequence = Sequence([segment])
+
+    # Geometria comună și cea a singurului frame
+    shared = Dataset()
+    orientation = Dataset()
+    orientation.ImageOrientationPatient = header.get('ImageOrientationPatient', [1, 0, 0, 0, 1, 0])
+    measures = Dataset()
+    measures.PixelSpacing = header.get('PixelSpacing', [1, 1])
+    measures.SliceThickness = header.get('SliceThickness', 1)
+    shared.PlaneOrientationSequence = Sequence([orientation])
+    shared.PixelMeasuresSequence = Sequence([measures])
+    ds.SharedFunctionalGroupsSequence = Sequence([shared])
+
+    source = source_reference(header, data)
+    source.PurposeOfReferenceCodeSequence = Sequence([
+        code_item('121322', 'DCM', 'Source image for image processing operation')])
+    derivation = Dataset()
+    derivation.SourceImageSequence = Sequence([source])
+    derivation.DerivationCodeSequence = Sequence([code_item('113076', 'DCM', 'Segmentation')])
+    frame_content = Dataset()
+    frame_content.DimensionIndexValues = [1, 1]
+    position = Dataset()
+    position.ImagePositionPatient = data.get('position') or [0, 0, data.get('z') or 0]
+    segment_id = Dataset()
+    segment_id.ReferencedSegmentNumber = 1
+
+    frame = Dataset()
+    frame.DerivationImageSequence = Sequence([derivation])
+    frame.FrameContentSequence = Sequence([frame_content])
+    frame.PlanePositionSequence = Sequence([position])
+    frame.SegmentIdentificationSequence = Sequence([segment_id])
+    ds.PerFrameFunctionalGroupsSequence = Sequence([frame])
+
+    organization = Dataset()
+    organization.DimensionOrganizationUID = generate_uid()
+    ds.DimensionOrganizationSequence = Sequence([organization])
+    dimensions = []
+    for index_pointer, group_pointer in ((0x0062000B, 0x0062000A), (0x00200032, 0x00209113)):
+        dimension = Dataset()
+        dimension.DimensionOrganizationUID = organization.DimensionOrganizationUID
+        dimension.DimensionIndexPointer = index_pointer
+        dimension.FunctionalGroupPointer = group_pointer
+        dimensions.append(dimension)
+    ds.DimensionIndexSequence = Sequence(dimensions)
+
+    referenced_instance = source_reference(header, data)
+    referenced_series = Dataset()
+    referenced_series.SeriesInstanceUID = detector.series_uid or header.get('SeriesInstanceUID', '')
+    referenced_series.ReferencedInstanceSequence = Sequence([referenced_instance])
+    ds.ReferencedSeriesSequence = Sequence([referenced_series])
+
+    # Masca binară: 1 bit per pixel, împachetată little-endian
+    ds.SegmentationType = 'BINARY'
+    ds.NumberOfFrames = 1
+    ds.Rows, ds.Columns = mask.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 1
+    ds.BitsStored = 1
+    ds.HighBit = 0
+    ds.PixelRepresentation = 0
+    ds.LossyImageCompression = '00'
+    packed = np.packbits(mask.astype(bool).ravel(), bitorder='little').tobytes()
+    ds.PixelData = packed + b'\x00' * (len(packed) % 2)
+    return ds
+
+
+def write_dicom_result(detector, candidates, output_dir, segmentation=True):
+    """
+    Scrie rezultatul L3 al unui detector: Secondary Capture pentru slice-ul ales
+    și, opțional, SEG cu vertebra. Întoarce căile fișierelor scrise.
+    """
+    if not candidates:
+        return []
+    slice_idx = candidates[0][0]
+    mask = vertebra_mask(detector, slice_idx)
+    os.makedirs(output_dir, exist_ok=True)
+
+    outputs = [('SC', build_secondary_capture(detector, slice_idx, mask))]
+    if segmentation:
+        outputs.append(('SEG', build_segmentation(detector, slice_idx, mask)))
+
+    written = []
+    for prefix, ds in outputs:
+        path = os.path.join(output_dir, f"{prefix}_{ds.SOPInstanceUID}.dcm")
+        ds.save_as(path, enforce_file_format=True)
+        written.append(path)
+    return written
+
+
+def write_dicom_results(results, output_dir, segmentation=True):
+    """Scriere în lot: results = (detector, candidați) per studiu, fiecare în subdirectorul seriei"""
+    written = []
+    for detector, candidates in results:
+        key = detector.series_uid or os.path.basename(os.path.normpath(detector.data_directory))
+        written.extend(write_dicom_result(detector, candidates, os.path.join(output_dir, key), segmentation))
+    return written
+
+
+def verify_dicom_output(path):
+    """Verificare offline cu pydicom: citește fișierul și decodează pixelii"""
+    from pydicom import dcmread
+
+    ds = dcmread(path)
+    pixels = ds.pixel_array
+    return {
+        'path': path,
+        'sop_class': str(ds.SOPClassUID),
+        'modality': str(ds.Modality),
+        'study_uid': str(ds.StudyInstanceUID),
+        'shape': tuple(pixels.shape),
+        'nonzero': int(np.count_nonzero(pixels))
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    from l3_y3_detector_anatomic import AnatomicL3Detector
+
+    data_directory = sys.argv[1] if len(sys.argv) > 1 else "data/images/"
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else "dicom_output/"
+
+    detector = AnatomicL3Detector(data_directory)
+    detector.load_and_analyze_all_slices()
+    candidates = detector.find_best_y3_candidates()
+    for path in write_dicom_result(detector, candidates, output_dir):
+        info = verify_dicom_output(path)
+        print(f"✓ {info['modality']} {info['shape']} -> {path}")
@@ -0,0 +1,146 @@
+# l3_dicom_reader.py - Citirea robustă a slice-urilor DICOM: erori pe categorii, recitire și decodor alternativ
+from collections import Counter
+import numpy as np
+import pydicom
+import cv2
+from pydicom.errors import InvalidDicomError
+from pydicom.uid import (ImplicitVRLittleEndian, ExplicitVRLittleEndian, ExplicitVRBigEndian,
+                         JPEGBaseline8Bit, JPEG2000Lossless, JPEG2000)
+
+# Categoriile erorilor per slice și per studiu
+READ_ERROR = 'read_error'  # Fișier lipsă sau ilizibil
+CORRUPT_FILE = 'corrupt_file'  # Nu e DICOM sau header-ul e stricat
+NO_PIXEL_DATA = 'no_pixel_data'
+UNSUPPORTED_TRANSFER_SYNTAX = 'unsupported_transfer_syntax'  # Niciun decodor instalat pentru compresie
+DECODE_ERROR = 'decode_error'  # Pixeli corupți / trunchiați
+SHAPE_MISMATCH = 'shape_mismatch'
+ANALYSIS_ERROR = 'analysis_error'
+TIMEOUT = 'timeout'  # Studiul a depășit bugetul de timp
+
+ERROR_CATEGORIES = (READ_ERROR, CORRUPT_FILE, NO_PIXEL_DATA, UNSUPPORTED_TRANSFER_SYNTAX,
+                    DECODE_ERROR, SHAPE_MISMATCH, ANALYSIS_ERROR, TIMEOUT)
+
+# Sintaxele pe care OpenCV le poate decoda direct din fragmentul încapsulat
+OPENCV_TRANSFER_SYNTAXES = (JPEGBaseline8Bit, JPEG2000Lossless, JPEG2000)
+
+
+class SliceReadError(Exception):
+    """Un slice care nu a putut fi citit, cu categoria erorii"""
+
+    def __init__(self, category, message):
+        super().__init__(message)
+        self.category = category
+
+
+class StudyError(RuntimeError):
+    """Un studiu fără niciun rezultat, cu categoria dominantă și sumarul erorilor"""
+
+    def __init__(self, category, message, summary=None):
+        super().__init__(message)
+        self.category = category
+        self.summary = summary
+
+
+class StudyTimeoutError(StudyError):
+    """Studiul a depășit bugetul de timp și a fost oprit"""
+
+    def __init__(self, message, summary=None):
+        super().__init__(TIMEOUT, message, summary)
+
+
+def error_record(slice_idx, filename, category, message, recovered=False):
+    """Înregistrarea unei erori; recovered=True dacă slice-ul a fost totuși citit"""
+    return {'slice_index': slice_idx, 'filename': filename, 'category': category,
+            'message': str(message), 'recovered': recovered}
+
+
+def summarize_errors(errors, status=None):
+    """Sumarul erorilor unui studiu: numărul per categorie (fără cele recuperate)"""
+    failed = [e for e in errors if not e['recovered']]
+    by_category = Counter(e['category'] for e in failed)
+    return {
+        'status': status,
+        'num_errors': len(failed),
+        'num_recovered': len(errors) - len(failed),
+        'by_category': dict(by_category.most_common()),
+        'dominant_category': by_category.most_common(1)[0][0] if by_category else None
+    }
+
+
+def classify_decode_error(error):
+    """Lipsa unui decodor pentru compresie vs. pixeli corupți"""
+    message = str(error).lower()
+    if isinstance(error, NotImplementedError) or 'missing dependencies' in message or 'not supported' in message:
+        return UNSUPPORTED_TRANSFER_SYNTAX
+    return DECODE_ERROR
+
+
+def read_dataset(path, stop_before_pixels=False):
+    """
+    Citește header-ul (și pixelii); un fișier fără preambul / meta este recitit cu force=True.
+    Întoarce (dataset, listă de recuperări).
+    """
+    try:
+        return pydicom.dcmread(path, stop_before_pixels=stop_before_pixels), []
+    except InvalidDicomError as e:
+        first_error = e
+    except OSError as e:
+        raise SliceReadError(READ_ERROR, e)
+    except Exception as e:
+        raise SliceReadError(CORRUPT_FILE, e)
+
+    try:
+        dicom = pydicom.dcmread(path, stop_before_pixels=stop_before_pixels, force=True)
+    except Exception as e:
+        raise SliceReadError(CORRUPT_FILE, e)
+    if 'SOPClassUID' not in dicom and 'Rows' not in dicom:
+        raise SliceReadError(CORRUPT_FILE, first_error)
+
+    # Fără meta, sintaxa de transfer se deduce din codarea cu care a fost citit setul
+    if 'TransferSyntaxUID' not in dicom.file_meta:
+        implicit_vr, little_endian = dicom.original_encoding
+        dicom.file_meta.TransferSyntaxUID = (ImplicitVRLittleEndian if implicit_vr else
+                                             ExplicitVRLittleEndian if little_endian else ExplicitVRBigEndian)
+    return dicom, [(CORRUPT_FILE, f"recitit cu force=True: {first_error}")]
+
+
+def decode_with_opencv(dicom):
+    """Decodorul alternativ: fragmentul JPEG / JPEG 2000 al unui slice monocrom, decodat cu OpenCV"""
+    from pydicom.encaps import generate_frames
+
+    if int(dicom.get('SamplesPerPixel', 1)) != 1:
+        raise ValueError("doar imagini monocrome")
+    frame = next(generate_frames(dicom.PixelData, number_of_frames=int(dicom.get('NumberOfFrames', 1) or 1)))
+    pixels = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if pixels is None or pixels.shape != (int(dicom.Rows), int(dicom.Columns)):
+        raise ValueError("fragmentul nu a putut fi decodat")
+    return pixels
+
+
+def decode_pixels(dicom):
+    """
+    Pixelii slice-ului. pydicom încearcă deja toate plugin-urile instalate;
+    dacă toate eșuează pe un JPEG / JPEG 2000, se încearcă OpenCV.
+    Întoarce (pixeli, listă de recuperări).
+    """
+    if 'PixelData' not in dicom:
+        raise SliceReadError(NO_PIXEL_DATA, "fisierul nu contine PixelData")
+    try:
+        return dicom.pixel_array, []
+    except Exception as e:
+        first_error = e
+
+    category = classify_decode_error(first_error)
+    if dicom.file_meta.get('TransferSyntaxUID') in OPENCV_TRANSFER_SYNTAXES:
+        try:
+            return decode_with_opencv(dicom), [(category, f"decodat cu OpenCV: {first_error}")]
+        except Exception:
+            pass
+    raise SliceReadError(category, first_error)
+
+
+def read_dicom_slice(path):
+    """Citește un slice cu toate recuperările posibile; întoarce (dataset, pixeli, recuperări)"""
+    dicom, recoveries = read_dataset(path)
+    pixels, decode_recoveries = decode_pixels(dicom)
+    return dicom, pixels, recoveries + decode_recoveries
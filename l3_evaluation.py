@@ -0,0 +1,250 @@
+# l3_evaluation.py - Harness de regresie acuratețe/viteză pe studii cu L3 etichetat
+import io
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import contextlib
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from l3_y3_detector_anatomic import AnatomicL3Detector
+from l3_detector_config import load_detector_params
+from l3_study_selector import select_best_series, ordered_series_files
+from l3_dicom_reader import StudyError, StudyTimeoutError
+
+# Toleranțe implicite la comparația cu un baseline
+MAX_HIT_RATE_DROP = 0.02  # 2 puncte procentuale
+MAX_MEDIAN_ERROR_INCREASE = 0.5  # slice-uri
+
+
+def load_ground_truth(csv_path):
+    """
+    Citește CSV-ul de ground truth. Coloane:
+      study    - directorul studiului (relativ la CSV sau absolut)
+      l3_slice - fișierul L3 sau indexul slice-ului (0-based), opțional
+      l3_z     - poziția z a L3 în mm, opțional
+    Cel puțin una dintre l3_slice / l3_z trebuie completată.
+    """
+    base = os.path.dirname(os.path.abspath(csv_path))
+    rows = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            study = row['study'].strip()
+            rows.append({
+                'study': study if os.path.isabs(study) else os.path.join(base, study),
+                'l3_slice': (row.get('l3_slice') or '').strip() or None,
+                'l3_z': float(row['l3_z']) if (row.get('l3_z') or '').strip() else None
+            })
+    return rows
+
+
+def resolve_ground_truth(row, filenames, z_values, indices=None):
+    """
+    Indexul și poziția z a slice-ului L3 de referință: după numele fișierului,
+    după index sau după cel mai apropiat z. Întoarce (None, z) dacă nu poate fi localizat.
+    """
+    indices = list(range(len(filenames))) if indices is None else list(indices)
+    z_values = np.asarray(z_values, dtype=float)
+
+    gt_idx = None
+    if row['l3_slice'] is not None:
+        by_name = [i for i, name in zip(indices, filenames)
+                   if name == row['l3_slice'] or os.path.basename(name) == row['l3_slice']]
+        if by_name:
+            gt_idx = by_name[0]
+        elif row['l3_slice'].isdigit():
+            gt_idx = int(row['l3_slice'])
+
+    gt_z = row['l3_z']
+    if gt_idx is None and gt_z is not None and not np.all(np.isnan(z_values)):
+        gt_idx = indices[int(np.nanargmin(np.abs(z_values - gt_z)))]
+    if gt_z is None and gt_idx in indices:
+        z = z_values[indices.index(gt_idx)]
+        gt_z = None if np.isnan(z) else float(z)
+    return gt_idx, gt_z
+
+
+def evaluate_study(row, study_mode=False, time_budget=None, params=None):
+    """
+    Rulează detectorul pe un studiu și compară cu ground truth-ul.
+    Un studiu care depășește time_budget (secunde) e oprit cu statusul 'timeout'.
+    params: profilul de parametri al detectorului (implicit DEFAULT_DETECTOR_PARAMS).
+    """
+    result = {'study': row['study'], 'status': 'ok', 'error': None, 'error_category': None, 'slice_errors': 0}
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            filenames = None
+            if study_mode:
+                best, _ = select_best_series(row['study'])
+                if best is None:
+                    raise ValueError("nicio serie potrivita")
+                filenames = ordered_series_files(best)
+
+            detector = AnatomicL3Detector(row['study'], filenames=filenames, params=params, time_budget=time_budget)
+            detector.load_and_analyze_all_slices()
+            if len(detector.slice_data) == 0:
+                summary = detector.error_summary()
+                raise StudyError(summary['dominant_category'] or 'no_slices', "nu s-au gasit imagini valide",
+                                 summary)
+            candidates = detector.find_best_y3_candidates()
+    except Exception as e:
+        summary = getattr(e, 'summary', None) or {}
+        result.update(status='timeout' if isinstance(e, StudyTimeoutError) else 'failed', error=str(e),
+                      error_category=getattr(e, 'category', 'study_error'),
+                      slice_errors=summary.get('num_errors', 0),
+                      runtime_s=time.perf_counter() - start)
+        return result
+
+    result['runtime_s'] = time.perf_counter() - start
+    summary = detector.error_summary()
+    result.update(slice_errors=summary['num_errors'], error_category=summary['dominant_category'])
+
+    pred_idx, pred_file, pred_score, _ = candidates[0]
+    indices = sorted(detector.slice_data)
+    z_values = np.array([detector.slice_data[i]['z'] if detector.slice_data[i]['z'] is not None else np.nan
+                         for i in indices], dtype=float)
+    pred_z = detector.slice_data[pred_idx]['z']
+
+    gt_idx, gt_z = resolve_ground_truth(row, [detector.slice_data[i]['filename'] for i in indices],
+                                        z_values, indices)
+
+    result.update({
+        'num_slices': len(indices),
+        'pred_slice': pred_idx,
+        'pred_filename': pred_file,
+        'pred_score': float(pred_score),
+        'pred_z': pred_z,
+        'gt_slice': gt_idx,
+        'gt_z': gt_z,
+        'error_slices': abs(pred_idx - gt_idx) if gt_idx is not None else None,
+        'error_mm': abs(pred_z - gt_z) if pred_z is not None and gt_z is not None else None
+    })
+    result['hit_1'] = result['error_slices'] is not None and result['error_slices'] <= 1
+    if gt_idx is None:
+        result.update(status='no_ground_truth', error="L3 de referinta nu a putut fi localizat")
+    return result
+
+
+def summarize(results, wall_time_s):
+    """Metricile agregate pe setul de evaluare"""
+    evaluated = [r for r in results if r['status'] == 'ok']
+    slices = np.array([r['error_slices'] for r in evaluated], dtype=float)
+    mm = np.array([r['error_mm'] for r in evaluated if r['error_mm'] is not None], dtype=float)
+    runtime = np.array([r['runtime_s'] for r in results], dtype=float)
+
+    def stats(values):
+        if len(values) == 0:
+            return None
+        return {'mean': float(np.mean(values)), 'median': float(np.median(values)),
+                'p90': float(np.percentile(values, 90)), 'max': float(np.max(values))}
+
+    return {
+        'num_studies': len(results),
+        'num_evaluated': len(evaluated),
+        'num_failed': sum(r['status'] == 'failed' for r in results),
+        'num_timeout': sum(r['status'] == 'timeout' for r in results),
+        'error_categories': dict(Counter(r['error_category'] for r in results if r['error_category']).most_common()),
+        'hit_rate_1': float(np.mean([r['hit_1'] for r in evaluated])) if evaluated else None,
+        'error_slices': stats(slices),
+        'error_mm': stats(mm),
+        'runtime_s': stats(runtime),
+        'wall_time_s': wall_time_s
+    }
+
+
+def compare_to_baseline(summary, baseline):
+    """Întoarce lista regresiilor de acuratețe față de un baseline (listă goală = OK)"""
+    regressions = []
+    if summary['hit_rate_1'] is not None and baseline.get('hit_rate_1') is not None:
+        drop = baseline['hit_rate_1'] - summary['hit_rate_1']
+        if drop > MAX_HIT_RATE_DROP:
+            regressions.append(f"hit rate ±1 a scazut cu {drop * 100:.1f} puncte")
+    if summary['error_slices'] and baseline.get('error_slices'):
+        increase = summary['error_slices']['median'] - baseline['error_slices']['median']
+        if increase > MAX_MEDIAN_ERROR_INCREASE:
+            regressions.append(f"eroarea mediana a crescut cu {increase:.1f} slice-uri")
+    if summary['num_failed'] > baseline.get('num_failed', 0):
+        regressions.append(f"{summary['num_failed'] - baseline.get('num_failed', 0)} studii esuate in plus")
+    if summary['num_timeout'] > baseline.get('num_timeout', 0):
+        regressions.append(f"{summary['num_timeout'] - baseline.get('num_timeout', 0)} studii oprite (timeout) in plus")
+    return regressions
+
+
+def run_evaluation(csv_path, workers=None, study_mode=False, time_budget=None, params=None):
+    """Evaluează în paralel toate studiile din CSV (cu profilul de parametri dat, dacă există)"""
+    rows = load_ground_truth(csv_path)
+    print(f"Evaluez {len(rows)} studii...")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(evaluate_study, rows, [study_mode] * len(rows), [time_budget] * len(rows),
+                                [params] * len(rows)))
+    wall_time = time.perf_counter() - start
+
+    return results, summarize(results, wall_time)
+
+
+def write_results(results, summary, output_dir):
+    """Scrie rezultatele per studiu (CSV) și sumarul (JSON)"""
+    os.makedirs(output_dir, exist_ok=True)
+    fields = ['study', 'status', 'num_slices', 'pred_slice', 'pred_filename', 'pred_score', 'pred_z',
+              'gt_slice', 'gt_z', 'error_slices', 'error_mm', 'hit_1', 'runtime_s', 'error', 'error_category',
+              'slice_errors']
+    with open(os.path.join(output_dir, 'per_study.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+
+def print_summary(summary):
+    """Afișează metricile principale"""
+    print(f"\nSTUDII: {summary['num_evaluated']}/{summary['num_studies']} evaluate, "
+          f"{summary['num_failed']} esuate, {summary['num_timeout']} oprite (timeout)")
+    if summary['error_categories']:
+        print("Erori: " + ", ".join(f"{category} {count}" for category, count in summary['error_categories'].items()))
+    if summary['hit_rate_1'] is not None:
+        print(f"Hit rate ±1 slice: {summary['hit_rate_1'] * 100:.1f}%")
+    if summary['error_slices']:
+        e = summary['error_slices']
+        print(f"Eroare (slice-uri): medie {e['mean']:.2f}, mediana {e['median']:.1f}, p90 {e['p90']:.1f}")
+    if summary['error_mm']:
+        e = summary['error_mm']
+        print(f"Eroare (mm): medie {e['mean']:.1f}, mediana {e['median']:.1f}, p90 {e['p90']:.1f}")
+    r = summary['runtime_s']
+    if r:
+        print(f"Timp per studiu: medie {r['mean']:.2f}s, mediana {r['median']:.2f}s, p90 {r['p90']:.2f}s")
+    print(f"Timp total: {summary['wall_time_s']:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluare acuratete/viteza detector L3")
+    parser.add_argument("ground_truth", help="CSV cu coloanele study, l3_slice si/sau l3_z")
+    parser.add_argument("--output-dir", default="evaluation/")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--study-mode", action="store_true", help="alege automat seria din fiecare studiu")
+    parser.add_argument("--baseline", help="summary.json dintr-o rulare anterioara")
+    parser.add_argument("--time-budget", type=float, default=None, help="secunde per studiu (oprire la depasire)")
+    parser.add_argument("--params", help="profil de parametri JSON/YAML (ex. best_profile.json din tuning)")
+    args = parser.parse_args()
+
+    params = load_detector_params(args.params) if args.params else None
+    results, summary = run_evaluation(args.ground_truth, args.workers, args.study_mode, args.time_budget, params)
+    write_results(results, summary, args.output_dir)
+    print_summary(summary)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(summary, json.load(f))
+        if regressions:
+            print("\nREGRESII FATA DE BASELINE:")
+            for regression in regressions:
+                print(f"  ✗ {regression}")
+            sys.exit(1)
+        print("\n✓ Fara regresii fata de baseline")
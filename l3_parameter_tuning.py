@@ -0,0 +1,279 @@
+# l3_parameter_tuning.py - Căutare de parametri pentru detectorul Y3 pe un set etichetat
+import io
+import os
+import json
+import time
+import argparse
+import itertools
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from l3_detector_config import merge_detector_params, save_detector_params
+from l3_y3_detector_anatomic import (AnatomicL3Detector, score_y_shape, is_rib_candidate, score_no_ribs,
+                                     vertebra_quality_from_histogram, combine_scores)
+from l3_evaluation import load_ground_truth, resolve_ground_truth
+from l3_dicom_reader import read_dicom_slice, SliceReadError
+
+# Parametrii care cer re-rularea OpenCV (pragurile binarizării și geometria ROI).
+# Toți ceilalți se re-scorează vectorizat din caracteristicile salvate.
+EXTRACTION_KEYS = ('center_roi', 'lateral_divisor', 'roi_mode', 'kernel_size', 'y_threshold', 'rib_threshold')
+
+# Spațiul de căutare implicit: listă de valori candidate pentru fiecare parametru
+DEFAULT_SEARCH_SPACE = {
+    'y_threshold': [120, 140, 160],
+    'rib_threshold': [200, 220],
+    'dense_threshold': [100, 120, 140],
+    'min_y_area': [30, 50, 100],
+    'y_area_tiers': [[[200, 1500, 30], [100, 2000, 15]],
+                     [[150, 2500, 30], [80, 4000, 15]]],
+    'rib_area': [[300, 3000], [200, 3000], [150, 5000]],
+    'rib_aspect': [[2.0, 10.0], [1.5, 10.0]],
+    'rib_min_intensity': [190, 200, 220],
+    'rib_count_scores': [[[0, 100], [2, 70], [4, 40], [6, 20]],
+                         [[0, 100], [1, 70], [3, 40], [5, 20]]],
+    'weights': [{'no_ribs': 0.5, 'y_shape': 0.3, 'position': 0.1, 'quality': 0.1},
+                {'no_ribs': 0.4, 'y_shape': 0.3, 'position': 0.2, 'quality': 0.1},
+                {'no_ribs': 0.5, 'y_shape': 0.2, 'position': 0.1, 'quality': 0.2},
+                {'no_ribs': 0.6, 'y_shape': 0.3, 'position': 0.1, 'quality': 0.0}]
+}
+
+
+def load_search_space(path):
+    """Spațiul de căutare dintr-un JSON {parametru: [valori candidate]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        space = json.load(f)
+    merge_detector_params({key: values[0] for key, values in space.items()})  # Validează numele
+    return space
+
+
+def generate_configs(space, mode='grid', samples=1000, seed=0):
+    """Combinațiile de parametri: produsul complet (grid) sau eșantioane aleatoare (random)"""
+    keys = sorted(space)
+    if mode == 'grid':
+        for values in itertools.product(*(space[key] for key in keys)):
+            yield dict(zip(keys, values))
+        return
+
+    rng = np.random.default_rng(seed)
+    for _ in range(samples):
+        yield {key: space[key][rng.integers(len(space[key]))] for key in keys}
+
+
+def extraction_key(params):
+    """Cheia hashabilă a parametrilor de extracție"""
+    return json.dumps([params[key] for key in EXTRACTION_KEYS])
+
+
+def extract_study_features(row, extraction_params, rib_min_area):
+    """
+    Decodează o singură dată fiecare slice al studiului și salvează caracteristicile
+    intermediare pentru fiecare combinație de parametri de extracție:
+    formă Y (arie, circularitate, alungire), structurile laterale (arie, alungire,
+    intensitate) cu slice-ul lor, histograma zonei centrale și scorul de poziție.
+    """
+    detectors = [AnatomicL3Detector(row['study'], params=params) for params in extraction_params]
+    try:
+        files = sorted(f for f in os.listdir(row['study']) if f.lower().endswith('.dcm'))
+    except OSError as e:
+        print(f"Eroare la {row['study']}: {e}")
+        files = []
+    # Corpul se localizează o dată per studiu și e comun configurațiilor în modul 'body'
+    body_detectors = [d for d in detectors if d.params['roi_mode'] == 'body']
+    body = body_detectors[0].localize_series_body(files) if body_detectors and files else None
+    for detector in detectors:
+        detector.total_files = len(files)
+        if detector in body_detectors:
+            detector.body = body
+
+    filenames, file_indices, z_values = [], [], []
+    per_key = [{'y_crops': [], 'hist': [], 'position': [], 'ribs': [], 'rib_slices': []} for _ in detectors]
+
+    for file_idx, filename in enumerate(files):
+        try:
+            dicom, pixels, _ = read_dicom_slice(os.path.join(row['study'], filename))
+            img = pixels.astype(np.float32)
+        except SliceReadError:
+            continue
+
+        # Aceeași fereastră automată ca în detector
+        p1, p99 = np.percentile(img, [1, 99])
+        img_norm = ((np.clip(img, p1, p99) - p1) / (p99 - p1) * 255).astype(np.uint8)
+
+        # Rândul în caracteristici; file_indices păstrează indexul din director, ca în slice_data-ul detectorului
+        slice_idx = len(filenames)
+        filenames.append(filename)
+        file_indices.append(file_idx)
+        z_values.append(AnatomicL3Detector.get_slice_metadata(dicom)['z'])
+
+        for detector, features in zip(detectors, per_key):
+            features['y_crops'].append(detector.get_center_region(img_norm).copy())  # Forma Y: pe tot studiul, la final
+            features['hist'].append(detector.central_histogram(img_norm))
+            # Poziția se calculează pe indexul din director, ca în modul batch
+            features['position'].append(detector.calculate_position_score(file_idx, filename))
+
+            geometry = detector.get_geometry(img_norm.shape)
+            for region in (img_norm[geometry.left], img_norm[geometry.right]):
+                ribs = detector.extract_lateral_bone_features(region, min_area=rib_min_area)
+                features['ribs'].append(ribs)
+                features['rib_slices'].append(np.full(len(ribs), slice_idx, dtype=np.int32))
+
+    # Ground truth-ul e un index din director, ca în l3_evaluation - și cu slice-uri ilizibile pe parcurs
+    gt_idx, _ = resolve_ground_truth(row, filenames, [np.nan if z is None else z for z in z_values],
+                                     indices=file_indices)
+
+    cached = {}
+    for detector, params, features in zip(detectors, extraction_params, per_key):
+        cached[extraction_key(params)] = {
+            'y': detector.y_shape_features_from_crops(features['y_crops']),
+            'hist': np.array(features['hist'], dtype=np.int64).reshape(-1, 256),
+            'position': np.array(features['position'], dtype=np.float64),
+            'ribs': np.concatenate(features['ribs']) if features['ribs'] else np.zeros((0, 3)),
+            'rib_slices': (np.concatenate(features['rib_slices']) if features['rib_slices']
+                           else np.zeros(0, dtype=np.int32))
+        }
+    return {'study': row['study'], 'num_slices': len(filenames), 'gt_slice': gt_idx, 'features': cached,
+            'slice_indices': np.array(file_indices, dtype=np.int64)}
+
+
+class FeatureTable:
+    """
+    Caracteristicile tuturor studiilor pentru o combinație de extracție,
+    aliniate într-o matrice (studii x slice-uri) completată cu padding.
+    """
+
+    def __init__(self, studies, key):
+        self.num_studies = len(studies)
+        self.max_slices = max(s['num_slices'] for s in studies)
+        shape = (self.num_studies, self.max_slices)
+
+        self.valid = np.zeros(shape, dtype=bool)
+        self.y = np.zeros(shape + (3,))
+        self.hist = np.zeros(shape + (256,), dtype=np.int64)
+        self.position = np.zeros(shape)
+        self.slice_indices = np.zeros(shape, dtype=np.int64)  # Indexul din director al fiecărui rând
+        self.gt = np.array([s['gt_slice'] for s in studies], dtype=np.int64)
+
+        ribs, rib_ids = [], []
+        for i, study in enumerate(studies):
+            features = study['features'][key]
+            n = study['num_slices']
+            self.valid[i, :n] = True
+            self.slice_indices[i, :n] = study['slice_indices']
+            self.y[i, :n] = features['y']
+            self.hist[i, :n] = features['hist']
+            self.position[i, :n] = features['position']
+            ribs.append(features['ribs'])
+            rib_ids.append(i * self.max_slices + features['rib_slices'])
+
+        self.ribs = np.concatenate(ribs)
+        self.rib_ids = np.concatenate(rib_ids)
+        self.quality_cache = {}
+
+    def vertebra_quality(self, dense_threshold):
+        """Calitatea vertebrei depinde doar de pragul de densitate - se calculează o dată per prag"""
+        if dense_threshold not in self.quality_cache:
+            self.quality_cache[dense_threshold] = vertebra_quality_from_histogram(self.hist, dense_threshold)
+        return self.quality_cache[dense_threshold]
+
+    def predict(self, params):
+        """Slice-ul ales de detector în fiecare studiu (index din director) pentru parametrii dați"""
+        y_shape = score_y_shape(self.y[..., 0], self.y[..., 1], self.y[..., 2], params)
+
+        is_rib = is_rib_candidate(self.ribs[:, 0], self.ribs[:, 1], self.ribs[:, 2], params)
+        rib_counts = np.bincount(self.rib_ids[is_rib], minlength=self.valid.size).reshape(self.valid.shape)
+        no_ribs = score_no_ribs(rib_counts, params)
+
+        y3 = combine_scores(no_ribs, y_shape, self.position, self.vertebra_quality(params['dense_threshold']),
+                            params['weights'])
+        # La scoruri egale argmax alege indexul mai mic, ca selecția top K din detector
+        best = np.argmax(np.where(self.valid, y3, -np.inf), axis=1)
+        return self.slice_indices[np.arange(self.num_studies), best]
+
+
+def evaluate_predictions(predicted, ground_truth):
+    """Hit rate ±1 slice și eroarea medie (în slice-uri)"""
+    errors = np.abs(predicted - ground_truth)
+    return {'hit_rate_1': float(np.mean(errors <= 1)), 'mean_error_slices': float(np.mean(errors))}
+
+
+def run_tuning(csv_path, space=None, mode='grid', samples=1000, seed=0, workers=None, top=20):
+    """
+    Caracteristicile sunt extrase o singură dată per studiu (în paralel),
+    apoi toate combinațiile sunt re-scorate vectorizat. Întoarce clasamentul.
+    """
+    space = space or DEFAULT_SEARCH_SPACE
+    rows = load_ground_truth(csv_path)
+    # Parametrii impliciți sunt mereu evaluați primii, ca referință
+    configs = [merge_detector_params()]
+    configs += [merge_detector_params(config) for config in generate_configs(space, mode, samples, seed)]
+
+    extraction_params = list({extraction_key(c): c for c in configs}.values())
+    rib_min_area = min(c['rib_area'][0] for c in configs)
+    print(f"{len(rows)} studii, {len(configs)} configuratii, {len(extraction_params)} extractii distincte")
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ProcessPoolExecutor(max_workers=workers) as pool:
+        studies = list(pool.map(extract_study_features, rows, [extraction_params] * len(rows),
+                                [rib_min_area] * len(rows)))
+    extraction_time = time.perf_counter() - start
+
+    studies = [s for s in studies if s['num_slices'] > 0 and s['gt_slice'] is not None]
+    if not studies:
+        raise ValueError("Niciun studiu cu imagini si L3 de referinta")
+    print(f"Extractie caracteristici: {extraction_time:.1f}s ({len(studies)} studii utilizabile)")
+
+    start = time.perf_counter()
+    tables = {}
+    ranking = []
+    for config in configs:
+        key = extraction_key(config)
+        if key not in tables:
+            tables[key] = FeatureTable(studies, key)
+        metrics = evaluate_predictions(tables[key].predict(config), tables[key].gt)
+        ranking.append((metrics, config))
+    scoring_time = time.perf_counter() - start
+    print(f"Re-scorare: {scoring_time:.1f}s ({len(configs) / max(scoring_time, 1e-9):.0f} configuratii/s)")
+
+    baseline = ranking[0][0]
+    # Obiectiv: hit rate maxim, apoi eroare medie minimă (sortare stabilă - la egalitate rămân impliciții)
+    ranking.sort(key=lambda r: (-r[0]['hit_rate_1'], r[0]['mean_error_slices']))
+
+    return ranking[:top], baseline, {'extraction_s': extraction_time, 'scoring_s': scoring_time,
+                                     'num_configs': len(configs), 'num_studies': len(studies)}
+
+
+def write_tuning_results(ranking, baseline, stats, output_dir):
+    """Scrie profilul câștigător (încărcabil cu load_detector_params) și clasamentul"""
+    os.makedirs(output_dir, exist_ok=True)
+    profile_path = os.path.join(output_dir, 'best_profile.json')
+    save_detector_params(ranking[0][1], profile_path)
+    with open(os.path.join(output_dir, 'tuning_summary.json'), 'w', encoding='utf-8') as f:
+        json.dump({'baseline': baseline, 'stats': stats,
+                   'ranking': [{'metrics': metrics, 'params': params} for metrics, params in ranking]},
+                  f, indent=2)
+    return profile_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tuning parametri detector Y3 pe un set etichetat")
+    parser.add_argument("ground_truth", help="CSV cu coloanele study, l3_slice si/sau l3_z")
+    parser.add_argument("--space", help="JSON {parametru: [valori]} (implicit: spatiul predefinit)")
+    parser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    parser.add_argument("--samples", type=int, default=1000, help="numar de configuratii in modul random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output-dir", default="tuning/")
+    args = parser.parse_args()
+
+    space = load_search_space(args.space) if args.space else None
+    ranking, baseline, stats = run_tuning(args.ground_truth, space, args.mode, args.samples,
+                                          args.seed, args.workers)
+    profile_path = write_tuning_results(ranking, baseline, stats, args.output_dir)
+
+    print(f"\nParametri impliciti: hit rate ±1 {baseline['hit_rate_1'] * 100:.1f}%, "
+          f"eroare medie {baseline['mean_error_slices']:.2f} slice-uri")
+    best = ranking[0][0]
+    print(f"Cea mai buna configuratie: hit rate ±1 {best['hit_rate_1'] * 100:.1f}%, "
+          f"eroare medie {best['mean_error_slices']:.2f} slice-uri")
+    print(f"Profil salvat: {profile_path}")
@@ -0,0 +1,270 @@
+# l3_reference_atlas.py - Atlas de referință: slice-uri L3 confirmate, căutare nearest-neighbour și scor de similaritate
+import os
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+
+from l3_y3_detector_anatomic import AnatomicL3Detector
+from l3_dicom_reader import read_dataset, read_dicom_slice
+from l3_window_lut import rescale_parameters
+
+# Descriptorul: ROI-ul vertebrei redus la DESCRIPTOR_SIZE x DESCRIPTOR_SIZE în fereastra HU + scorurile componente
+DESCRIPTOR_SIZE = 16
+DESCRIPTOR_HU_RANGE = (-200, 1000)
+DESCRIPTOR_SCORES = ('y_shape_score', 'no_ribs_score', 'vertebra_quality')
+SCORE_WEIGHT = 0.5  # Ponderea scorurilor (0-1) față de ROI-ul normalizat (normă 1)
+ATLAS_DIMS = 32  # Dimensiunea după PCA
+QUERY_CHUNK = 256  # Interogări per bloc în căutarea brute-force (memorie QUERY_CHUNK x N)
+
+
+def _require_scipy():
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        raise ImportError("Indexul KD-tree necesita scipy (pip install scipy); altfel folositi method='brute'")
+    return cKDTree
+
+
+def slice_descriptor(img, analysis, geometry, rescale=(1.0, 0.0)):
+    """
+    Descriptorul unui slice: zona centrală în HU, redusă și normalizată (media 0, norma 1),
+    urmată de scorurile componente (0-1) ponderate cu SCORE_WEIGHT
+    """
+    slope, intercept = rescale
+    low, high = DESCRIPTOR_HU_RANGE
+    roi = np.clip((img[geometry.center] * slope + intercept - low) / (high - low), 0, 1).astype(np.float32)
+    roi = cv2.resize(roi, (DESCRIPTOR_SIZE, DESCRIPTOR_SIZE), interpolation=cv2.INTER_AREA).ravel()
+    roi -= roi.mean()
+    roi /= max(float(np.linalg.norm(roi)), 1e-6)
+    scores = np.array([analysis[key] for key in DESCRIPTOR_SCORES], dtype=np.float32) / 100 * SCORE_WEIGHT
+    return np.concatenate([roi, scores])
+
+
+def detector_descriptor(detector, slice_idx, img=None):
+    """Descriptorul unui slice analizat de detector (imaginea din top K sau recitită de pe disc)"""
+    data = detector.slice_data[slice_idx]
+    if img is None:
+        img = data.get('image')
+    if img is None:
+        _, pixels, _ = read_dicom_slice(os.path.join(detector.data_directory, data['filename']))
+        img = pixels.astype(np.float32)
+    return slice_descriptor(img, data['analysis'], detector.get_geometry(img.shape),
+                            rescale_parameters(detector.series_header or {}))
+
+
+class ReferenceAtlas:
+    """
+    Indexul slice-urilor L3 confirmate: descriptorii proiectați PCA în `vectors` (N, ATLAS_DIMS)
+    și metadatele fiecărei referințe. Căutarea e brute-force (un produs matriceal per bloc de
+    interogări) sau, pentru atlase foarte mari, KD-tree (scipy, opțional).
+    """
+
+    def __init__(self, vectors, metadata, mean, components, scale=1.0, method='brute'):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.metadata = list(metadata)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.scale = float(scale)
+        self.method = method
+        self._tree = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, descriptors, metadata, dims=ATLAS_DIMS, method='brute'):
+        """Atlasul din descriptorii bruți: PCA pe covarianța (D x D) și scara distanțelor"""
+        descriptors = np.asarray(descriptors, dtype=np.float64)
+        mean = descriptors.mean(axis=0)
+        centered = descriptors - mean
+        _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        components = eigenvectors[:, ::-1][:, :min(dims, descriptors.shape[1])].T
+
+        atlas = cls(centered @ components.T, metadata, mean, components, method=method)
+        atlas.scale = atlas.nearest_neighbour_scale()
+        return atlas
+
+    def project(self, descriptors):
+        """Descriptorii bruți proiectați în spațiul PCA al atlasului"""
+        return (np.atleast_2d(np.asarray(descriptors, dtype=np.float32)) - self.mean) @ self.components.T
+
+    def extend(self, descriptors, metadata):
+        """Adaugă referințe noi cu proiecția existentă (PCA și scara rămân neschimbate)"""
+        projected = self.project(descriptors).astype(np.float32)
+        self.vectors = np.concatenate([self.vectors, projected])
+        self.norms = np.concatenate([self.norms, np.einsum('ij,ij->i', projected, projected)])
+        self.metadata.extend(metadata)
+        self._tree = None
+
+    def search(self, vectors, k):
+        """Cei mai apropiați k vecini ai unor vectori deja proiectați: (distanțe, indici), ambele (m, k)"""
+        k = min(k, len(self))
+        if self.method == 'kdtree':
+            if self._tree is None:
+                self._tree = _require_scipy()(self.vectors)
+            distances, indices = self._tree.query(vectors, k=k)
+            return distances.reshape(len(vectors), k), indices.reshape(len(vectors), k)
+
+        distances = np.empty((len(vectors), k), dtype=np.float32)
+        indices = np.empty((len(vectors), k), dtype=np.int64)
+        for start in range(0, len(vectors), QUERY_CHUNK):
+            block = vectors[start:start + QUERY_CHUNK]
+            squared = (np.einsum('ij,ij->i', block, block)[:, None] + self.norms[None, :]
+                       - 2 * block @ self.vectors.T)
+            nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            nearest_squared = np.take_along_axis(squared, nearest, axis=1)
+            order = np.argsort(nearest_squared, axis=1)
+            indices[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:start + len(block)] = np.sqrt(np.maximum(
+                np.take_along_axis(nearest_squared, order, axis=1), 0))
+        return distances, indices
+
+    def query(self, descriptors, k=5):
+        """Cele mai apropiate k referințe pentru fiecare descriptor: (distanțe, indici)"""
+        return self.search(self.project(descriptors).astype(np.float32), k)
+
+    def nearest_neighbour_scale(self, k=5, sample=2000, seed=0):
+        """Mediana distanței de la o referință la a k-a cea mai apropiată altă referință (pe un eșantion)"""
+        if len(self) < 2:
+            return 1.0
+        rng = np.random.default_rng(seed)
+        picked = rng.choice(len(self), size=min(sample, len(self)), replace=False)
+        distances, _ = self.search(self.vectors[picked], k + 1)  # Primul vecin este referința însăși
+        return max(float(np.median(distances[:, -1])), 1e-6)
+
+    def similarity(self, descriptors, k=5):
+        """
+        Scorul de similaritate (0-100) cu cele mai apropiate k referințe:
+        100 pentru o potrivire exactă, 50 la distanța tipică dintre o referință și vecinii ei
+        """
+        distances, _ = self.query(descriptors, k)
+        return (100 * np.exp2(-(distances / self.scale) ** 2)).mean(axis=1)
+
+    def save(self, path):
+        """Salvează atlasul ca .npz (vectorii, PCA, scara și metadatele ca JSON)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, vectors=self.vectors, mean=self.mean, components=self.components,
+                 scale=np.array(self.scale), metadata=np.array(json.dumps(self.metadata)))
+
+    @classmethod
+    def load(cls, path, method='brute'):
+        with np.load(path) as data:
+            return cls(data['vectors'], json.loads(str(data['metadata'])), data['mean'], data['components'],
+                       float(data['scale']), method=method)
+
+
+def reference_entry(row, study_mode=False):
+    """
+    Descriptorul slice-ului L3 confirmat dintr-un rând de ground truth (vezi l3_evaluation),
+    calculat cu aceeași geometrie ROI ca la detecție. Întoarce (descriptor, metadate).
+    """
+    from l3_evaluation import resolve_ground_truth
+
+    filenames = None
+    if study_mode:
+        from l3_study_selector import select_best_series, ordered_series_files
+        best, _ = select_best_series(row['study'])
+        if best is None:
+            raise ValueError("nicio serie potrivita")
+        filenames = ordered_series_files(best)
+
+    detector = AnatomicL3Detector(row['study'], filenames=filenames)
+    files = detector.series_files()
+    z_values = np.full(len(files), np.nan)
+    if row['l3_slice'] is None:
+        for i, filename in enumerate(files):
+            header, _ = read_dataset(os.path.join(row['study'], filename), stop_before_pixels=True)
+            position = header.get('ImagePositionPatient')
+            if position is not None and len(position) == 3:
+                z_values[i] = float(position[2])
+
+    slice_idx, _ = resolve_ground_truth(row, files, z_values)
+    if slice_idx is None or not 0 <= slice_idx < len(files):
+        raise ValueError("L3 de referinta nu a putut fi localizat")
+
+    detector.total_files = len(files)
+    if detector.params['roi_mode'] == 'body':
+        detector.body = detector.localize_series_body(files)
+    dicom, pixels, _ = read_dicom_slice(os.path.join(row['study'], files[slice_idx]))
+    img = pixels.astype(np.float32)
+    analysis = detector.analyze_anatomic_criteria(img, slice_idx, files[slice_idx])
+    metadata = detector.get_slice_metadata(dicom)
+
+    descriptor = slice_descriptor(img, analysis, detector.get_geometry(img.shape), rescale_parameters(dicom))
+    return descriptor, {'study': row['study'], 'filename': files[slice_idx], 'slice_index': int(slice_idx),
+                        'sop_uid': metadata['sop_uid'], 'z': metadata['z']}
+
+
+def _reference_entry_quiet(row, study_mode):
+    import io
+    import contextlib
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return reference_entry(row, study_mode)
+    except Exception as e:
+        return None, {'study': row['study'], 'error': str(e)}
+
+
+def build_reference_atlas(csv_path, output_path, study_mode=False, workers=None, dims=ATLAS_DIMS):
+    """Construiește atlasul din studiile cu L3 confirmat (CSV-ul de ground truth) și îl salvează"""
+    from l3_evaluation import load_ground_truth
+
+    rows = load_ground_truth(csv_path)
+    print(f"Construiesc atlasul din {len(rows)} studii...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        entries = list(pool.map(_reference_entry_quiet, rows, [study_mode] * len(rows)))
+
+    descriptors = [descriptor for descriptor, _ in entries if descriptor is not None]
+    metadata = [meta for descriptor, meta in entries if descriptor is not None]
+    for _, meta in entries:
+        if 'error' in meta:
+            print(f"  Omis {meta['study']}: {meta['error']}")
+    if not descriptors:
+        raise ValueError("niciun slice L3 de referinta valid")
+
+    atlas = ReferenceAtlas.build(np.stack(descriptors), metadata, dims=dims)
+    atlas.save(output_path)
+    print(f"Atlas: {len(atlas)} referinte, {atlas.vectors.shape[1]} dimensiuni, "
+          f"scara {atlas.scale:.3f} -> {output_path}")
+    return atlas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Atlas de referinta L3 (nearest-neighbour)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="construieste atlasul din CSV-ul de ground truth")
+    build_parser.add_argument("ground_truth")
+    build_parser.add_argument("--output", default="l3_atlas.npz")
+    build_parser.add_argument("--study-mode", action="store_true")
+    build_parser.add_argument("--workers", type=int, default=None)
+    build_parser.add_argument("--dims", type=int, default=ATLAS_DIMS)
+
+    query_parser = subparsers.add_parser("query", help="similaritatea candidatilor unui studiu cu atlasul")
+    query_parser.add_argument("directory")
+    query_parser.add_argument("--atlas", default="l3_atlas.npz")
+    query_parser.add_argument("--k", type=int, default=5)
+    query_parser.add_argument("--kdtree", action="store_true", help="KD-tree (scipy) in loc de brute-force")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_reference_atlas(args.ground_truth, args.output, args.study_mode, args.workers, args.dims)
+    else:
+        atlas = ReferenceAtlas.load(args.atlas, method='kdtree' if args.kdtree else 'brute')
+        detector = AnatomicL3Detector(args.directory)
+        detector.load_and_analyze_all_slices()
+        candidates = detector.find_best_y3_candidates()
+
+        start = time.perf_counter()
+        similarity = detector.atlas_similarity(atlas, candidates, k=args.k)
+        print(f"\nSimilaritate cu {len(atlas)} referinte ({(time.perf_counter() - start) * 1000:.1f} ms):")
+        _, nearest = atlas.query([detector_descriptor(detector, candidates[0][0])], k=1)
+        for (idx, filename, score, _), sim in zip(candidates, similarity):
+            print(f"  {filename}: Y3 {score:.1f}, atlas {sim:.1f}")
+        print(f"Cea mai apropiata referinta pentru {candidates[0][1]}: {atlas.metadata[nearest[0, 0]]}")
@@ -0,0 +1,246 @@
+# l3_report_renderer.py - Rapoarte Y3 headless (Agg) și rapoarte rapide compuse direct în NumPy
+import numpy as np
+import cv2
+
+from l3_detector_config import get_default_config
+
+COMPONENT_LABELS = ['Fără Coaste', 'Forma Y', 'Poziție', 'Calitate']
+COMPONENT_KEYS = ['no_ribs_score', 'y_shape_score', 'position_score', 'vertebra_quality']
+COMPONENT_COLORS = ['red', 'blue', 'green', 'orange']
+COMPONENT_COLORS_BGR = [(0, 0, 255), (255, 0, 0), (0, 160, 0), (0, 165, 255)]
+
+MAX_RANK_BARS = 10
+
+
+def window_for_display(img):
+    """Auto-windowing 1-99 percentile la uint8"""
+    p1, p99 = np.percentile(img, [1, 99])
+    img_display = np.clip(img, p1, p99)
+    return ((img_display - p1) / (p99 - p1) * 255).astype(np.uint8)
+
+
+def resolve_geometry(shape, geometry=None):
+    """Geometria ROI dată de detector sau cea implicită pentru dimensiunea imaginii"""
+    return geometry if geometry is not None else get_default_config().geometry(shape)
+
+
+def center_roi_bounds(shape, geometry=None):
+    """Coordonatele zonei Y centrale pentru o imagine de dimensiunea dată"""
+    return resolve_geometry(shape, geometry).center_bounds
+
+
+def draw_roi(img, bounds, color, thickness):
+    """Dreptunghiul unui ROI (h_start, h_end, w_start, w_end)"""
+    h0, h1, w0, w1 = bounds
+    cv2.rectangle(img, (w0, h0), (w1 - 1, h1 - 1), color, thickness)
+
+
+def draw_anatomic_overlay(img_display, geometry=None):
+    """Marchează zonele laterale (coaste) și zona Y centrală pe o copie a imaginii"""
+    overlay = img_display.copy()
+    geometry = resolve_geometry(overlay.shape, geometry)
+
+    # Zonele laterale ÎNGUSTE - fără suprapunere cu centrul
+    draw_roi(overlay, geometry.left_bounds, 128, 2)
+    draw_roi(overlay, geometry.right_bounds, 128, 2)
+
+    # Zona Y centrală
+    h_start, h_end, w_start, w_end = geometry.center_bounds
+    cv2.rectangle(overlay, (w_start, h_start), (w_end, h_end), 255, 3)
+    return overlay
+
+
+def format_stats_text(filename, score, analysis):
+    """Textul cu statistici din raportul detaliat"""
+    return f"""DETECTIE Y3 ANATOMICA
+
+Fisier: {filename}
+Score Y3: {score:.1f}
+
+CRITERIUL CHEIE:
+Coaste detectate: {analysis['ribs_detected']:.0f}
+Status: {'✓ FĂRĂ coaste (Y3!)' if analysis['ribs_detected'] < 10 else '✗ Cu coaste (Y1/Y2)'}
+
+Alte criterii:
+- Forma Y: {analysis['y_shape_score']:.0f}/100
+- Poziție ultimele slice-uri: {analysis['position_score']:.0f}/100
+- Calitate vertebră: {analysis['vertebra_quality']:.0f}/100
+
+Interpretare:
+{'✓ Y3 CONFIRMAT' if score > 60 else '? Y3 POSIBIL' if score > 40 else '✗ NU este Y3'}
+
+Zona de lucru pentru sarcopenie:
+{'✓ Curată, fără coaste' if analysis['ribs_detected'] < 20 else '✗ Cu interferențe osoase'}
+        """
+
+
+class ReportFigureTemplate:
+    """
+    Figura 2x3 a raportului, construită o singură dată pe backend-ul Agg.
+    La fiecare raport se actualizează doar datele artiștilor (imagini, bare,
+    text), fără a recrea axele sau a reface layout-ul.
+    """
+
+    def __init__(self):
+        # matplotlib e necesar doar pentru raportul complet, nu și pentru cel rapid (OpenCV)
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.fig = Figure(figsize=(15, 10))
+        self.canvas = FigureCanvasAgg(self.fig)
+        axes = self.fig.subplots(2, 3)
+        self.axes = axes
+
+        placeholder = np.zeros((2, 2), dtype=np.uint8)
+        self.image_artists = []
+        for ax in axes[0]:
+            self.image_artists.append(ax.imshow(placeholder, cmap='gray', vmin=0, vmax=255))
+            ax.set_title("\n")  # Titlurile au două rânduri - rezervă spațiul pentru layout
+            ax.axis('off')
+
+        # Grafic scoruri (numărul maxim de bare; cele nefolosite au înălțime 0)
+        self.rank_bars = axes[1, 0].bar(range(MAX_RANK_BARS), np.zeros(MAX_RANK_BARS))
+        axes[1, 0].set_title("Scoruri Y3 Candidati")
+        axes[1, 0].set_xlabel("Rank")
+        axes[1, 0].set_ylabel("Score Y3")
+        axes[1, 0].set_ylim(0, 100)
+
+        # Componente scor
+        self.component_bars = axes[1, 1].bar(COMPONENT_LABELS, np.zeros(len(COMPONENT_LABELS)),
+                                              color=COMPONENT_COLORS, alpha=0.7)
+        axes[1, 1].set_title("Criteriile Anatomice Y3")
+        axes[1, 1].set_ylabel("Score")
+        axes[1, 1].set_ylim(0, 100)
+        axes[1, 1].tick_params(axis='x', rotation=45)
+
+        self.stats_artist = axes[1, 2].text(0.05, 0.95, "", fontsize=8,
+                                            verticalalignment='top', transform=axes[1, 2].transAxes,
+                                            bbox=dict(boxstyle="round,pad=0.3", facecolor="lightgray", alpha=0.8))
+        axes[1, 2].axis('off')
+
+        self.fig.tight_layout()
+
+    def set_image(self, index, img, title):
+        """Înlocuiește imaginea unui panou păstrând artistul existent"""
+        h, w = img.shape[:2]
+        artist = self.image_artists[index]
+        artist.set_data(img)
+        artist.set_extent((-0.5, w - 0.5, h - 0.5, -0.5))
+        self.axes[0, index].set_xlim(-0.5, w - 0.5)
+        self.axes[0, index].set_ylim(h - 0.5, -0.5)
+        self.axes[0, index].set_title(title)
+
+    def render(self, img_display, filename, score, analysis, candidate_scores, output_path, dpi=150,
+               geometry=None):
+        """Actualizează figura și o salvează ca PNG"""
+        h_start, h_end, w_start, w_end = center_roi_bounds(img_display.shape, geometry)
+
+        self.set_image(0, img_display, f"CT Original\n{filename}")
+        self.set_image(1, draw_anatomic_overlay(img_display, geometry),
+                       f"Analiza Anatomica\nCoaste: {analysis['ribs_detected']:.0f}")
+        self.set_image(2, img_display[h_start:h_end, w_start:w_end],
+                       f"Forma Y Extrasa\nScore: {analysis['y_shape_score']:.0f}")
+
+        scores = list(candidate_scores[:MAX_RANK_BARS])
+        for i, bar in enumerate(self.rank_bars):
+            bar.set_height(scores[i] if i < len(scores) else 0)
+
+        for bar, key in zip(self.component_bars, COMPONENT_KEYS):
+            bar.set_height(analysis[key])
+
+        self.stats_artist.set_text(format_stats_text(filename, score, analysis))
+
+        self.fig.savefig(output_path, dpi=dpi)
+        return output_path
+
+
+_template = None
+
+
+def get_report_template():
+    """Șablonul de figură este creat o dată per proces și refolosit"""
+    global _template
+    if _template is None:
+        _template = ReportFigureTemplate()
+    return _template
+
+
+def render_figure_report(img_display, filename, score, analysis, candidate_scores,
+                         output_path='y3_anatomic_detection.png', dpi=150, geometry=None):
+    """Raportul complet matplotlib (Agg, fără fereastră)"""
+    return get_report_template().render(img_display, filename, score, analysis,
+                                        candidate_scores, output_path, dpi=dpi, geometry=geometry)
+
+
+def compose_light_report(img_display, filename, score, analysis, candidate_scores, geometry=None):
+    """
+    Raport rapid compus direct într-o imagine BGR: slice-ul cu zonele anatomice,
+    zona Y mărită și barele de scor, fără matplotlib.
+    """
+    h, w = img_display.shape[:2]
+    panel_w = 360
+
+    # Panoul are nevoie de ~420px înălțime și pentru slice-uri mici
+    report = np.zeros((max(h, 420), w + panel_w, 3), dtype=np.uint8)
+
+    # Slice-ul cu zonele anatomice
+    overlay = cv2.cvtColor(img_display, cv2.COLOR_GRAY2BGR)
+    geometry = resolve_geometry(img_display.shape, geometry)
+    h_start, h_end, w_start, w_end = geometry.center_bounds
+    draw_roi(overlay, geometry.left_bounds, (128, 128, 128), 2)
+    draw_roi(overlay, geometry.right_bounds, (128, 128, 128), 2)
+    cv2.rectangle(overlay, (w_start, h_start), (w_end, h_end), (0, 255, 0), 2)
+    report[:h, :w] = overlay
+
+    # Zona Y mărită în colțul panoului
+    crop = img_display[h_start:h_end, w_start:w_end]
+    if crop.size:
+        scale = min((panel_w - 20) / crop.shape[1], (report.shape[0] // 3) / crop.shape[0])
+        crop = cv2.resize(crop, (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_NEAREST)
+        ch, cw = crop.shape
+        report[10:10 + ch, w + 10:w + 10 + cw] = crop[:, :, None]
+        y = 10 + ch + 25
+    else:
+        y = 30
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    color = (0, 255, 0) if score > 60 else (0, 165, 255) if score > 40 else (0, 0, 255)
+    cv2.putText(report, filename[:30], (w + 10, y), font, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+    cv2.putText(report, f"Score Y3: {score:.1f}", (w + 10, y + 25), font, 0.7, color, 2, cv2.LINE_AA)
+    cv2.putText(report, f"Coaste: {analysis['ribs_detected']:.0f}", (w + 10, y + 50), font, 0.5,
+                (255, 255, 255), 1, cv2.LINE_AA)
+    y += 75
+
+    # Barele componentelor
+    labels = ['Fara coaste', 'Forma Y', 'Pozitie', 'Calitate']
+    bar_max = panel_w - 160
+    for label, key, bar_color in zip(labels, COMPONENT_KEYS, COMPONENT_COLORS_BGR):
+        value = float(analysis[key])
+        cv2.putText(report, label, (w + 10, y + 12), font, 0.45, (220, 220, 220), 1, cv2.LINE_AA)
+        cv2.rectangle(report, (w + 110, y), (w + 110 + int(bar_max * min(value, 100) / 100), y + 14),
+                      bar_color, -1)
+        cv2.putText(report, f"{value:.0f}", (w + 115 + bar_max, y + 12), font, 0.4, (220, 220, 220), 1,
+                    cv2.LINE_AA)
+        y += 24
+
+    # Scorurile candidaților (top 10)
+    y += 10
+    scores = list(candidate_scores[:MAX_RANK_BARS])
+    if scores and y + 60 < report.shape[0]:
+        chart_h = min(100, report.shape[0] - y - 10)
+        bar_w = max(4, (panel_w - 20) // len(scores) - 4)
+        for i, value in enumerate(scores):
+            x0 = w + 10 + i * (bar_w + 4)
+            bar_h = int(chart_h * min(float(value), 100) / 100)
+            cv2.rectangle(report, (x0, y + chart_h - bar_h), (x0 + bar_w, y + chart_h), (255, 200, 0), -1)
+
+    return report
+
+
+def render_light_report(img_display, filename, score, analysis, candidate_scores,
+                        output_path='y3_anatomic_detection.png', geometry=None):
+    """Salvează raportul rapid compus cu OpenCV"""
+    cv2.imwrite(output_path, compose_light_report(img_display, filename, score, analysis, candidate_scores,
+                                                  geometry))
+    return output_path
@@ -0,0 +1,288 @@
+# l3_result_export.py - Export structurat al rezultatelor Y3 (JSON per studiu, Parquet per cohortă)
+import os
+import sys
+import json
+import uuid
+import time
+from datetime import datetime
+
+from l3_y3_detector_anatomic import AnatomicL3Detector, default_zone_bounds, VERTEBRAL_LEVELS
+from l3_dicom_reader import StudyError
+from l3_detector_config import load_detector_params
+
+RESULT_SCHEMA_VERSION = 2
+
+SCORE_FIELDS = ['y3_score', 'y_shape_score', 'no_ribs_score', 'position_score',
+                'vertebra_quality', 'ribs_detected']
+
+
+def build_study_result(detector, candidates, zone_bounds=None, timings=None):
+    """
+    Construiește rezultatul complet al unui studiu:
+    UID-uri, scorurile componente pentru fiecare slice, slice-ul ales,
+    limitele zonei Y3, nivelurile T12-L5, timpii de execuție și erorile pe categorii.
+    Fără zone_bounds, zona vine din analiza secvenței din detector.
+    """
+    slices = []
+    for slice_idx in sorted(detector.slice_data):
+        data = detector.slice_data[slice_idx]
+        record = {
+            'slice_index': int(slice_idx),
+            'filename': data['filename'],
+            'sop_uid': data.get('sop_uid'),
+            'z': data.get('z')
+        }
+        for field in SCORE_FIELDS:
+            record[field] = float(data['analysis'][field])
+        if 'atlas_similarity' in data['analysis']:
+            record['atlas_similarity'] = data['analysis']['atlas_similarity']
+        slices.append(record)
+
+    best_idx = candidates[0][0] if candidates else None
+    chosen = next((s for s in slices if s['slice_index'] == best_idx), None)
+
+    sequence = detector.analyze_sequence()
+    if zone_bounds is None:
+        zone_bounds = sequence['zone'] if sequence else default_zone_bounds(len(slices))
+
+    return {
+        'schema_version': RESULT_SCHEMA_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'data_directory': detector.data_directory,
+        'study_uid': detector.study_uid,
+        'series_uid': detector.series_uid,
+        'num_slices': len(slices),
+        'roi_mode': detector.params['roi_mode'],  # 'body' sau 'fixed' (watch mode) - scorurile nu sunt comparabile între moduri
+        'chosen_slice': chosen,
+        'zone': {'start': zone_bounds[0], 'end': zone_bounds[1],
+                 'rib_termination': sequence['rib_termination'] if sequence else None},
+        # Numărate de la slice-ul ales - L3 din etichete e același cu chosen_slice
+        'vertebral_levels': detector.label_vertebral_levels(sequence, l3_slice=best_idx) if sequence else None,
+        'timings': {key: round(value, 4) for key, value in (timings or detector.timings).items()},
+        'status': detector.status,
+        'error_summary': detector.error_summary(),
+        'errors': detector.errors,
+        'slices': slices
+    }
+
+
+def write_study_json(result, output_path):
+    """Scrie rezultatul unui studiu ca JSON"""
+    directory = os.path.dirname(output_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    return output_path
+
+
+def load_study_json(path):
+    """Citește un rezultat JSON scris de write_study_json"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def study_json_name(result):
+    """Numele fișierului JSON pentru un studiu"""
+    key = result.get('series_uid') or result.get('study_uid') or os.path.basename(
+        os.path.normpath(result['data_directory']))
+    return f"y3_result_{key}.json"
+
+
+def level_centers(result):
+    """Slice-ul central al fiecărui nivel T12-L5 (None pentru nivelurile din afara seriei)"""
+    levels = (result.get('vertebral_levels') or {}).get('levels') or {}
+    return {f'{level.lower()}_center': (levels.get(level) or {}).get('center') for level in VERTEBRAL_LEVELS}
+
+
+# Schemele explicite ale tabelelor Parquet: toate fișierele part-* au aceleași coloane și tipuri,
+# chiar dacă într-un buffer o coloană e None peste tot (ex. niciun slice ales, nivel în afara seriei)
+STUDY_COLUMNS = ([('study_uid', 'string'), ('series_uid', 'string'), ('data_directory', 'string'),
+                  ('num_slices', 'int64'), ('roi_mode', 'string'), ('chosen_slice_index', 'int64'), ('chosen_filename', 'string'),
+                  ('chosen_sop_uid', 'string'), ('chosen_z', 'float64')] +
+                 [(f'chosen_{field}', 'float64') for field in SCORE_FIELDS] +
+                 [('zone_start', 'int64'), ('zone_end', 'int64')] +
+                 [(f'{level.lower()}_center', 'int64') for level in VERTEBRAL_LEVELS] +
+                 [('read_s', 'float64'), ('analysis_s', 'float64'), ('total_s', 'float64'),
+                  ('status', 'string'), ('num_errors', 'int64'), ('created_at', 'string')])
+
+SLICE_COLUMNS = ([('study_uid', 'string'), ('series_uid', 'string'), ('slice_index', 'int64'),
+                  ('filename', 'string'), ('sop_uid', 'string'), ('z', 'float64')] +
+                 [(field, 'float64') for field in SCORE_FIELDS] +
+                 [('atlas_similarity', 'float64'), ('is_chosen', 'bool_')])
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Exportul Parquet necesita pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+class CohortDatasetWriter:
+    """
+    Adaugă rezultatele unei cohorte într-un dataset Parquet cu două tabele:
+    `studies/` (un rând per studiu) și `slices/` (un rând per slice).
+
+    Rezultatele sunt ținute în buffer și scrise ca un singur fișier `part-*.parquet`
+    la fiecare `flush_every` studii, ca să nu rezulte mii de fișiere mici.
+    Datasetul se citește apoi dintr-o bucată cu pyarrow.dataset / pandas.read_parquet.
+    """
+
+    def __init__(self, dataset_dir, flush_every=500):
+        self.pa, self.pq = _require_pyarrow()
+        self.dataset_dir = dataset_dir
+        self.flush_every = flush_every
+        self.schemas = {table: self.pa.schema([(name, getattr(self.pa, type_name)()) for name, type_name in columns])
+                        for table, columns in (('studies', STUDY_COLUMNS), ('slices', SLICE_COLUMNS))}
+        self.study_rows = []
+        self.slice_rows = []
+        self.buffered = 0
+
+        for table in ('studies', 'slices'):
+            os.makedirs(os.path.join(dataset_dir, table), exist_ok=True)
+
+    def append(self, result):
+        """Adaugă rezultatul unui studiu"""
+        chosen = result['chosen_slice'] or {}
+        timings = result.get('timings', {})
+        self.study_rows.append({
+            'study_uid': result['study_uid'],
+            'series_uid': result['series_uid'],
+            'data_directory': result['data_directory'],
+            'num_slices': result['num_slices'],
+            'roi_mode': result.get('roi_mode'),
+            'chosen_slice_index': chosen.get('slice_index'),
+            'chosen_filename': chosen.get('filename'),
+            'chosen_sop_uid': chosen.get('sop_uid'),
+            'chosen_z': chosen.get('z'),
+            **{f'chosen_{field}': chosen.get(field) for field in SCORE_FIELDS},
+            'zone_start': result['zone']['start'],
+            'zone_end': result['zone']['end'],
+            **level_centers(result),
+            'read_s': timings.get('read_s'),
+            'analysis_s': timings.get('analysis_s'),
+            'total_s': timings.get('total_s'),
+            'status': result.get('status'),
+            'num_errors': result.get('error_summary', {}).get('num_errors'),
+            'created_at': result['created_at']
+        })
+
+        chosen_idx = chosen.get('slice_index')
+        for record in result['slices']:
+            self.slice_rows.append({
+                'study_uid': result['study_uid'],
+                'series_uid': result['series_uid'],
+                **record,
+                'atlas_similarity': record.get('atlas_similarity'),
+                'is_chosen': record['slice_index'] == chosen_idx
+            })
+
+        self.buffered += 1
+        if self.buffered >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Scrie buffer-ul curent ca un nou fișier în fiecare tabel"""
+        if not self.buffered:
+            return
+        part = f"part-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet"
+        for table, rows in (('studies', self.study_rows), ('slices', self.slice_rows)):
+            self.pq.write_table(self.pa.Table.from_pylist(rows, schema=self.schemas[table]),
+                                os.path.join(self.dataset_dir, table, part))
+        self.study_rows = []
+        self.slice_rows = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def run_study(data_directory, dicom_dir=None, time_budget=None, params=None):
+    """
+    Rulează detectorul pe un studiu și întoarce rezultatul structurat.
+    Cu dicom_dir, scrie și Secondary Capture + SEG pentru slice-ul ales.
+    Un studiu fără niciun slice valid ridică StudyError (StudyTimeoutError la depășirea bugetului).
+    params: profilul de parametri al detectorului (implicit DEFAULT_DETECTOR_PARAMS).
+    """
+    detector = AnatomicL3Detector(data_directory, params=params, time_budget=time_budget)
+    detector.load_and_analyze_all_slices()
+    if len(detector.slice_data) == 0:
+        summary = detector.error_summary()
+        raise StudyError(summary['dominant_category'] or 'no_slices', "nu s-au gasit imagini valide", summary)
+    candidates = detector.find_best_y3_candidates()
+    if dicom_dir is not None:
+        from l3_dicom_output import write_dicom_results
+        write_dicom_results([(detector, candidates)], dicom_dir)
+    return build_study_result(detector, candidates)
+
+
+def study_failure(data_directory, error):
+    """Înregistrarea unui studiu eșuat pentru errors.json"""
+    return {
+        'data_directory': data_directory,
+        'category': getattr(error, 'category', 'study_error'),
+        'message': str(error),
+        'error_summary': getattr(error, 'summary', None)
+    }
+
+
+def export_cohort(study_directories, output_dir, parquet=True, dicom=False, time_budget=None, params=None):
+    """
+    Rulează detecția pe o listă de studii și scrie JSON + dataset Parquet (+ DICOM SC/SEG).
+    Studiile eșuate sau oprite de time_budget (secunde per studiu) nu opresc cohorta;
+    sunt scrise cu categoria erorii în errors.json.
+    """
+    json_dir = os.path.join(output_dir, 'json')
+    dicom_dir = os.path.join(output_dir, 'dicom') if dicom else None
+    writer = CohortDatasetWriter(os.path.join(output_dir, 'dataset')) if parquet else None
+
+    exported = 0
+    failures = []
+    try:
+        for data_directory in study_directories:
+            try:
+                result = run_study(data_directory, dicom_dir, time_budget, params)
+            except Exception as e:
+                failures.append(study_failure(data_directory, e))
+                print(f"EROARE [{failures[-1]['category']}] in {data_directory}: {e}")
+                continue
+            write_study_json(result, os.path.join(json_dir, study_json_name(result)))
+            if writer is not None:
+                writer.append(result)
+            exported += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if failures:
+        write_study_json(failures, os.path.join(output_dir, 'errors.json'))
+    print(f"\nExportat {exported} studii in: {output_dir}" + (f" ({len(failures)} esuate)" if failures else ""))
+    return exported
+
+
+if __name__ == "__main__":
+    # Fiecare subdirector din directorul cohortei este un studiu; --dicom scrie și SC/SEG,
+    # --time-budget=SECUNDE oprește studiile care durează mai mult, --params=PROFIL încarcă un profil JSON/YAML
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    time_budget = next((float(arg.split('=', 1)[1]) for arg in sys.argv[1:]
+                        if arg.startswith('--time-budget=')), None)
+    params_path = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--params=')), None)
+    cohort_dir = args[0] if len(args) > 0 else "data/cohort/"
+    output_dir = args[1] if len(args) > 1 else "results/"
+
+    if os.path.exists(cohort_dir):
+        studies = sorted(os.path.join(cohort_dir, d) for d in os.listdir(cohort_dir)
+                         if os.path.isdir(os.path.join(cohort_dir, d)))
+        export_cohort(studies, output_dir, dicom='--dicom' in sys.argv, time_budget=time_budget,
+                      params=load_detector_params(params_path) if params_path else None)
+    else:
+        print(f"Directorul {cohort_dir} nu exista!")
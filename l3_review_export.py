@@ -0,0 +1,138 @@
+# l3_review_export.py - Pachet de revizuire (cel mai bun slice, limitele zonei Y3, top-K) compus cu OpenCV
+import os
+import numpy as np
+import cv2
+
+from l3_report_renderer import window_for_display, compose_light_report, draw_roi
+from l3_dicom_reader import read_dicom_slice
+
+REVIEW_FORMATS = ('png', 'tiff')
+BANNER_HEIGHT = 48
+
+
+def detector_display(detector, slice_idx):
+    """Imaginea de afișare a unui slice: din top-K-ul detectorului sau recitită de pe disc"""
+    data = detector.slice_data[slice_idx]
+    img = data.get('image')
+    if img is None:
+        _, pixels, _ = read_dicom_slice(os.path.join(detector.data_directory, data['filename']))
+        img = pixels.astype(np.float32)
+    return window_for_display(img)
+
+
+def compose_slice_page(img_display, title, subtitle, geometry, color=(0, 255, 0)):
+    """Slice-ul cu ROI-urile detectorului și un banner cu titlul și scorurile"""
+    h, w = img_display.shape[:2]
+    page = np.zeros((h + BANNER_HEIGHT, max(w, 360), 3), dtype=np.uint8)
+
+    overlay = cv2.cvtColor(img_display, cv2.COLOR_GRAY2BGR)
+    draw_roi(overlay, geometry.left_bounds, (128, 128, 128), 2)
+    draw_roi(overlay, geometry.right_bounds, (128, 128, 128), 2)
+    draw_roi(overlay, geometry.center_bounds, color, 2)
+    page[BANNER_HEIGHT:, :w] = overlay
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    cv2.putText(page, title, (10, 20), font, 0.6, color, 2, cv2.LINE_AA)
+    cv2.putText(page, subtitle, (10, 40), font, 0.45, (220, 220, 220), 1, cv2.LINE_AA)
+    return page
+
+
+def score_color(score):
+    return (0, 255, 0) if score > 60 else (0, 165, 255) if score > 40 else (0, 0, 255)
+
+
+def render_review_pages(detector, candidates, zone_bounds=None, get_display=None, top_k=10):
+    """
+    Paginile pachetului de revizuire, ca (nume, imagine BGR):
+    raportul rapid al celui mai bun slice, începutul și sfârșitul zonei Y3,
+    apoi fiecare candidat din top K cu ROI-urile suprapuse.
+    """
+    get_display = get_display or (lambda slice_idx: detector_display(detector, slice_idx))
+    pages = []
+    if not candidates:
+        return pages
+
+    best_idx, best_file, best_score, best_analysis = candidates[0]
+    img_display = get_display(best_idx)
+    pages.append(('best', compose_light_report(img_display, best_file, best_score, best_analysis,
+                                               [c[2] for c in candidates[:10]],
+                                               geometry=detector.get_geometry(img_display.shape))))
+
+    if zone_bounds is not None:
+        for name, slice_idx in zip(('zone_start', 'zone_end'), zone_bounds):
+            for idx, filename, score, analysis in detector.get_candidates([slice_idx]):
+                img_display = get_display(idx)
+                title = f"{name.replace('_', ' ').upper()}: slice {idx + 1} - {filename}"
+                subtitle = (f"Zona Y3: slice-uri {zone_bounds[0] + 1}-{zone_bounds[1] + 1} | "
+                            f"Score {score:.1f} | Coaste {analysis['ribs_detected']:.0f}")
+                pages.append((name, compose_slice_page(img_display, title, subtitle,
+                                                       detector.get_geometry(img_display.shape),
+                                                       color=(0, 165, 255))))
+
+    for rank, (idx, filename, score, analysis) in enumerate(candidates[:top_k], start=1):
+        img_display = get_display(idx)
+        title = f"#{rank}: slice {idx + 1} - {filename}"
+        subtitle = (f"Score {score:.1f} | Forma Y {analysis['y_shape_score']:.0f} | "
+                    f"Fara coaste {analysis['no_ribs_score']:.0f} | Coaste {analysis['ribs_detected']:.0f}")
+        pages.append((f"rank_{rank:02d}", compose_slice_page(img_display, title, subtitle,
+                                                             detector.get_geometry(img_display.shape),
+                                                             color=score_color(score))))
+    return pages
+
+
+def write_review_pages(pages, output_path, fmt='png'):
+    """
+    Scrie paginile: 'png' - câte un fișier în directorul output_path,
+    'tiff' - un singur TIFF cu mai multe pagini. Întoarce fișierele scrise.
+    """
+    if fmt not in REVIEW_FORMATS:
+        raise ValueError(f"Format necunoscut: {fmt} (acceptate: {', '.join(REVIEW_FORMATS)})")
+
+    if fmt == 'tiff':
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not cv2.imwritemulti(output_path, [page for _, page in pages]):
+            raise IOError(f"Nu s-a putut scrie {output_path}")
+        return [output_path]
+
+    os.makedirs(output_path, exist_ok=True)
+    written = []
+    for i, (name, page) in enumerate(pages):
+        path = os.path.join(output_path, f"{i:02d}_{name}.png")
+        cv2.imwrite(path, page)
+        written.append(path)
+    return written
+
+
+def export_review_package(detector, candidates, output_path, zone_bounds=None, fmt='png',
+                          get_display=None, top_k=10):
+    """Compune și scrie pachetul de revizuire pentru rezultatul unui detector"""
+    pages = render_review_pages(detector, candidates, zone_bounds, get_display, top_k)
+    return write_review_pages(pages, output_path, fmt)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from l3_y3_detector_anatomic import AnatomicL3Detector
+
+    parser = argparse.ArgumentParser(description="Pachet de revizuire Y3 (PNG sau TIFF multi-pagina)")
+    parser.add_argument("directory", nargs='?', default="data/images/")
+    parser.add_argument("--output", default="y3_review")
+    parser.add_argument("--format", choices=REVIEW_FORMATS, default='png')
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    detector = AnatomicL3Detector(args.directory)
+    detector.load_and_analyze_all_slices()
+    candidates = detector.find_best_y3_candidates()
+    sequence = detector.analyze_sequence()
+
+    start = time.perf_counter()
+    output = args.output
+    if args.format == 'tiff' and not output.endswith(('.tif', '.tiff')):
+        output += '.tif'
+    written = export_review_package(detector, candidates, output, zone_bounds=sequence['zone'],
+                                    fmt=args.format, top_k=args.top_k)
+    print(f"Pachet de revizuire: {len(written)} fisiere in {time.perf_counter() - start:.2f}s -> {output}")
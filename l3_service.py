@@ -0,0 +1,256 @@
+# l3_service.py - Serviciu asyncio cu front-end HTTP local pentru detectarea L3
+import io
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import zipfile
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from l3_y3_detector_anatomic import AnatomicL3Detector
+from l3_result_export import build_study_result
+from l3_study_selector import select_best_series, ordered_series_files
+
+
+def run_detection_job(data_directory, time_budget=None):
+    """
+    Rulează detectorul într-un proces worker și întoarce rezultatul ca dicționar.
+    Un export PACS poate conține mai multe serii (topograme, reconstrucții) - se analizează
+    doar seria axială CT aleasă de l3_study_selector, în ordinea ei cranial -> caudal.
+    Cu time_budget (secunde), un studiu blocat este oprit cu StudyTimeoutError.
+    """
+    start = time.perf_counter()
+
+    # Detectorul scrie progresul la stdout - nu îl amestecăm în logurile serviciului
+    with contextlib.redirect_stdout(io.StringIO()):
+        best, _ = select_best_series(data_directory)
+        if best is None:
+            raise ValueError("Nicio serie axiala CT potrivita")
+        detector = AnatomicL3Detector(data_directory, filenames=ordered_series_files(best), time_budget=time_budget)
+        detector.load_and_analyze_all_slices()
+
+        if len(detector.slice_data) == 0:
+            raise ValueError("Nu s-au gasit imagini valide")
+
+        candidates = detector.find_best_y3_candidates()
+
+    timings = dict(detector.timings, runtime_s=time.perf_counter() - start)
+    return build_study_result(detector, candidates, timings=timings)
+
+
+class L3DetectionService:
+    """
+    Serviciu de joburi: primește căi de studii sau arhive ZIP cu fișiere DICOM,
+    le pune într-o coadă limitată și rulează detecția într-un ProcessPool,
+    fără să blocheze event loop-ul.
+    """
+
+    def __init__(self, workers=2, queue_size=16, max_upload_mb=512, max_bundle_mb=4096, time_budget=None,
+                 job_ttl=3600.0, max_jobs=1000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_upload = max_upload_mb * 1024 * 1024
+        self.max_bundle = max_bundle_mb * 1024 * 1024  # Mărimea dezarhivată (protecție la "zip bomb")
+        self.time_budget = time_budget  # Secunde per job
+        self.job_ttl = job_ttl  # Secunde cât rămâne disponibil un job terminat
+        self.max_jobs = max_jobs
+
+        self.jobs = {}
+        self.queue = None
+        self.pool = None
+        self.dispatchers = []
+
+    async def start(self):
+        """Pornește pool-ul de procese și dispecerii de joburi"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.dispatchers = [asyncio.create_task(self.dispatch_loop()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Oprește dispecerii și pool-ul"""
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def prune_jobs(self):
+        """Uită joburile terminate mai vechi de job_ttl, apoi cele mai vechi peste max_jobs"""
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job['finished_at'] is not None),
+                          key=lambda job: job['finished_at'])
+        excess = len(self.jobs) - self.max_jobs
+        for job in finished:
+            if now - job['finished_at'] > self.job_ttl or excess > 0:
+                del self.jobs[job['job_id']]
+                excess -= 1
+
+    def submit(self, data_directory, cleanup_directory=None):
+        """Adaugă un job în coadă; ridică asyncio.QueueFull dacă serviciul e ocupat"""
+        self.prune_jobs()
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'status': 'queued',
+            'data_directory': data_directory,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        self.queue.put_nowait((job_id, cleanup_directory))
+        self.jobs[job_id] = job
+        return job
+
+    async def dispatch_loop(self):
+        """Preia joburi din coadă și le rulează în pool"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id, cleanup_directory = await self.queue.get()
+            job = self.jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            try:
+                job['result'] = await loop.run_in_executor(self.pool, run_detection_job, job['data_directory'],
+                                                           self.time_budget)
+                job['status'] = 'done'
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+            finally:
+                job['finished_at'] = time.time()
+                if cleanup_directory:
+                    shutil.rmtree(cleanup_directory, ignore_errors=True)
+                self.queue.task_done()
+
+    def extract_bundle(self, payload):
+        """
+        Extrage o arhivă ZIP cu fișiere DICOM într-un director temporar, păstrând subdirectoarele
+        (seria se alege la rulare). Ridică ValueError dacă arhiva dezarhivată depășește max_bundle.
+        """
+        directory = tempfile.mkdtemp(prefix="l3_job_")
+        try:
+            with zipfile.ZipFile(io.BytesIO(payload)) as bundle:
+                members = [member for member in bundle.infolist() if not member.is_dir()]
+                total = sum(member.file_size for member in members)
+                if total > self.max_bundle:
+                    raise ValueError(f"arhiva dezarhivata are {total / 2 ** 20:.0f} MB "
+                                     f"(maxim {self.max_bundle / 2 ** 20:.0f} MB)")
+                for member in members:
+                    # extract() elimină căile absolute și componentele '..'
+                    bundle.extract(member, directory)
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return directory
+
+    # --- HTTP ---
+
+    async def handle_connection(self, reader, writer):
+        """Un request HTTP/1.1 per conexiune"""
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if length > self.max_upload:
+                status, body = 413, {'error': 'payload too large'}
+            else:
+                payload = await reader.readexactly(length) if length else b''
+                status, body = await self.route(method, path, headers, payload)
+        except Exception as e:
+            status, body = 400, {'error': f'bad request: {e}'}
+
+        data = json.dumps(body).encode('utf-8')
+        reason = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+                  413: 'Payload Too Large', 503: 'Service Unavailable'}.get(status, '')
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode('latin-1') + data)
+        await writer.drain()
+        writer.close()
+
+    async def route(self, method, path, headers, payload):
+        """Rutele API-ului"""
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', 'queued': self.queue.qsize(), 'workers': self.workers}
+
+        if method == 'GET' and path == '/jobs':
+            self.prune_jobs()
+            return 200, {'jobs': [self.job_summary(job) for job in self.jobs.values()]}
+
+        if method == 'GET' and path.startswith('/jobs/'):
+            job = self.jobs.get(path[len('/jobs/'):])
+            if job is None:
+                return 404, {'error': 'job not found'}
+            return 200, job
+
+        if method == 'POST' and path == '/jobs':
+            cleanup_directory = None
+            if headers.get('content-type', '').startswith('application/zip'):
+                # Dezarhivarea rulează într-un fir separat - nu blocăm event loop-ul
+                loop = asyncio.get_running_loop()
+                try:
+                    data_directory = cleanup_directory = await loop.run_in_executor(
+                        None, self.extract_bundle, payload)
+                except (ValueError, zipfile.BadZipFile) as e:
+                    return 400, {'error': f'invalid bundle: {e}'}
+            else:
+                data_directory = json.loads(payload or b'{}').get('path')
+                if not data_directory or not os.path.isdir(data_directory):
+                    return 400, {'error': f'directory not found: {data_directory}'}
+
+            try:
+                job = self.submit(data_directory, cleanup_directory)
+            except asyncio.QueueFull:
+                if cleanup_directory:
+                    shutil.rmtree(cleanup_directory, ignore_errors=True)
+                return 503, {'error': 'queue full, retry later'}
+            return 202, self.job_summary(job)
+
+        return 404, {'error': 'not found'}
+
+    @staticmethod
+    def job_summary(job):
+        """Statusul jobului fără rezultatul complet"""
+        return {key: job[key] for key in ('job_id', 'status', 'submitted_at', 'finished_at', 'error')}
+
+
+async def serve(host="127.0.0.1", port=8765, workers=2, queue_size=16, time_budget=None):
+    """Pornește serviciul HTTP"""
+    service = L3DetectionService(workers=workers, queue_size=queue_size, time_budget=time_budget)
+    await service.start()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Serviciu L3 pe http://{host}:{port} ({workers} workeri)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviciu HTTP pentru detectarea L3")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--time-budget", type=float, default=None, help="secunde per job (oprire la depasire)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue_size, args.time_budget))
+    except KeyboardInterrupt:
+        print("\nServiciu oprit")
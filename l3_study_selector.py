@@ -0,0 +1,191 @@
+# l3_study_selector.py - Studii cu mai multe serii: indexare headere și alegerea seriei axiale potrivite
+import os
+import sys
+import numpy as np
+import pydicom
+
+from l3_y3_detector_anatomic import detect_y3_anatomic
+from l3_detector_config import load_detector_params
+
+# Doar tag-urile necesare pentru clasificarea seriilor (fără PixelData)
+HEADER_TAGS = ['SOPClassUID', 'SOPInstanceUID', 'SeriesInstanceUID', 'StudyInstanceUID', 'Modality',
+               'SeriesNumber', 'SeriesDescription', 'ImageType', 'ImageOrientationPatient',
+               'ImagePositionPatient', 'SliceThickness', 'ConvolutionKernel', 'InstanceNumber', 'Rows']
+
+# Modalități fără imagini utilizabile (rapoarte de doză, structured reports, prezentări)
+NON_IMAGE_MODALITIES = {'SR', 'PR', 'KO', 'DOC', 'REG', 'SEG', 'RTSTRUCT'}
+
+SOFT_KERNEL_HINTS = ('B20', 'B30', 'B31', 'B35', 'B40', 'BR3', 'BR4', 'I30', 'I31', 'I40', 'STANDARD',
+                     'SOFT', 'BODY', 'ABD', 'FC0', 'FC1', 'FC2')
+SHARP_KERNEL_HINTS = ('B50', 'B60', 'B70', 'B80', 'BR6', 'I70', 'BONE', 'LUNG', 'SHARP', 'EDGE', 'DETAIL',
+                      'FC5', 'FC8')
+
+
+def index_study(study_directory):
+    """Citește o singură dată headerele tuturor fișierelor și le grupează pe SeriesInstanceUID"""
+    series = {}
+    for root, _, files in os.walk(study_directory):
+        for file in files:
+            path = os.path.join(root, file)
+            try:
+                dicom = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+            except Exception:
+                continue  # Nu e fișier DICOM
+
+            series_uid = dicom.get('SeriesInstanceUID')
+            if series_uid is None:
+                continue
+
+            info = series.setdefault(str(series_uid), {
+                'series_uid': str(series_uid),
+                'study_uid': str(dicom.get('StudyInstanceUID', '')),
+                'series_number': dicom.get('SeriesNumber'),
+                'description': str(dicom.get('SeriesDescription', '')),
+                'modality': str(dicom.get('Modality', '')),
+                'image_type': [str(v).upper() for v in dicom.get('ImageType', [])],
+                'orientation': dicom.get('ImageOrientationPatient'),
+                'kernel': str(dicom.get('ConvolutionKernel', '')),
+                'thickness': float(dicom.SliceThickness) if dicom.get('SliceThickness') else None,
+                'files': []
+            })
+
+            position = dicom.get('ImagePositionPatient')
+            z = float(position[2]) if position is not None and len(position) == 3 else None
+            instance = int(dicom.InstanceNumber) if dicom.get('InstanceNumber') is not None else 0
+            has_pixels = dicom.get('Rows') is not None
+            info['files'].append((os.path.relpath(path, study_directory), z, instance, has_pixels))
+
+    return list(series.values())
+
+
+def is_axial(orientation, tolerance=0.9):
+    """Normala planului (produs vectorial al cosinusurilor) trebuie să fie aproape de axa z"""
+    if orientation is None or len(orientation) != 6:
+        return None
+    row = np.array(orientation[:3], dtype=float)
+    col = np.array(orientation[3:], dtype=float)
+    normal = np.cross(row, col)
+    norm = np.linalg.norm(normal)
+    return bool(norm > 0 and abs(normal[2]) / norm >= tolerance)
+
+
+def score_series(info):
+    """
+    Scor de potrivire pentru detectorul L3 (0-100) și motivele.
+    Criterii: orientare axială, kernel de țesut moale, grosimea slice-ului, acoperirea pe z.
+    """
+    reasons = []
+    image_files = [f for f in info['files'] if f[3]]
+
+    if info['modality'] in NON_IMAGE_MODALITIES or not image_files:
+        return 0, ['fara imagini']
+    if info['modality'] and info['modality'] != 'CT':
+        return 0, [f"modalitate {info['modality']}"]
+    if 'LOCALIZER' in info['image_type'] or 'SCOUT' in info['description'].upper():
+        return 0, ['localizer']
+    if len(image_files) < 10:
+        return 0, [f'prea putine slice-uri ({len(image_files)})']
+
+    axial = is_axial(info['orientation'])
+    if axial is False:
+        return 0, ['nu e axiala']
+
+    score = 40
+    reasons.append('axiala' if axial else 'orientare necunoscuta')
+
+    # Reformatările derivate sunt mai puțin sigure decât reconstrucția primară
+    if 'DERIVED' in info['image_type'] or 'SECONDARY' in info['image_type']:
+        score -= 10
+        reasons.append('derivata')
+
+    kernel = (info['kernel'] + ' ' + info['description']).upper()
+    if any(hint in kernel for hint in SHARP_KERNEL_HINTS):
+        score -= 15
+        reasons.append('kernel os/plaman')
+    elif any(hint in kernel for hint in SOFT_KERNEL_HINTS):
+        score += 15
+        reasons.append('kernel tesut moale')
+
+    thickness = info['thickness']
+    if thickness is not None:
+        if 2.0 <= thickness <= 5.0:
+            score += 20
+        elif 1.0 <= thickness < 2.0:
+            score += 12  # Corect, dar mai multe slice-uri de analizat
+        elif thickness < 1.0:
+            score += 5
+        reasons.append(f'grosime {thickness:g}mm')
+
+    z_values = [f[1] for f in image_files if f[1] is not None]
+    if len(z_values) > 1:
+        coverage = max(z_values) - min(z_values)
+        # L3 cere acoperire abdominală; 150mm+ e suficient pentru a include zona coastelor
+        score += 25 * min(coverage / 150.0, 1.0)
+        reasons.append(f'acoperire {coverage:.0f}mm')
+
+    return min(score, 100), reasons
+
+
+def rank_series(series):
+    """Seriile ordonate după scorul de potrivire"""
+    ranked = []
+    for info in series:
+        score, reasons = score_series(info)
+        ranked.append((score, info, reasons))
+    ranked.sort(key=lambda x: x[0], reverse=True)
+    return ranked
+
+
+def ordered_series_files(info):
+    """Fișierele seriei de la cranial la caudal (ordinea așteptată de detector)"""
+    files = [f for f in info['files'] if f[3]]
+    if all(f[1] is not None for f in files):
+        files.sort(key=lambda f: (-f[1], f[0]))
+    else:
+        files.sort(key=lambda f: (f[2], f[0]))
+    return [f[0] for f in files]
+
+
+def select_best_series(study_directory):
+    """Indexează studiul și întoarce (seria aleasă, clasamentul complet)"""
+    ranked = rank_series(index_study(study_directory))
+
+    print("Serii gasite in studiu:")
+    for score, info, reasons in ranked:
+        print(f"  [{score:5.1f}] #{info['series_number']} {info['description'][:30]:30s} "
+              f"{len(info['files']):4d} fisiere - {', '.join(reasons)}")
+
+    if not ranked or ranked[0][0] <= 0:
+        return None, ranked
+    return ranked[0][1], ranked
+
+
+def detect_y3_study(study_directory, report='figure', result_path=None, params=None):
+    """
+    Detectare Y3 pe un studiu cu mai multe serii: analizează doar seria cea mai potrivită.
+    params: profilul de parametri al detectorului (implicit DEFAULT_DETECTOR_PARAMS).
+    """
+    best, ranked = select_best_series(study_directory)
+    if best is None:
+        print("EROARE: Nicio serie axiala CT potrivita in studiu!")
+        return None
+
+    files = ordered_series_files(best)
+    total = sum(len(info['files']) for _, info, _ in ranked)
+    print(f"Serie aleasa: {best['description']} ({len(files)}/{total} fisiere, "
+          f"{100 * (1 - len(files) / total):.0f}% sarite)\n")
+
+    return detect_y3_anatomic(study_directory, report=report, result_path=result_path, filenames=files,
+                              params=params)
+
+
+if __name__ == "__main__":
+    # --params=PROFIL încarcă un profil de parametri JSON/YAML (ex. best_profile.json din tuning)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    params_path = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--params=')), None)
+    study_dir = args[0] if args else "data/study/"
+
+    if os.path.exists(study_dir):
+        detect_y3_study(study_dir, params=load_detector_params(params_path) if params_path else None)
+    else:
+        print(f"Directorul {study_dir} nu exista!")
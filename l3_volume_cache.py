@@ -0,0 +1,141 @@
+# l3_volume_cache.py - Cache de volum (indici HU) pentru afișare, atlasul de miniaturi și piramida pentru zoom
+import os
+import threading
+import numpy as np
+import cv2
+
+from l3_window_lut import hu_index, auto_window, window_lut, apply_lut
+from l3_dicom_reader import read_dicom_slice
+
+THUMBNAIL_SIZE = 64
+
+
+class SeriesVolumeCache:
+    """
+    Slice-urile seriei în HU, codate ca indici uint16 pentru LUT-urile de fereastră
+    (l3_window_lut), ținute într-un singur volum (n, h, w), plus fereastra automată
+    a fiecărui slice. Se umple în fundal cu load_all(); un slice cerut înainte
+    să fie încărcat este decodat la cerere.
+    """
+
+    def __init__(self, data_directory, filenames):
+        self.data_directory = data_directory
+        self.filenames = list(filenames)
+        self.volume = None
+        self.loaded = np.zeros(len(self.filenames), dtype=bool)
+        self.auto_windows = np.zeros((len(self.filenames), 2))
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def read_slice(self, slice_idx):
+        """Decodează un slice ca imagine de indici HU"""
+        dicom, pixels, _ = read_dicom_slice(os.path.join(self.data_directory, self.filenames[slice_idx]))
+        return hu_index(dicom, pixels)
+
+    def store(self, slice_idx, index):
+        with self.lock:
+            if self.volume is None:
+                h, w = index.shape
+                self.volume = np.zeros((len(self.filenames), h, w), dtype=np.uint16)
+            if index.shape != self.volume.shape[1:]:
+                # Slice-urile cu altă matrice sunt aduse la dimensiunea volumului
+                h, w = self.volume.shape[1:]
+                index = cv2.resize(index, (w, h), interpolation=cv2.INTER_AREA)
+            self.volume[slice_idx] = index
+            self.auto_windows[slice_idx] = auto_window(index)
+            self.loaded[slice_idx] = True
+
+    def get_index(self, slice_idx):
+        """Slice-ul ca indici HU (uint16); decodat acum dacă nu e încă în cache"""
+        if not self.loaded[slice_idx]:
+            self.store(slice_idx, self.read_slice(slice_idx))
+        return self.volume[slice_idx]
+
+    def get_auto_window(self, slice_idx):
+        """Fereastra automată (centru, lățime) a slice-ului, din percentilele 1-99"""
+        self.get_index(slice_idx)
+        center, width = self.auto_windows[slice_idx]
+        return float(center), float(width)
+
+    def get(self, slice_idx, window=None):
+        """Slice-ul de afișare (uint8) cu fereastra dată sau cu cea automată"""
+        index = self.get_index(slice_idx)
+        return apply_lut(index, window_lut(*(window or self.get_auto_window(slice_idx))))
+
+    def load_all(self, stop_event=None):
+        """Încarcă toate slice-urile lipsă (de rulat într-un fir de fundal)"""
+        for slice_idx in range(len(self.filenames)):
+            if stop_event is not None and stop_event.is_set():
+                return
+            if self.loaded[slice_idx]:
+                continue
+            try:
+                self.store(slice_idx, self.read_slice(slice_idx))
+            except Exception as e:
+                print(f"Eroare la {self.filenames[slice_idx]}: {e}")
+
+
+def block_mean_downsample(img, factor):
+    """Reducere prin media blocurilor factor x factor (marginile incomplete sunt tăiate)"""
+    if factor <= 1:
+        return img
+    h, w = img.shape[0] // factor * factor, img.shape[1] // factor * factor
+    blocks = img[:h, :w].reshape(h // factor, factor, w // factor, factor)
+    return blocks.mean(axis=(1, 3)).astype(img.dtype)
+
+
+def build_filmstrip_atlas(cache, tile=THUMBNAIL_SIZE, stop_event=None):
+    """
+    Atlasul filmstrip: miniaturile tuturor slice-urilor, una lângă alta,
+    într-o singură imagine uint8 (tile, n * tile), afișabilă ca o singură textură.
+    """
+    atlas = np.zeros((tile, len(cache) * tile), dtype=np.uint8)
+    for slice_idx in range(len(cache)):
+        if stop_event is not None and stop_event.is_set():
+            return None
+        try:
+            img = cache.get(slice_idx)
+        except Exception:
+            continue  # Slice ilizibil - rămâne negru în atlas
+
+        factor = int(np.ceil(max(img.shape) / tile))
+        thumb = block_mean_downsample(img, factor)[:tile, :tile]
+        th, tw = thumb.shape
+        y0, x0 = (tile - th) // 2, slice_idx * tile + (tile - tw) // 2
+        atlas[y0:y0 + th, x0:x0 + tw] = thumb
+    return atlas
+
+
+def build_pyramid(img, min_size=128):
+    """Nivelurile reduse ale unei imagini (fiecare la jumătate, prin media blocurilor 2x2)"""
+    levels = [img]
+    while min(levels[-1].shape[:2]) // 2 >= min_size:
+        levels.append(block_mean_downsample(levels[-1], 2))
+    return levels
+
+
+def pyramid_view(levels, xlim, ylim, out_pixels):
+    """
+    Porțiunea vizibilă din nivelul potrivit al piramidei pentru limitele date
+    (coordonate în imaginea completă) și lățimea de afișare în pixeli ecran.
+    Întoarce (data, extent) pentru AxesImage.set_data / set_extent.
+    """
+    h, w = levels[0].shape[:2]
+    x0, x1 = sorted(xlim)
+    y0, y1 = sorted(ylim)
+    x0, x1 = min(max(x0 + 0.5, 0), w), min(max(x1 + 0.5, 0), w)
+    y0, y1 = min(max(y0 + 0.5, 0), h), min(max(y1 + 0.5, 0), h)
+
+    # Cel mai mic nivel care are încă cel puțin un pixel per pixel de ecran
+    scale = max((x1 - x0) / max(out_pixels, 1), 1.0)
+    level = min(int(np.log2(scale)), len(levels) - 1)
+    data, factor = levels[level], 2 ** level
+
+    lh, lw = data.shape[:2]
+    lx0, lx1 = int(x0 // factor), min(int(np.ceil(x1 / factor)), lw)
+    ly0, ly1 = int(y0 // factor), min(int(np.ceil(y1 / factor)), lh)
+    lx1, ly1 = max(lx1, lx0 + 1), max(ly1, ly0 + 1)
+    extent = (lx0 * factor - 0.5, lx1 * factor - 0.5, ly1 * factor - 0.5, ly0 * factor - 0.5)
+    return data[ly0:ly1, lx0:lx1], extent
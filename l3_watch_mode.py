@@ -0,0 +1,256 @@
+# l3_watch_mode.py - Mod "watch": ingest DICOM în flux dintr-un director de aterizare
+import os
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+
+from l3_y3_detector_anatomic import AnatomicL3Detector
+from l3_result_export import build_study_result, write_study_json, study_json_name
+from l3_dicom_reader import read_dicom_slice, SliceReadError
+
+
+class SeriesState:
+    """
+    Starea unei serii care se află încă în curs de recepție.
+    Se păstrează doar analiza compactă a fiecărui slice, fără pixeli - scorul de poziție
+    (deci și top K) se cunoaște abia la finalizare, din analizele deja calculate.
+    """
+
+    def __init__(self, series_uid, study_uid, directory):
+        self.series_uid = series_uid
+        self.study_uid = study_uid
+        self.directory = directory
+        self.slices = []  # (sort_key, path, analysis, metadata)
+        self.pending = 0  # Slice-uri citite dar încă neanalizate
+        self.last_arrival = time.monotonic()
+
+
+class L3WatchMode:
+    """
+    Urmărește un director în care scannerele trimit studii și rulează
+    detectorul Y3 pe măsură ce sosesc fișierele.
+
+    Cititorii (pydicom) și evaluatorii (OpenCV) sunt separați printr-o coadă
+    limitată, deci citirea nu poate depăși analiza cu mai mult de
+    `queue_size` slice-uri decodate în memorie.
+    """
+
+    def __init__(self, watch_directory, quiet_period=5.0, poll_interval=0.5,
+                 readers=2, scorers=2, queue_size=32, on_result=None, output_dir=None):
+        self.watch_directory = watch_directory
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+        self.num_readers = readers
+        self.num_scorers = scorers
+        self.on_result = on_result or self.print_result
+        self.output_dir = output_dir  # JSON per serie, dacă e setat
+
+        self.path_queue = queue.Queue()
+        self.slice_queue = queue.Queue(maxsize=queue_size)
+        # Slice-urile sunt analizate înainte ca seria să fie completă, deci nu există
+        # un MIP al seriei pentru localizarea corpului - watch mode folosește ROI-urile fixe
+        self.detector = AnatomicL3Detector(watch_directory, params={'roi_mode': 'fixed'})
+
+        self.series = {}
+        self.finalized = set()  # Seriile deja finalizate - slice-urile întârziate sunt ignorate
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.seen_files = set()
+        self.file_sizes = {}  # Fișierele încă în curs de scriere
+
+    def start(self):
+        """Pornește firele de citire, analiză și finalizare"""
+        workers = [(self.watch_loop, 1), (self.reader_loop, self.num_readers),
+                   (self.scorer_loop, self.num_scorers), (self.finalize_loop, 1)]
+        for target, count in workers:
+            for _ in range(count):
+                thread = threading.Thread(target=target, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        """Oprește toate firele"""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+
+    def run_forever(self):
+        """Rulează până la Ctrl+C"""
+        self.start()
+        print(f"Urmaresc directorul {self.watch_directory} (Ctrl+C pentru oprire)")
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            print("\nOprire watch mode...")
+        finally:
+            self.stop()
+
+    def watch_loop(self):
+        """Detectează fișierele noi; un fișier e gata când mărimea nu se mai schimbă"""
+        while not self.stop_event.is_set():
+            try:
+                for root, _, files in os.walk(self.watch_directory):
+                    for file in files:
+                        if not file.lower().endswith('.dcm'):
+                            continue
+                        path = os.path.join(root, file)
+                        if path in self.seen_files:
+                            continue
+                        try:
+                            size = os.path.getsize(path)
+                        except OSError:
+                            continue
+
+                        # Scannerul poate încă scrie fișierul - așteaptă o trecere stabilă
+                        if size > 0 and self.file_sizes.get(path) == size:
+                            self.seen_files.add(path)
+                            del self.file_sizes[path]
+                            self.path_queue.put(path)
+                        else:
+                            self.file_sizes[path] = size
+            except Exception as e:
+                print(f"Eroare la scanarea directorului: {e}")
+
+            self.stop_event.wait(self.poll_interval)
+
+    def reader_loop(self):
+        """Citește și decodează fișierele, grupate după SeriesInstanceUID"""
+        while not self.stop_event.is_set():
+            try:
+                path = self.path_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+            try:
+                dicom, pixels, _ = read_dicom_slice(path)
+                img = pixels.astype(np.float32)
+            except SliceReadError as e:
+                print(f"Eroare la {path} [{e.category}]: {e}")
+                continue
+
+            metadata = AnatomicL3Detector.get_slice_metadata(dicom)
+            series_uid = metadata['series_uid'] or os.path.dirname(path)
+            sort_key = self.get_sort_key(dicom, path)
+
+            with self.lock:
+                if series_uid in self.finalized:
+                    print(f"Slice sosit dupa finalizarea seriei {series_uid}, ignorat: {path}")
+                    continue
+                state = self.series.get(series_uid)
+                if state is None:
+                    state = SeriesState(series_uid, metadata['study_uid'], os.path.dirname(path))
+                    self.series[series_uid] = state
+                    print(f"Serie noua: {series_uid}")
+                state.pending += 1
+                state.last_arrival = time.monotonic()
+
+            # Coada limitată blochează cititorul dacă evaluatorii rămân în urmă
+            self.slice_queue.put((series_uid, path, sort_key, img, metadata))
+
+    def scorer_loop(self):
+        """Calculează criteriile de imagine imediat ce un slice e decodat"""
+        while not self.stop_event.is_set():
+            try:
+                series_uid, path, sort_key, img, metadata = self.slice_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+            try:
+                analysis = self.detector.analyze_image_criteria(img)
+                analysis.pop('windowed_image', None)
+            except Exception as e:
+                print(f"Eroare la analiza {path}: {e}")
+                analysis = None
+
+            with self.lock:
+                state = self.series[series_uid]
+                if analysis is not None:
+                    state.slices.append((sort_key, path, analysis, metadata))
+                state.pending -= 1
+                state.last_arrival = time.monotonic()
+
+    def finalize_loop(self):
+        """Finalizează seriile care nu au mai primit slice-uri de `quiet_period` secunde"""
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            ready = []
+            with self.lock:
+                for series_uid, state in list(self.series.items()):
+                    if state.pending == 0 and now - state.last_arrival >= self.quiet_period:
+                        ready.append(self.series.pop(series_uid))
+                        self.finalized.add(series_uid)
+
+            for state in ready:
+                try:
+                    result = self.finalize_series(state)
+                    if result is not None:
+                        if self.output_dir:
+                            write_study_json(result, os.path.join(self.output_dir, study_json_name(result)))
+                        self.on_result(result)
+                except Exception as e:
+                    print(f"Eroare la finalizarea seriei {state.series_uid}: {e}")
+
+            self.stop_event.wait(min(self.poll_interval, self.quiet_period / 4))
+
+    def finalize_series(self, state):
+        """Ordonează slice-urile, recalculează poziția și alege Y3 (fără a reciti pixelii)"""
+        if not state.slices:
+            return None
+
+        state.slices.sort(key=lambda s: s[0])
+
+        detector = AnatomicL3Detector(state.directory, params=self.detector.config)
+        detector.total_files = len(state.slices)
+        detector.reserve_scores(len(state.slices))
+        for slice_idx, (_, path, analysis, metadata) in enumerate(state.slices):
+            analysis = detector.complete_analysis(analysis, slice_idx, os.path.basename(path))
+            detector.store_slice(slice_idx, os.path.basename(path), None, analysis, metadata)
+
+        candidates = detector.find_best_y3_candidates()
+        return build_study_result(detector, candidates, timings={
+            'latency_s': time.monotonic() - state.last_arrival
+        })
+
+    @staticmethod
+    def get_sort_key(dicom, path):
+        """Ordinea slice-urilor: poziția z, apoi InstanceNumber, apoi numele fișierului"""
+        position = dicom.get('ImagePositionPatient')
+        if position is not None and len(position) == 3:
+            # Cranial -> caudal, ca ordinea fișierelor folosită de detector
+            return (0, -float(position[2]), os.path.basename(path))
+        instance = dicom.get('InstanceNumber')
+        if instance is not None:
+            return (1, int(instance), os.path.basename(path))
+        return (2, 0, os.path.basename(path))
+
+    @staticmethod
+    def print_result(result):
+        """Afișează rezultatul unei serii finalizate"""
+        chosen = result['chosen_slice']
+        print(f"\nREZULTAT SERIE {result['series_uid']}:")
+        print(f"Y3 detectat în: {chosen['filename']} (slice {chosen['slice_index'] + 1}/{result['num_slices']})")
+        print(f"Score: {chosen['y3_score']:.1f} (ROI {result['roi_mode']})")
+        print(f"Latenta dupa ultimul slice: {result['timings']['latency_s']:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detector Y3 in mod watch")
+    parser.add_argument("directory", nargs="?", default="data/incoming/")
+    parser.add_argument("--quiet", type=float, default=5.0, help="secunde fara slice-uri noi pana la finalizare")
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--scorers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--output-dir", default=None, help="director pentru rezultatele JSON")
+    args = parser.parse_args()
+
+    if os.path.exists(args.directory):
+        L3WatchMode(args.directory, quiet_period=args.quiet, readers=args.readers,
+                    scorers=args.scorers, queue_size=args.queue_size,
+                    output_dir=args.output_dir).run_forever()
+    else:
+        print(f"Directorul {args.directory} nu exista!")
@@ -0,0 +1,65 @@
+# l3_window_lut.py - Window/level prin tabele de căutare (LUT) 16-bit -> 8-bit pentru GUI și convertor
+from collections.abc import Sequence
+from functools import lru_cache
+import numpy as np
+
+# Imaginile sunt ținute ca indici uint16 = HU + LUT_OFFSET; un LUT are o intrare pentru fiecare indice
+LUT_OFFSET = 32768
+LUT_SIZE = 65536
+
+# Ferestre clinice (centru, lățime) în HU
+WINDOW_PRESETS = {
+    'soft_tissue': (40, 400),
+    'abdomen': (60, 350),
+    'bone': (400, 1800),
+    'lung': (-600, 1500)
+}
+
+
+def rescale_parameters(dicom):
+    """RescaleSlope / RescaleIntercept din header (1, 0 dacă lipsesc)"""
+    return float(dicom.get('RescaleSlope', 1) or 1), float(dicom.get('RescaleIntercept', 0) or 0)
+
+
+def hu_index(dicom, pixels=None):
+    """Pixelii unui slice convertiți în HU și codați ca indici uint16 pentru LUT"""
+    pixels = dicom.pixel_array if pixels is None else pixels
+    slope, intercept = rescale_parameters(dicom)
+    if slope == 1 and intercept == int(intercept) and pixels.dtype.kind in 'iu':
+        hu = pixels.astype(np.int32) + int(intercept)  # Cazul obișnuit, fără float
+    else:
+        hu = np.rint(pixels * slope + intercept)
+    return (np.clip(hu, -LUT_OFFSET, LUT_SIZE - LUT_OFFSET - 1) + LUT_OFFSET).astype(np.uint16)
+
+
+@lru_cache(maxsize=64)
+def window_lut(center, width):
+    """Tabelul indice -> uint8 pentru fereastra (centru, lățime) în HU"""
+    width = max(float(width), 1.0)
+    low = center - width / 2
+    hu = np.arange(LUT_SIZE, dtype=np.float64) - LUT_OFFSET
+    lut = (np.clip((hu - low) / width, 0, 1) * 255).astype(np.uint8)
+    lut.flags.writeable = False  # Partajat prin cache
+    return lut
+
+
+def apply_lut(index, lut):
+    """Aplică fereastra: un singur np.take pe imaginea de indici"""
+    return np.take(lut, index)
+
+
+def auto_window(index, low_percentile=1, high_percentile=99):
+    """Fereastra automată din percentile (echivalentul auto-windowing-ului 1-99%)"""
+    p_low, p_high = np.percentile(index, [low_percentile, high_percentile]) - LUT_OFFSET
+    return float((p_low + p_high) / 2), float(max(p_high - p_low, 1.0))
+
+
+def header_window(dicom, default=WINDOW_PRESETS['soft_tissue']):
+    """Fereastra din WindowCenter / WindowWidth (prima valoare dacă sunt mai multe)"""
+    def first(value):
+        return value[0] if isinstance(value, Sequence) and not isinstance(value, str) else value
+
+    try:
+        return float(first(dicom.WindowCenter)), float(first(dicom.WindowWidth))
+    except Exception:
+        return default
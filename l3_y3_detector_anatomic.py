@@ -1,10 +1,411 @@
 # l3_y3_detector_anatomic.py - Detector Y3 bazat pe criterii anatomice precise
 import os
+import time
+import heapq
 import numpy as np
-import pydicom
 import cv2
-import matplotlib.pyplot as plt
-from scipy import ndimage
+
+from l3_detector_config import as_detector_config, load_detector_params
+from l3_dicom_reader import (read_dataset, read_dicom_slice, error_record, summarize_errors, SliceReadError,
+                             StudyTimeoutError, ANALYSIS_ERROR, TIMEOUT)
+
+# Funcțiile de scor lucrează element cu element, deci servesc și pentru un singur slice
+# și pentru tablouri întregi de slice-uri (re-scorare vectorizată la tuning)
+
+def tier_score(values, tiers, inclusive=True):
+    """Punctele primului interval [min, max] care conține valoarea"""
+    values = np.asarray(values, dtype=np.float64)
+    conditions, points = [], []
+    for low, high, score in tiers:
+        if inclusive:
+            conditions.append((values >= low) & (values <= high))
+        else:
+            conditions.append((values > low) & (values < high))
+        points.append(score)
+    return np.select(conditions, points, default=0)
+
+
+def score_y_shape(area, circularity, aspect_ratio, params):
+    """Scorul formei Y din caracteristicile conturului principal"""
+    area = np.asarray(area, dtype=np.float64)
+    y_score = (tier_score(circularity, params['y_circularity_tiers']) +
+               tier_score(aspect_ratio, params['y_aspect_tiers']) +
+               tier_score(area, params['y_area_tiers'], inclusive=False))
+    return np.where(area < params['min_y_area'], 0, np.minimum(y_score, 100))
+
+
+def y_characteristics(contour, area):
+    """Caracteristicile formei Y ale unui contur: aria, circularitatea și alungirea (h/w)"""
+    perimeter = cv2.arcLength(contour, True)
+    if perimeter == 0:
+        return 0.0, 0.0, 0.0
+    circularity = 4 * np.pi * area / (perimeter ** 2)
+    _, _, w, h = cv2.boundingRect(contour)
+    return float(area), float(circularity), float(h / w if w > 0 else 0)
+
+
+def y_shape_features_batch(crops, threshold, kernel):
+    """
+    Aria, circularitatea și alungirea celui mai mare contur din fiecare zonă centrală,
+    pentru un teanc de zone (n, h, w) uint8 - rezultat (n, 3).
+    Zonele sunt așezate una lângă alta într-un mozaic, cu o coloană de separare de lățimea
+    razei kernel-ului: pragul, cele două treceri de morfologie și findContours rulează
+    o singură dată pe tot teancul. Separatorul e pus pe 0 înainte de dilatare și pe 255
+    înainte de eroziune, deci marginile zonelor se comportă exact ca marginile unei imagini.
+    """
+    n, h, w = crops.shape
+    features = np.zeros((n, 3))
+    if n == 0 or h == 0 or w == 0:
+        return features
+
+    gap = max(kernel.shape[0] // 2, kernel.shape[1] // 2, 1)
+    pitch = w + gap
+    mosaic = np.zeros((h, n * pitch), dtype=np.uint8)
+    tiles = mosaic.reshape(h, n, pitch)
+    tiles[:, :, :w] = crops.transpose(1, 0, 2)
+    separator = tiles[:, :, w:]
+
+    # Threshold pentru structuri dense, apoi închidere (dilatare + eroziune) și deschidere (eroziune + dilatare)
+    cv2.threshold(mosaic, threshold, 255, cv2.THRESH_BINARY, dst=mosaic)
+    for morphology, fill in ((cv2.dilate, 0), (cv2.erode, 255), (cv2.erode, 255), (cv2.dilate, 0)):
+        separator[...] = fill
+        morphology(mosaic, kernel, dst=mosaic)
+    separator[...] = 0
+
+    # Cel mai mare contur din fiecare zonă (primul, la egalitate - ca max() pe contururile unei zone)
+    contours, _ = cv2.findContours(mosaic, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    best_area = np.full(n, -1.0)
+    best = [None] * n
+    for contour in contours:
+        tile = contour[0, 0, 0] // pitch
+        if best[tile] is not None and len(contour) <= 2:
+            continue  # Punct sau segment: aria 0, nu poate depăși conturul deja ales
+        area = cv2.contourArea(contour)
+        if area > best_area[tile]:
+            best_area[tile], best[tile] = area, contour
+
+    for tile, contour in enumerate(best):
+        if contour is not None:
+            features[tile] = y_characteristics(contour, best_area[tile])
+    return features
+
+
+def is_rib_candidate(area, aspect_ratio, mean_intensity, params):
+    """Criterii FOARTE STRICTE pentru coaste: dimensiune, alungire și densitate"""
+    area = np.asarray(area, dtype=np.float64)
+    aspect_ratio = np.asarray(aspect_ratio, dtype=np.float64)
+    return ((area > params['rib_area'][0]) & (area < params['rib_area'][1]) &
+            (aspect_ratio > params['rib_aspect'][0]) & (aspect_ratio < params['rib_aspect'][1]) &
+            (np.asarray(mean_intensity) > params['rib_min_intensity']))
+
+
+def score_no_ribs(total_ribs, params):
+    """Scorul pentru ABSENȚA coastelor"""
+    total_ribs = np.asarray(total_ribs)
+    return np.select([total_ribs <= limit for limit, _ in params['rib_count_scores']],
+                     [score for _, score in params['rib_count_scores']], default=0)
+
+
+def vertebra_quality_from_histogram(hist, dense_threshold):
+    """
+    Calitatea vertebrei din histograma (256 bini) a zonei centrale:
+    densitatea pixelilor peste prag și uniformitatea lor.
+    Acceptă o histogramă (256,) sau un teanc de histograme (n, 256).
+    """
+    hist = np.asarray(hist, dtype=np.float64)
+    values = np.arange(256, dtype=np.float64)
+    dense = hist[..., dense_threshold + 1:]
+    dense_values = values[dense_threshold + 1:]
+
+    total_pixels = hist.sum(axis=-1)
+    dense_pixels = dense.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (dense * dense_values).sum(axis=-1) / dense_pixels
+        variance = (dense * dense_values ** 2).sum(axis=-1) / dense_pixels - mean ** 2
+        density_ratio = np.where(total_pixels > 0, dense_pixels / total_pixels, 0)
+    uniformity = np.where(dense_pixels > 0, 100 - np.sqrt(np.maximum(variance, 0)), 0)
+
+    quality = np.minimum(density_ratio * 50 + uniformity * 0.5, 100)
+    return np.where(total_pixels > 0, quality, 0)
+
+
+def combine_scores(no_ribs, y_shape, position, quality, weights):
+    """Scorul Y3 final - prioritate pe absența coastelor"""
+    return (np.asarray(no_ribs) * weights['no_ribs'] +
+            np.asarray(y_shape) * weights['y_shape'] +
+            np.asarray(position) * weights['position'] +
+            np.asarray(quality) * weights['quality'])
+
+
+def read_hu_image(path):
+    """Citește un slice în unități Hounsfield (RescaleSlope/Intercept)"""
+    dicom, pixels, _ = read_dicom_slice(path)
+    slope = float(dicom.get('RescaleSlope', 1) or 1)
+    intercept = float(dicom.get('RescaleIntercept', 0) or 0)
+    return pixels.astype(np.float32) * slope + intercept
+
+
+def localize_body(images, params):
+    """
+    Corpul pacientului și poziția coloanei din MIP-ul redus al câtorva slice-uri HU.
+    Întoarce (y0, y1, x0, x1, spine_y, spine_x) în pixeli de imagine sau None.
+    """
+    h, w = images[0].shape
+    scale = min(params['body_mip_size'] / max(h, w), 1.0)
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    mip = np.max([cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+                  for img in images if img.shape == (h, w)], axis=0)
+
+    # Corpul = cea mai mare componentă conexă de țesut (masa, cablurile și aerul rămân pe dinafară)
+    body_mask = (mip > params['body_hu_threshold']).astype(np.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(body_mask)
+    if count < 2:
+        return None
+    body_label = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    x, y, bw, bh, area = stats[body_label]
+    if area < 0.05 * mip.size:
+        return None
+
+    # Coloana: osul din treimea centrală și jumătatea posterioară a corpului
+    sy0, sx0, sx1 = y + bh // 2, x + bw // 3, x + 2 * bw // 3
+    search = (mip[sy0:y + bh, sx0:sx1] > params['bone_hu_threshold']) & (labels[sy0:y + bh, sx0:sx1] == body_label)
+    ys, xs = np.nonzero(search)
+    if len(ys) == 0:
+        return None
+
+    spine_y = (np.median(ys) + sy0 + 0.5) / scale
+    spine_x = (np.median(xs) + sx0 + 0.5) / scale
+    return (int(y / scale), min(int(np.ceil((y + bh) / scale)), h),
+            int(x / scale), min(int(np.ceil((x + bw) / scale)), w),
+            int(spine_y), int(spine_x))
+
+
+def default_zone_bounds(num_slices):
+    """Zona Y3 implicită: ultimele 15% din slice-uri"""
+    if num_slices == 0:
+        return None, None
+    return int(num_slices * 0.85), num_slices - 1
+
+
+def smooth_along_z(values, window):
+    """
+    Media mobilă pe axa slice-urilor (axa 0), ignorând valorile NaN (slice-uri eșuate).
+    Acceptă o coloană (n,) sau tot tabelul de scoruri (n, k).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    half = max(int(window), 1) // 2
+    window = 2 * half + 1
+
+    valid = ~np.isnan(values)
+    padding = [(half + 1, half)] + [(0, 0)] * (values.ndim - 1)
+    sums = np.cumsum(np.pad(np.where(valid, values, 0), padding), axis=0)
+    counts = np.cumsum(np.pad(valid.astype(np.float64), padding), axis=0)
+    sums = sums[window:] - sums[:-window]
+    counts = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def rib_presence(no_ribs_scores, params):
+    """1 pentru slice-urile cu cel puțin o coastă candidată, 0 fără coaste, NaN pentru slice-urile eșuate"""
+    no_ribs_scores = np.asarray(no_ribs_scores, dtype=np.float64)
+    rib_free_score = float(score_no_ribs(0, params))
+    return np.where(np.isnan(no_ribs_scores), np.nan, (no_ribs_scores < rib_free_score).astype(np.float64))
+
+
+def find_rib_termination(rib_fraction, max_fraction):
+    """
+    Primul slice după care fracția netezită a slice-urilor cu coaste rămâne cel mult
+    max_fraction (None dacă nu există). Chiar și o singură coastă (coastele flotante) contează.
+    """
+    with_ribs = np.flatnonzero(~(rib_fraction <= max_fraction))  # NaN contează ca "cu coaste"
+    if len(with_ribs) == 0:
+        return 0
+    if with_ribs[-1] + 1 >= len(rib_fraction):
+        return None
+    return int(with_ribs[-1] + 1)
+
+
+def find_disc_minima(signal, min_separation, prominence):
+    """
+    Discurile intervertebrale: minimele locale ale densității zonei centrale de-a lungul lui z,
+    la cel puțin min_separation slice-uri unul de altul și cu cel puțin `prominence`
+    sub corpurile vertebrale din ambele părți
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    if len(signal) < 3 or np.all(np.isnan(signal)):
+        return np.zeros(0, dtype=int)
+    filled = np.where(np.isnan(signal), np.nanmax(signal), signal)  # Slice-urile eșuate nu sunt discuri
+    half = max(int(min_separation) // 2, 1)
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(filled, half, mode='edge'), 2 * half + 1)
+    depth = np.minimum(windows[:, :half].max(axis=1), windows[:, half + 1:].max(axis=1)) - filled
+    is_minimum = (filled == windows.min(axis=1)) & (depth >= prominence)
+    is_minimum[[0, -1]] = False  # Capetele seriei nu pot fi încadrate de două corpuri
+
+    discs = []
+    candidates = np.flatnonzero(is_minimum)
+    for idx in candidates[np.argsort(filled[candidates], kind='stable')]:
+        if all(abs(idx - disc) >= min_separation for disc in discs):
+            discs.append(idx)
+    return np.sort(np.array(discs, dtype=int))
+
+
+def fill_disc_gaps(discs, step):
+    """Discurile ratate (goluri de mai mulți pași vertebrali) interpolate; întoarce (poziții, detectat)"""
+    positions, detected = [float(discs[0])], [True]
+    for disc in discs[1:]:
+        start = positions[-1]
+        parts = max(int(round((disc - start) / step)), 1)
+        for k in range(1, parts + 1):
+            positions.append(start + (disc - start) * k / parts)
+            detected.append(k == parts)
+    return np.array(positions), np.array(detected)
+
+
+def label_vertebral_levels(signal, rib_termination, step, prominence, l3_anchor=None, anchor_source='chosen_l3'):
+    """
+    Etichetează T12-L5 pe intervale de slice-uri (ordinea seriei, cranial -> caudal).
+    Corpurile vertebrale sunt intervalele dintre discuri. Cu l3_anchor (slice-ul L3 ales),
+    L3 este vertebra care îl conține și celelalte niveluri se numără de la ea; altfel T12
+    este vertebra care conține ultimul slice cu coaste.
+    Când ambele există, 'rib_level' e nivelul în care cade ultimul slice cu coaste, iar
+    'consistent' spune dacă acesta e T12 (False = L3 ales și coastele nu se potrivesc).
+    Limitele nedetectate se extrapolează cu pasul vertebral `step` (în slice-uri).
+    """
+    n = len(signal)
+    if l3_anchor is not None:
+        anchor, anchor_level = l3_anchor, VERTEBRAL_LEVELS.index('L3')
+    elif rib_termination:
+        anchor, anchor_level, anchor_source = rib_termination - 1, 0, 'ribs'
+    else:
+        return None
+
+    discs = find_disc_minima(signal, 0.6 * step, prominence)
+    gaps = np.diff(discs)
+    regular = gaps[(gaps > 0.6 * step) & (gaps < 1.6 * step)]
+    if len(regular):
+        step = float(np.median(regular))  # Pasul real al pacientului
+
+    if len(discs):
+        positions, detected = fill_disc_gaps(discs, step)
+    elif anchor_source == 'ribs':
+        positions, detected = np.array([anchor + 0.5]), np.array([False])  # T12 se termină odată cu coastele
+    else:
+        positions, detected = np.array([anchor + step / 2]), np.array([False])
+
+    def boundary(j):
+        """Poziția limitei j (extrapolată în afara discurilor cunoscute) și dacă a fost detectată"""
+        if j < 0:
+            return positions[0] + j * step, False
+        if j >= len(positions):
+            return positions[-1] + (j - len(positions) + 1) * step, False
+        return positions[j], bool(detected[j])
+
+    lower_of_anchor = int(np.searchsorted(positions, anchor))
+    levels = {}
+    for level_idx, level in enumerate(VERTEBRAL_LEVELS):
+        j = lower_of_anchor + level_idx - anchor_level
+        (upper, upper_found), (lower, lower_found) = boundary(j - 1), boundary(j)
+        start, end = int(np.floor(upper)) + 1, int(np.ceil(lower)) - 1
+        if end < 0 or start > n - 1 or end < start:
+            levels[level] = None  # În afara seriei
+            continue
+        first, last = max(start, 0), min(end, n - 1)
+        levels[level] = {
+            'start': first,
+            'end': last,
+            'center': (first + last) // 2,
+            'complete': first == start and last == end,
+            'source': 'discs' if upper_found and lower_found else 'extrapolated'
+        }
+
+    # Verificarea cu coastele: ultimul slice cu coaste ar trebui să cadă în T12
+    rib_level, consistent = None, None
+    if rib_termination and anchor_source != 'ribs':
+        rib_level_idx = int(np.searchsorted(positions, rib_termination - 1)) - lower_of_anchor + anchor_level
+        rib_level = VERTEBRAL_LEVELS[rib_level_idx] if 0 <= rib_level_idx < len(VERTEBRAL_LEVELS) else None
+        consistent = rib_level_idx == 0
+
+    return {'levels': levels, 'anchor': anchor_source, 'discs': [int(d) for d in discs], 'step_slices': step,
+            'rib_level': rib_level, 'consistent': consistent}
+
+
+def peak_zone(y3_smoothed, start, tolerance):
+    """Vârful scorului netezit după `start` și intervalul contiguu din jurul lui aflat în toleranță"""
+    segment = y3_smoothed[start:]
+    if len(segment) == 0 or np.all(np.isnan(segment)):
+        return None, (None, None)
+    peak = start + int(np.nanargmax(segment))
+    outside = np.flatnonzero(~(y3_smoothed >= y3_smoothed[peak] - tolerance))
+    zone_start = outside[outside < peak].max() + 1 if np.any(outside < peak) else 0
+    zone_end = outside[outside > peak].min() - 1 if np.any(outside > peak) else len(y3_smoothed) - 1
+    return peak, (int(max(zone_start, start)), int(zone_end))
+
+
+def progression_quality(scores):
+    """
+    Calitatea formării Y3 într-o zonă (0-100): proporția creșterilor de la un slice
+    la următorul (70%) și stabilitatea scorurilor (30%)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    scores = scores[~np.isnan(scores)]
+    if len(scores) < 2:
+        return 0.0
+    if len(scores) < 3:
+        return 50.0  # Progresie limitată
+    progression_ratio = np.mean(np.diff(scores) > 0)
+    stability_factor = max(0.0, 1 - np.var(scores) / 1000)  # Normalizat
+    return float((progression_ratio * 0.7 + stability_factor * 0.3) * 100)
+
+
+# Slice-uri analizate împreună în procesul curent (forma Y calculată pe tot blocul)
+ANALYSIS_BATCH_SIZE = 16
+
+# Nivelurile etichetate de label_vertebral_levels, cranial -> caudal
+VERTEBRAL_LEVELS = ('T12', 'L1', 'L2', 'L3', 'L4', 'L5')
+DEFAULT_SLICE_SPACING_MM = 5.0  # Când seria nu are poziții sau SliceThickness
+
+# Coloanele tabelului vectorizat de scoruri (un rând per slice)
+SCORE_COLUMNS = ('y3_score', 'y_shape_score', 'no_ribs_score', 'position_score', 'vertebra_quality',
+                 'central_density')
+COMPACT_ANALYSIS_KEYS = SCORE_COLUMNS + ('ribs_detected',)
+
+# Headerul seriei păstrat din primul slice (pacient, studiu, geometrie) - pentru ieșirile DICOM
+SERIES_HEADER_TAGS = ('PatientName', 'PatientID', 'PatientBirthDate', 'PatientSex', 'StudyInstanceUID',
+                      'StudyDate', 'StudyTime', 'StudyID', 'AccessionNumber', 'ReferringPhysicianName',
+                      'StudyDescription', 'SeriesInstanceUID', 'SeriesNumber', 'Modality', 'SOPClassUID',
+                      'FrameOfReferenceUID', 'ImageOrientationPatient', 'PixelSpacing', 'SliceThickness',
+                      'RescaleSlope', 'RescaleIntercept')
+
+
+class TopKSelector:
+    """
+    Păstrează doar cei mai buni K candidați pe măsură ce slice-urile sunt analizate
+    (min-heap de mărime K), fără a sorta toată seria.
+    La scoruri egale câștigă slice-ul cu indexul mai mic, ca la sortarea stabilă.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []  # (score, -slice_idx)
+
+    def push(self, slice_idx, score):
+        """Adaugă un slice; întoarce indexul slice-ului eliminat din top (sau None)"""
+        item = (score, -slice_idx)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+            return None
+        if item > self.heap[0]:
+            _, evicted = heapq.heapreplace(self.heap, item)
+            return -evicted
+        return slice_idx
+
+    def __contains__(self, slice_idx):
+        return any(-neg_idx == slice_idx for _, neg_idx in self.heap)
+
+    def ranked(self):
+        """Indicii din top, de la cel mai bun la cel mai slab"""
+        return [-neg_idx for _, neg_idx in sorted(self.heap, key=lambda x: (-x[0], -x[1]))]
 
 
 class AnatomicL3Detector:
@@ -13,123 +414,409 @@ class AnatomicL3Detector:
     Y3 = Forma Y în centru + ABSENȚA COMPLETĂ a coastelor laterale
     """
 
-    def __init__(self, data_directory):
+    def __init__(self, data_directory, top_k=10, filenames=None, params=None, time_budget=None):
         self.data_directory = data_directory
+        self.config = as_detector_config(params)  # DetectorConfig sau dicționar de parametri
+        self.params = self.config.params
+        self.filenames = filenames  # Lista explicită de fișiere (relative la director), în ordinea seriei
         self.slice_data = {}
-
-    def load_and_analyze_all_slices(self):
-        """Încarcă și analizează toate slice-urile"""
+        self.top_k = top_k
+        self.selector = TopKSelector(top_k)
+        self.score_table = np.full((0, len(SCORE_COLUMNS)), np.nan, dtype=np.float32)
+        self.total_files = None  # Numărul de slice-uri din serie (pentru scorul de poziție)
+        self.body = None  # Corpul și coloana localizate pe serie (modul 'body')
+        self.study_uid = None
+        self.series_uid = None
+        self.series_header = None  # Tag-urile SERIES_HEADER_TAGS din primul slice
+        self.timings = {}
+        self.time_budget = time_budget  # Secunde per studiu; depășirea oprește analiza (StudyTimeoutError)
+        self.deadline = None
+        self.errors = []  # Înregistrările error_record per slice și per studiu
+        self.status = None  # 'ok', 'partial', 'failed' sau 'timeout'
+
+    def load_and_analyze_all_slices(self, workers=None):
+        """
+        Încarcă și analizează toate slice-urile.
+        Cu workers > 1, slice-urile sunt decodate și analizate în procese separate
+        care scriu direct într-un volum din memoria partajată.
+        Slice-urile eșuate sunt înregistrate în self.errors, pe categorii; cu time_budget,
+        un studiu care depășește bugetul este oprit cu StudyTimeoutError. Bugetul rulează
+        mereu în procese worker (cel puțin unul), ca o decodare blocată să poată fi oprită.
+        """
         print("Analizez toate slice-urile pentru criteriul anatomic Y3...")
 
+        dicom_files = self.series_files()
+        self.total_files = len(dicom_files)
+        self.reserve_scores(len(dicom_files))
+        print(f"Gasit {len(dicom_files)} fisiere DICOM")
+
+        start = time.perf_counter()
+        self.deadline = None if self.time_budget is None else start + self.time_budget
+
+        if (workers and workers > 1 or self.time_budget is not None) and len(dicom_files) > 0:
+            roi_time, read_time, analysis_time = self.analyze_slices_parallel(dicom_files, max(workers or 1, 1))
+        else:
+            if self.params['roi_mode'] == 'body':
+                self.body = self.localize_series_body(dicom_files)
+            roi_time = time.perf_counter() - start
+            read_time, analysis_time = self.analyze_slices(dicom_files)
+
+        self.timings = {
+            'roi_s': roi_time,
+            'read_s': read_time,
+            'analysis_s': analysis_time,
+            'total_s': time.perf_counter() - start
+        }
+        failed = summarize_errors(self.errors)['num_errors']
+        self.status = 'failed' if not self.slice_data else 'partial' if failed else 'ok'
+        print(f"Analizat {len(self.slice_data)} slice-uri" + (f", {failed} esuate" if failed else ""))
+
+    def series_files(self):
+        """Fișierele seriei în ordinea analizei: lista explicită sau fișierele .dcm sortate din director"""
+        if self.filenames is not None:
+            return list(self.filenames)
         dicom_files = []
         for file in os.listdir(self.data_directory):
             if file.lower().endswith('.dcm'):
                 dicom_files.append(file)
+        return sorted(dicom_files)
 
-        dicom_files.sort()
-        print(f"Gasit {len(dicom_files)} fisiere DICOM")
+    def record_error(self, slice_idx, filename, category, message, recovered=False):
+        """Înregistrează o eroare (sau o recuperare) pentru un slice; slice_idx None = tot studiul"""
+        self.errors.append(error_record(slice_idx, filename, category, message, recovered))
+        if not recovered:
+            print(f"Eroare la {filename or self.data_directory} [{category}]: {message}")
 
-        for i, filename in enumerate(dicom_files):
-            try:
-                path = os.path.join(self.data_directory, filename)
-                dicom = pydicom.dcmread(path)
-                img = dicom.pixel_array.astype(np.float32)
+    def error_summary(self):
+        """Statusul studiului și numărul de erori per categorie"""
+        return summarize_errors(self.errors, self.status)
 
-                analysis = self.analyze_anatomic_criteria(img, i, filename)
-                self.slice_data[i] = {
-                    'filename': filename,
-                    'image': img,
-                    'analysis': analysis
-                }
+    def budget_exceeded(self):
+        return self.deadline is not None and time.perf_counter() > self.deadline
 
-            except Exception as e:
-                print(f"Eroare la {filename}: {e}")
-                continue
-
-        print(f"Analizat {len(self.slice_data)} slice-uri")
+    def remaining_budget(self):
+        """Secundele rămase din bugetul de timp (None fără buget)"""
+        return None if self.deadline is None else max(0.0, self.deadline - time.perf_counter())
 
-    def analyze_anatomic_criteria(self, img, slice_idx, filename):
-        """Analizează criteriile anatomice pentru Y3"""
-        h, w = img.shape
+    def abort_study(self, processed):
+        """Oprește un studiu care a depășit bugetul de timp"""
+        message = f"bugetul de {self.time_budget:g}s depasit dupa {processed}/{self.total_files} slice-uri"
+        self.record_error(None, None, TIMEOUT, message)
+        self.status = TIMEOUT
+        raise StudyTimeoutError(message, self.error_summary())
 
-        # Auto-windowing
-        p1, p99 = np.percentile(img, [1, 99])
-        img_windowed = np.clip(img, p1, p99)
-        img_norm = ((img_windowed - p1) / (p99 - p1) * 255).astype(np.uint8)
+    def analyze_slices(self, dicom_files, indices=None):
+        """
+        Citește și analizează slice-urile în procesul curent, în blocuri de ANALYSIS_BATCH_SIZE
+        (forma Y se calculează pe tot blocul); întoarce (timp citire, timp analiză)
+        """
+        read_time = 0.0
+        analysis_time = 0.0
+        batch = []
+
+        for processed, i in enumerate(range(len(dicom_files)) if indices is None else indices):
+            if self.budget_exceeded():
+                self.abort_study(processed)
+            filename = dicom_files[i]
+            try:
+                t0 = time.perf_counter()
+                dicom, pixels, recoveries = read_dicom_slice(os.path.join(self.data_directory, filename))
+                batch.append((i, filename, pixels.astype(np.float32), self.get_slice_metadata(dicom)))
+                read_time += time.perf_counter() - t0
+            except SliceReadError as e:
+                self.record_error(i, filename, e.category, e)
+                continue
 
-        # CRITERIUL 1: Detectează forma Y în centru
-        y_shape_score = self.detect_central_y_shape(img_norm)
+            for category, message in recoveries:
+                self.record_error(i, filename, category, message, recovered=True)
+            if len(batch) >= ANALYSIS_BATCH_SIZE:
+                analysis_time += self.analyze_batch(batch)
+                batch = []
 
-        # CRITERIUL 2: Verifică ABSENȚA coastelor laterale (CHEIE!)
-        no_ribs_score = self.verify_no_lateral_ribs(img_norm)
+        if batch:
+            analysis_time += self.analyze_batch(batch)
+        return read_time, analysis_time
 
-        # CRITERIUL 3: Poziția în ultimele slice-uri
-        position_score = self.calculate_position_score(slice_idx, filename)
+    def analyze_batch(self, batch):
+        """
+        Analizează un bloc de slice-uri citite (slice_idx, filename, img, metadata) și le salvează;
+        dacă blocul eșuează, slice-urile sunt reanalizate unul câte unul, ca eroarea să rămână la slice-ul ei
+        """
+        start = time.perf_counter()
+        try:
+            analyses = self.analyze_image_criteria_batch([img for _, _, img, _ in batch])
+        except Exception:
+            analyses = [None] * len(batch)
 
-        # CRITERIUL 4: Calitatea vertebrei centrale
-        vertebra_quality = self.analyze_central_vertebra(img_norm)
+        for (slice_idx, filename, img, metadata), analysis in zip(batch, analyses):
+            try:
+                if analysis is None:
+                    analysis = self.analyze_image_criteria(img)
+                self.store_slice(slice_idx, filename, img, self.complete_analysis(analysis, slice_idx, filename),
+                                 metadata)
+            except Exception as e:
+                self.record_error(slice_idx, filename, ANALYSIS_ERROR, e)
+        return time.perf_counter() - start
 
-        # SCORE FINAL - prioritate pe absența coastelor
-        y3_score = (no_ribs_score * 0.5 +  # 50% - ABSENȚA coastelor
-                    y_shape_score * 0.3 +  # 30% - Forma Y
-                    position_score * 0.1 +  # 10% - Poziție
-                    vertebra_quality * 0.1)  # 10% - Calitate
+    def analyze_slices_parallel(self, dicom_files, workers):
+        """
+        Volumul seriei stă într-un bloc de memorie partajată: workerii primesc doar
+        indexul și numele fișierului, decodează direct în volum și întorc doar scorurile.
+        Localizarea corpului rulează și ea într-un worker. Timpii de citire și analiză
+        sunt sumați pe workeri (timp CPU, nu timp real); întoarce (roi, citire, analiză).
+        La depășirea bugetului de timp workerii sunt opriți imediat, chiar dacă
+        un slice e încă în decodare.
+        """
+        from multiprocessing import shared_memory
+        from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+        header = self.read_series_header(dicom_files)
+        if header is None:
+            return (0.0,) + self.analyze_slices(dicom_files)  # Erorile fiecărui slice sunt înregistrate acolo
+        shape = (len(dicom_files), int(header.Rows), int(header.Columns))
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+        volume = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+
+        roi_time = 0.0
+        read_time = 0.0
+        analysis_time = 0.0
+        try:
+            initargs = (shm.name, shape, self.data_directory, self.params, self.total_files)
+            # Fără context manager: la ieșire, shutdown(wait=True) ar aștepta și bucățile blocate
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_slice_worker, initargs=initargs)
+            try:
+                if self.params['roi_mode'] == 'body':
+                    roi_start = time.perf_counter()
+                    try:
+                        self.body = pool.submit(_localize_body_worker, dicom_files).result(
+                            timeout=self.remaining_budget())
+                    except FutureTimeoutError:
+                        self.abort_study(0)
+                    roi_time = time.perf_counter() - roi_start
+
+                chunksize = max(1, len(dicom_files) // (workers * 4))
+                tasks = list(enumerate(dicom_files))
+                futures = [pool.submit(_score_chunk_worker, tasks[start:start + chunksize], self.body)
+                           for start in range(0, len(tasks), chunksize)]
+
+                processed = 0
+                for future in futures:
+                    try:
+                        results = future.result(timeout=self.remaining_budget())
+                    except FutureTimeoutError:
+                        self.abort_study(processed)
+                    for i, filename, record, metadata, errors, times, own_image in results:
+                        if self.budget_exceeded():
+                            self.abort_study(processed)
+                        processed += 1
+                        for category, message in errors:
+                            self.record_error(i, filename, category, message, recovered=record is not None)
+                        if record is None:
+                            continue
+
+                        img = volume[i] if own_image is None else own_image
+                        self.store_slice(i, filename, img, dict(zip(COMPACT_ANALYSIS_KEYS, record)), metadata)
+                        read_time += times[0]
+                        analysis_time += times[1]
+            except BaseException:
+                _terminate_pool(pool)
+                raise
+            pool.shutdown()
+        finally:
+            # Imaginile rămase în top K sunt copiate înainte de eliberarea memoriei partajate
+            for data in self.slice_data.values():
+                if 'image' in data:
+                    data['image'] = np.array(data['image'])
+            del volume
+            shm.close()
+            shm.unlink()
+
+        return roi_time, read_time, analysis_time
+
+    def read_series_header(self, dicom_files):
+        """Header-ul primului slice lizibil (fără pixeli) - dimensiunea volumului partajat"""
+        for filename in dicom_files:
+            try:
+                header, _ = read_dataset(os.path.join(self.data_directory, filename), stop_before_pixels=True)
+                if 'Rows' in header and 'Columns' in header:
+                    return header
+            except SliceReadError:
+                continue
+        return None
 
-        return {
-            'y_shape_score': y_shape_score,
-            'no_ribs_score': no_ribs_score,
-            'position_score': position_score,
-            'vertebra_quality': vertebra_quality,
-            'y3_score': y3_score,
-            'windowed_image': img_norm,
-            'ribs_detected': 100 - no_ribs_score  # Pentru debugging
-        }
+    def localize_series_body(self, dicom_files):
+        """Localizează corpul o dată per serie, pe un subset rar de slice-uri"""
+        count = min(self.params['body_sample_slices'], len(dicom_files))
+        if count == 0:
+            return None
+        sample = np.unique(np.linspace(0, len(dicom_files) - 1, count).round().astype(int))
 
-    def detect_central_y_shape(self, img):
-        """Detectează forma Y în zona centrală"""
-        h, w = img.shape
+        images = []
+        for i in sample:
+            try:
+                images.append(read_hu_image(os.path.join(self.data_directory, dicom_files[i])))
+            except Exception:
+                continue
 
-        # Zona centrală pentru vertebra
-        center_h_start = int(h * 0.58)
-        center_h_end = int(h * 0.80)
-        center_w_start = int(w * 0.42)
-        center_w_end = int(w * 0.58)
+        body = localize_body(images, self.params) if images else None
+        if body is None:
+            print("Corpul nu a putut fi localizat - folosesc ROI-urile fixe")
+        else:
+            print(f"Corp localizat: randuri {body[0]}-{body[1]}, coloane {body[2]}-{body[3]}, "
+                  f"coloana vertebrala la ({body[4]}, {body[5]})")
+        return body
 
-        vertebra_region = img[center_h_start:center_h_end, center_w_start:center_w_end]
+    def get_geometry(self, shape):
+        """Geometria ROI a seriei curente (după corp, dacă a fost localizat)"""
+        return self.config.geometry(shape, self.body)
 
-        # Threshold pentru structuri dense
-        _, binary = cv2.threshold(vertebra_region, 140, 255, cv2.THRESH_BINARY)
+    def store_slice(self, slice_idx, filename, img, analysis, metadata=None):
+        """
+        Salvează un slice analizat în rezultatele detectorului.
+        Se păstrează doar scorurile compacte; imaginea rămâne în memorie
+        numai cât timp slice-ul e în top K.
+        """
+        metadata = metadata or {}
+        if self.study_uid is None:
+            self.study_uid = metadata.get('study_uid')
+            self.series_uid = metadata.get('series_uid')
+        if self.series_header is None:
+            self.series_header = metadata.get('header')
+
+        self.slice_data[slice_idx] = {
+            'filename': filename,
+            'analysis': {key: analysis[key] for key in COMPACT_ANALYSIS_KEYS},
+            'sop_uid': metadata.get('sop_uid'),
+            'z': metadata.get('z'),
+            'position': metadata.get('position')
+        }
+        self.record_scores(slice_idx, analysis)
+
+        evicted = self.selector.push(slice_idx, analysis['y3_score'])
+        if evicted != slice_idx:
+            self.slice_data[slice_idx]['image'] = img
+        if evicted is not None and evicted != slice_idx:
+            self.slice_data[evicted].pop('image', None)
+
+    def reserve_scores(self, num_slices):
+        """Prealocă tabelul de scoruri pentru numărul de slice-uri cunoscut"""
+        if num_slices > len(self.score_table):
+            table = np.full((num_slices, len(SCORE_COLUMNS)), np.nan, dtype=np.float32)
+            table[:len(self.score_table)] = self.score_table
+            self.score_table = table
+
+    def record_scores(self, slice_idx, analysis):
+        """Scrie scorurile unui slice în tabelul vectorizat"""
+        if slice_idx >= len(self.score_table):
+            self.reserve_scores(max(slice_idx + 1, 2 * len(self.score_table)))
+        self.score_table[slice_idx] = [analysis[column] for column in SCORE_COLUMNS]
+
+    def get_scores(self, column='y3_score'):
+        """Coloana de scoruri pentru toate slice-urile (NaN pentru slice-urile eșuate)"""
+        n = max(self.slice_data) + 1 if self.slice_data else 0
+        return self.score_table[:n, SCORE_COLUMNS.index(column)]
+
+    @staticmethod
+    def get_slice_metadata(dicom):
+        """UID-urile, poziția și tag-urile de serie dintr-un header DICOM"""
+        position = dicom.get('ImagePositionPatient')
+        has_position = position is not None and len(position) == 3
+        return {
+            'study_uid': str(dicom.get('StudyInstanceUID', '')) or None,
+            'series_uid': str(dicom.get('SeriesInstanceUID', '')) or None,
+            'sop_uid': str(dicom.get('SOPInstanceUID', '')) or None,
+            'z': float(position[2]) if has_position else None,
+            'position': [float(v) for v in position] if has_position else None,
+            'header': {tag: dicom.get(tag) for tag in SERIES_HEADER_TAGS if dicom.get(tag) is not None}
+        }
 
-        # Morfologie
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+    def analyze_anatomic_criteria(self, img, slice_idx, filename):
+        """Analizează criteriile anatomice pentru Y3"""
+        return self.complete_analysis(self.analyze_image_criteria(img), slice_idx, filename)
 
-        # Găsește contururi
-        contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    def complete_analysis(self, analysis, slice_idx, filename):
+        """Adaugă poziția în serie și scorul final la criteriile de imagine"""
+        # CRITERIUL 3: Poziția în ultimele slice-uri
+        analysis['position_score'] = self.calculate_position_score(slice_idx, filename)
 
-        if not contours:
-            return 0
+        # SCORE FINAL - prioritate pe absența coastelor
+        analysis['y3_score'] = self.combine_y3_score(analysis)
 
-        # Analizează cel mai mare contur
-        main_contour = max(contours, key=cv2.contourArea)
-        area = cv2.contourArea(main_contour)
+        return analysis
 
-        if area < 50:
-            return 0
+    def analyze_image_criteria(self, img):
+        """Criteriile care depind doar de imagine (fără poziția în serie)"""
+        return self.analyze_image_criteria_batch([img])[0]
 
-        # Analizează caracteristicile Y
-        y_score = self.analyze_y_characteristics(main_contour, vertebra_region)
+    def analyze_image_criteria_batch(self, images):
+        """Criteriile de imagine pentru mai multe slice-uri; forma Y se calculează pe tot teancul"""
+        windowed = []
+        for img in images:
+            # Auto-windowing
+            p1, p99 = np.percentile(img, [1, 99])
+            img_windowed = np.clip(img, p1, p99)
+            windowed.append(((img_windowed - p1) / (p99 - p1) * 255).astype(np.uint8))
 
-        return y_score
+        # CRITERIUL 1: Detectează forma Y în centru
+        features = self.extract_y_shape_features_batch(windowed)
+        y_shape_scores = score_y_shape(features[:, 0], features[:, 1], features[:, 2], self.params)
+
+        analyses = []
+        for img, img_norm, y_shape_score in zip(images, windowed, y_shape_scores):
+            # CRITERIUL 2: Verifică ABSENȚA coastelor laterale (CHEIE!)
+            no_ribs_score = self.verify_no_lateral_ribs(img_norm)
+
+            # CRITERIUL 4: Calitatea vertebrei centrale
+            vertebra_quality = self.analyze_central_vertebra(img_norm)
+
+            analyses.append({
+                'y_shape_score': float(y_shape_score),
+                'no_ribs_score': no_ribs_score,
+                'vertebra_quality': vertebra_quality,
+                'central_density': float(self.get_center_region(img).mean()),  # Fără fereastră: comparabilă între slice-uri
+                'windowed_image': img_norm,
+                'ribs_detected': 100 - no_ribs_score  # Pentru debugging
+            })
+        return analyses
+
+    def combine_y3_score(self, analysis):
+        """Combină criteriile în scorul Y3 final"""
+        return float(combine_scores(analysis['no_ribs_score'], analysis['y_shape_score'],
+                                    analysis['position_score'], analysis['vertebra_quality'],
+                                    self.params['weights']))
+
+    def get_center_region(self, img):
+        """Zona centrală pentru vertebra"""
+        return img[self.get_geometry(img.shape).center]
+
+    def extract_y_shape_features(self, img, threshold=None):
+        """Aria, circularitatea și alungirea celui mai mare contur din zona centrală"""
+        return tuple(float(value) for value in self.extract_y_shape_features_batch([img], threshold)[0])
+
+    def extract_y_shape_features_batch(self, images, threshold=None):
+        """Caracteristicile formei Y (n, 3) pentru mai multe imagini uint8"""
+        return self.y_shape_features_from_crops([self.get_center_region(img) for img in images], threshold)
+
+    def y_shape_features_from_crops(self, crops, threshold=None):
+        """Caracteristicile formei Y (n, 3) pentru zone centrale deja decupate, grupate după mărime"""
+        if threshold is None:
+            threshold = self.params['y_threshold']
+        features = np.zeros((len(crops), 3))
+        groups = {}
+        for i, crop in enumerate(crops):
+            groups.setdefault(crop.shape, []).append(i)
+        for indices in groups.values():
+            features[indices] = y_shape_features_batch(np.stack([crops[i] for i in indices]), threshold,
+                                                       self.config.kernel)
+        return features
 
     def verify_no_lateral_ribs(self, img):
         """Verifică ABSENȚA coastelor laterale - criteriul CHEIE pentru Y3"""
-        h, w = img.shape
+        geometry = self.get_geometry(img.shape)
 
         # Zonele laterale ÎNGUSTE pentru detectarea coastelor - fără suprapunere
-        left_lateral = img[:, :w // 6]  # Zona stângă mai îngustă
-        right_lateral = img[:, 5 * w // 6:]  # Zona dreaptă mai îngustă
+        left_lateral = img[geometry.left]
+        right_lateral = img[geometry.right]
 
         # Detectează structuri osoase laterale (coaste = ovaluri albe)
         left_ribs = self.count_lateral_bone_structures(left_lateral)
@@ -137,57 +824,48 @@ class AnatomicL3Detector:
 
         total_ribs = left_ribs + right_ribs
 
-        # Scorul pentru ABSENȚA coastelor
-        if total_ribs == 0:
-            return 100  # PERFECT - fără coaste (Y3!)
-        elif total_ribs <= 2:
-            return 70  # Foarte puține coaste
-        elif total_ribs <= 4:
-            return 40  # Câteva coaste (Y2?)
-        elif total_ribs <= 6:
-            return 20  # Multe coaste (Y1?)
-        else:
-            return 0  # Foarte multe coaste (zona toracică)
+        # Scorul pentru ABSENȚA coastelor (100 = fără coaste, Y3!)
+        return int(score_no_ribs(total_ribs, self.params))
 
     def count_lateral_bone_structures(self, lateral_region):
         """Numără structurile osoase laterale (coastele) - MULT MAI STRICT"""
-        if lateral_region.size == 0:
+        features = self.extract_lateral_bone_features(lateral_region, min_area=self.params['rib_area'][0])
+        if len(features) == 0:
             return 0
+        return int(np.sum(is_rib_candidate(features[:, 0], features[:, 1], features[:, 2], self.params)))
+
+    def extract_lateral_bone_features(self, lateral_region, threshold=None, min_area=0):
+        """Aria, alungirea și intensitatea medie pentru fiecare structură osoasă laterală"""
+        if lateral_region.size == 0:
+            return np.zeros((0, 3))
 
         # Threshold FOARTE RIDICAT pentru coaste (coastele sunt FOARTE dense/albe)
-        _, binary = cv2.threshold(lateral_region, 220, 255, cv2.THRESH_BINARY)
+        if threshold is None:
+            threshold = self.params['rib_threshold']
+        _, binary = cv2.threshold(lateral_region, threshold, 255, cv2.THRESH_BINARY)
 
         # Morfologie minimă - coastele sunt structuri clare
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        cleaned = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+        cleaned = cv2.morphologyEx(binary, cv2.MORPH_OPEN, self.config.kernel)
 
         # Găsește structurile osoase
         contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-        # Criterii FOARTE STRICTE pentru coaste
-        rib_count = 0
+        features = []
         for contour in contours:
             area = cv2.contourArea(contour)
+            if area <= min_area:
+                continue
 
-            # Coastele trebuie să fie destul de mari și vizibile
-            if 300 < area < 3000:  # Mai strict cu dimensiunea
-                # Verifică dacă e alungită (caracteristic coastelor)
-                x, y, w, h = cv2.boundingRect(contour)
-                if h > 0 and w > 0:
-                    aspect_ratio = w / h
-                    # Coastele sunt foarte alungite (orizontale)
-                    if 2.0 < aspect_ratio < 10:  # Mult mai strict
-
-                        # Verifică și intensitatea medie - coastele sunt foarte albe
-                        mask = np.zeros(lateral_region.shape, dtype=np.uint8)
-                        cv2.fillPoly(mask, [contour], 255)
-                        mean_intensity = np.mean(lateral_region[mask > 0])
+            # Alungirea (coastele sunt orizontale) și intensitatea medie (coastele sunt foarte albe)
+            x, y, w, h = cv2.boundingRect(contour)
+            aspect_ratio = w / h if h > 0 else 0
+            mask = np.zeros(lateral_region.shape, dtype=np.uint8)
+            cv2.fillPoly(mask, [contour], 255)
+            mean_intensity = np.mean(lateral_region[mask > 0])
 
-                        # Doar structuri FOARTE dense (coastele adevărate)
-                        if mean_intensity > 200:  # Foarte albe
-                            rib_count += 1
+            features.append((area, aspect_ratio, mean_intensity))
 
-        return rib_count
+        return np.array(features, dtype=np.float64).reshape(-1, 3)
 
     def calculate_position_score(self, slice_idx, filename):
         """Calculează scor bazat pe poziție (Y3 e în ultimele slice-uri)"""
@@ -206,7 +884,9 @@ class AnatomicL3Detector:
             pass
 
         # Fallback: ultimele slice-uri
-        total_files = len([f for f in os.listdir(self.data_directory) if f.endswith('.dcm')])
+        total_files = self.total_files
+        if not total_files:
+            total_files = len([f for f in os.listdir(self.data_directory) if f.endswith('.dcm')])
         relative_pos = slice_idx / total_files
 
         if relative_pos >= 0.85:
@@ -218,77 +898,18 @@ class AnatomicL3Detector:
 
     def analyze_central_vertebra(self, img):
         """Analizează calitatea vertebrei centrale"""
-        h, w = img.shape
-
-        center_region = img[int(h * 0.58):int(h * 0.80), int(w * 0.42):int(w * 0.58)]
-
-        if center_region.size == 0:
-            return 0
-
-        # Verifică prezența structurii dense centrale
-        dense_pixels = np.sum(center_region > 120)
-        total_pixels = center_region.size
-
-        density_ratio = dense_pixels / total_pixels
-
-        # Calculează uniformitatea
-        if dense_pixels > 0:
-            dense_region = center_region[center_region > 120]
-            uniformity = 100 - np.std(dense_region)
-        else:
-            uniformity = 0
-
-        # Scor combinat
-        quality = (density_ratio * 50 + uniformity * 0.5)
-        return min(quality, 100)
-
-    def analyze_y_characteristics(self, contour, region):
-        """Analizează caracteristicile formei Y"""
-        area = cv2.contourArea(contour)
-        perimeter = cv2.arcLength(contour, True)
-
-        if perimeter == 0:
-            return 0
+        return float(vertebra_quality_from_histogram(self.central_histogram(img), self.params['dense_threshold']))
 
-        # Caracteristici Y
-        circularity = 4 * np.pi * area / (perimeter ** 2)
-
-        x, y, w, h = cv2.boundingRect(contour)
-        aspect_ratio = h / w if w > 0 else 0
-
-        # Scor pentru forma Y
-        y_score = 0
-
-        # Y-ul are circularitate moderată
-        if 0.3 <= circularity <= 0.7:
-            y_score += 40
-        elif 0.2 <= circularity <= 0.8:
-            y_score += 20
-
-        # Y-ul e ușor vertical
-        if 1.0 <= aspect_ratio <= 1.6:
-            y_score += 30
-        elif 0.8 <= aspect_ratio <= 1.8:
-            y_score += 15
-
-        # Dimensiune rezonabilă
-        if 200 < area < 1500:
-            y_score += 30
-        elif 100 < area < 2000:
-            y_score += 15
-
-        return min(y_score, 100)
+    def central_histogram(self, img):
+        """Histograma de 256 bini a zonei centrale (imagine uint8)"""
+        center_region = self.get_center_region(img)
+        return np.bincount(center_region.ravel(), minlength=256)
 
     def find_best_y3_candidates(self):
-        """Găsește cei mai buni candidați Y3"""
+        """Găsește cei mai buni candidați Y3 (top K, deja selectați în timpul analizei)"""
         print("\nCaut Y3 bazat pe criteriul: Forma Y + FĂRĂ coaste laterale...")
 
-        candidates = []
-        for slice_idx, data in self.slice_data.items():
-            analysis = data['analysis']
-            candidates.append((slice_idx, data['filename'], analysis['y3_score'], analysis))
-
-        candidates.sort(key=lambda x: x[2], reverse=True)
+        candidates = self.get_candidates(self.selector.ranked())
 
         print("\nTop candidati Y3:")
         for i, (slice_idx, filename, score, analysis) in enumerate(candidates[:5]):
@@ -302,120 +923,269 @@ class AnatomicL3Detector:
 
         return candidates
 
-    def create_detailed_analysis(self, candidates):
-        """Creează analiza detaliată cu vizualizare"""
+    def get_candidates(self, slice_indices):
+        """Candidații (slice_idx, filename, score, analysis) pentru indicii dați"""
+        candidates = []
+        for slice_idx in slice_indices:
+            data = self.slice_data.get(slice_idx)
+            if data is not None:
+                candidates.append((slice_idx, data['filename'], data['analysis']['y3_score'], data['analysis']))
+        return candidates
+
+    def get_candidates_in_range(self, start, end):
+        """Candidații dintr-un interval de slice-uri, ordonați după index"""
+        scores = self.get_scores()
+        indices = np.flatnonzero(~np.isnan(scores[start:end + 1])) + start
+        return self.get_candidates(indices.tolist())
+
+    def analyze_sequence(self):
+        """
+        Analiza secvenței de slice-uri, vectorizată pe tot tabelul de scoruri:
+        scorurile componente netezite de-a lungul lui z, slice-ul unde se termină coastele,
+        vârful scorului Y3 netezit și zona Y3 derivată din date (nu din procent fix).
+        """
+        n = max(self.slice_data) + 1 if self.slice_data else 0
+        if n == 0:
+            return None
+
+        smoothed = smooth_along_z(self.score_table[:n], self.params['sequence_window'])
+        columns = {column: smoothed[:, i] for i, column in enumerate(SCORE_COLUMNS)}
+
+        rib_fraction = smooth_along_z(rib_presence(self.score_table[:n, SCORE_COLUMNS.index('no_ribs_score')],
+                                                   self.params), self.params['sequence_window'])
+        termination = find_rib_termination(rib_fraction, self.params['rib_free_fraction'])
+        peak, zone = peak_zone(columns['y3_score'], termination or 0, self.params['zone_tolerance'])
+        if peak is None:
+            zone = default_zone_bounds(n)
+
+        # Stadiile formării: începutul, mijlocul și sfârșitul zonei (doar slice-uri valide)
+        raw_scores = self.get_scores()
+        zone_indices = np.flatnonzero(~np.isnan(raw_scores[zone[0]:zone[1] + 1])) + zone[0]
+        stages = {
+            'early': int(zone_indices[0]) if len(zone_indices) else None,
+            'middle': int(zone_indices[len(zone_indices) // 2]) if len(zone_indices) > 2 else None,
+            'optimal': int(zone_indices[-1]) if len(zone_indices) else None
+        }
+
+        return {
+            'smoothed': columns,
+            'rib_termination': termination,
+            'peak': peak,
+            'zone': zone,
+            'zone_indices': zone_indices,
+            'progression_quality': progression_quality(raw_scores[zone_indices]),
+            'stages': stages
+        }
+
+    def slice_spacing(self):
+        """Distanța dintre slice-uri (mm): din pozițiile z, altfel din SliceThickness"""
+        indices = [i for i in sorted(self.slice_data) if self.slice_data[i].get('z') is not None]
+        if len(indices) > 1:
+            z = np.array([self.slice_data[i]['z'] for i in indices])
+            spacing = float(np.median(np.abs(np.diff(z)) / np.diff(indices)))
+            if spacing > 0:
+                return spacing
+        thickness = (self.series_header or {}).get('SliceThickness')
+        return float(thickness) if thickness else DEFAULT_SLICE_SPACING_MM
+
+    def label_vertebral_levels(self, sequence=None, l3_slice=None):
+        """
+        Etichetează T12-L5 din același tabel de scoruri folosit pentru L3 - fără
+        o nouă trecere prin serie. Discurile sunt minimele densității zonei centrale.
+        Cu l3_slice (candidatul ales), L3 din etichete este chiar slice-ul ales;
+        fără el, se numără de la coaste sau, în lipsa lor, de la vârful Y3 netezit.
+        """
+        sequence = sequence or self.analyze_sequence()
+        if sequence is None:
+            return None
+        step = self.params['vertebra_pitch_mm'] / self.slice_spacing()
+        window = max(int(step / 4), 1) | 1  # Netezire sub înălțimea unui disc
+        signal = smooth_along_z(self.get_scores('central_density'), window)
+        if l3_slice is not None:
+            anchor, source = l3_slice, 'chosen_l3'
+        else:
+            anchor, source = (None, 'ribs') if sequence['rib_termination'] else (sequence['peak'], 'l3_peak')
+        return label_vertebral_levels(signal, sequence['rib_termination'], step,
+                                      self.params['disc_min_prominence'], l3_anchor=anchor, anchor_source=source)
+
+    def atlas_similarity(self, atlas, candidates, k=5):
+        """
+        Scorul suplimentar (0-100) de similaritate al candidaților cu slice-urile L3 confirmate
+        din atlasul de referință (l3_reference_atlas); nu intră în y3_score.
+        """
+        from l3_reference_atlas import detector_descriptor
+
+        if not candidates:
+            return np.zeros(0)
+        similarity = atlas.similarity(np.stack([detector_descriptor(self, idx) for idx, _, _, _ in candidates]), k)
+        for (idx, _, _, _), value in zip(candidates, similarity):
+            self.slice_data[idx]['analysis']['atlas_similarity'] = float(value)
+        return similarity
+
+    def get_best_result(self, candidates):
+        """Rezultatul final ca dicționar, fără afișare sau grafice"""
+        slice_idx, filename, score, analysis = candidates[0]
+        return {
+            'filename': filename,
+            'slice_index': slice_idx,
+            'num_slices': len(self.slice_data),
+            'y3_score': float(score),
+            'y_shape_score': float(analysis['y_shape_score']),
+            'no_ribs_score': float(analysis['no_ribs_score']),
+            'position_score': float(analysis['position_score']),
+            'vertebra_quality': float(analysis['vertebra_quality']),
+            'ribs_detected': float(analysis['ribs_detected'])
+        }
+
+    def create_detailed_analysis(self, candidates, report='figure', output_path='y3_anatomic_detection.png'):
+        """
+        Creează analiza detaliată cu vizualizare.
+
+        report: 'figure' - raportul matplotlib complet (Agg, fără fereastră),
+                'light' - raport rapid compus direct cu OpenCV,
+                None - fără raport grafic
+        """
         best_candidate = candidates[0]
         slice_idx, filename, score, analysis = best_candidate
 
-        data = self.slice_data[slice_idx]
-        img = data['image']
-
         print(f"\nRECOMANDARE FINALA Y3:")
         print(f"Fisier: {filename}")
         print(f"Score Y3: {score:.1f}")
         print(f"Criteriu CHEIE: {analysis['ribs_detected']:.0f} coaste detectate")
 
-        # Vizualizare
-        fig, axes = plt.subplots(2, 3, figsize=(15, 10))
-
-        # Auto-windowing
-        p1, p99 = np.percentile(img, [1, 99])
-        img_display = np.clip(img, p1, p99)
-        img_display = ((img_display - p1) / (p99 - p1) * 255).astype(np.uint8)
-
-        # Imaginea originală
-        axes[0, 0].imshow(img_display, cmap='gray')
-        axes[0, 0].set_title(f"CT Original\n{filename}")
-        axes[0, 0].axis('off')
-
-        # Analiza coastelor
-        h, w = img_display.shape
-        ribs_analysis = img_display.copy()
-
-        # Marchează zonele laterale ÎNGUSTE - fără suprapunere cu centrul
-        cv2.rectangle(ribs_analysis, (0, 0), (w // 6, h), 128, 2)  # Stânga îngustă
-        cv2.rectangle(ribs_analysis, (5 * w // 6, 0), (w, h), 128, 2)  # Dreapta îngustă
-
-        # Marchează zona Y centrală
-        center_h_start = int(h * 0.58)
-        center_h_end = int(h * 0.80)
-        center_w_start = int(w * 0.42)
-        center_w_end = int(w * 0.58)
-        cv2.rectangle(ribs_analysis, (center_w_start, center_h_start),
-                      (center_w_end, center_h_end), 255, 3)
-
-        axes[0, 1].imshow(ribs_analysis, cmap='gray')
-        axes[0, 1].set_title(f"Analiza Anatomica\nCoaste: {analysis['ribs_detected']:.0f}")
-        axes[0, 1].axis('off')
-
-        # Zona Y extrasa
-        vertebra_region = img_display[center_h_start:center_h_end, center_w_start:center_w_end]
-        axes[0, 2].imshow(vertebra_region, cmap='gray')
-        axes[0, 2].set_title(f"Forma Y Extrasa\nScore: {analysis['y_shape_score']:.0f}")
-        axes[0, 2].axis('off')
-
-        # Grafic scoruri
-        candidate_scores = [c[2] for c in candidates[:10]]
-        axes[1, 0].bar(range(len(candidate_scores)), candidate_scores)
-        axes[1, 0].set_title("Scoruri Y3 Candidati")
-        axes[1, 0].set_xlabel("Rank")
-        axes[1, 0].set_ylabel("Score Y3")
-
-        # Componente scor
-        components = ['Fără Coaste', 'Forma Y', 'Poziție', 'Calitate']
-        scores = [analysis['no_ribs_score'], analysis['y_shape_score'],
-                  analysis['position_score'], analysis['vertebra_quality']]
-        colors = ['red', 'blue', 'green', 'orange']
-
-        axes[1, 1].bar(components, scores, color=colors, alpha=0.7)
-        axes[1, 1].set_title("Criteriile Anatomice Y3")
-        axes[1, 1].set_ylabel("Score")
-        axes[1, 1].tick_params(axis='x', rotation=45)
-
-        # Statistici
-        stats_text = f"""DETECTIE Y3 ANATOMICA
-
-Fisier: {filename}
-Score Y3: {score:.1f}
-
-CRITERIUL CHEIE:
-Coaste detectate: {analysis['ribs_detected']:.0f}
-Status: {'✓ FĂRĂ coaste (Y3!)' if analysis['ribs_detected'] < 10 else '✗ Cu coaste (Y1/Y2)'}
-
-Alte criterii:
-- Forma Y: {analysis['y_shape_score']:.0f}/100
-- Poziție ultimele slice-uri: {analysis['position_score']:.0f}/100
-- Calitate vertebră: {analysis['vertebra_quality']:.0f}/100
-
-Interpretare:
-{'✓ Y3 CONFIRMAT' if score > 60 else '? Y3 POSIBIL' if score > 40 else '✗ NU este Y3'}
-
-Zona de lucru pentru sarcopenie:
-{'✓ Curată, fără coaste' if analysis['ribs_detected'] < 20 else '✗ Cu interferențe osoase'}
-        """
+        if report is None:
+            return filename, score
 
-        axes[1, 2].text(0.05, 0.95, stats_text, fontsize=8,
-                        verticalalignment='top', transform=axes[1, 2].transAxes,
-                        bbox=dict(boxstyle="round,pad=0.3", facecolor="lightgray", alpha=0.8))
-        axes[1, 2].axis('off')
+        # Rapoartele (și matplotlib) se încarcă doar când sunt cerute - importul detectorului rămâne ușor
+        from l3_report_renderer import window_for_display, render_figure_report, render_light_report
 
-        plt.tight_layout()
-        plt.savefig('y3_anatomic_detection.png', dpi=150, bbox_inches='tight')
-        plt.show()
+        img_display = window_for_display(self.slice_data[slice_idx]['image'])
+
+        candidate_scores = [c[2] for c in candidates[:10]]
+
+        if report == 'light':
+            render_light_report(img_display, filename, score, analysis, candidate_scores, output_path,
+                                geometry=self.get_geometry(img_display.shape))
+        else:
+            render_figure_report(img_display, filename, score, analysis, candidate_scores, output_path,
+                                 geometry=self.get_geometry(img_display.shape))
+        print(f"Raport salvat: {output_path}")
 
         return filename, score
 
 
-def detect_y3_anatomic(data_directory):
-    """Detectare Y3 bazată pe criteriile anatomice fundamentale"""
+# Starea fiecărui proces worker: detectorul și volumul din memoria partajată
+_worker_state = {}
+
+
+def _init_slice_worker(shm_name, shape, data_directory, params, total_files):
+    """Atașează workerul la volumul partajat și construiește detectorul o singură dată"""
+    from multiprocessing import shared_memory
+
+    # Workerii folosesc resource tracker-ul procesului principal, care eliberează blocul
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    detector = AnatomicL3Detector(data_directory, params=params)
+    detector.total_files = total_files
+    _worker_state.update(shm=shm, volume=np.ndarray(shape, dtype=np.float32, buffer=shm.buf), detector=detector)
+
+
+def _score_slice_worker(task):
+    """
+    Decodează un slice direct în volumul partajat și întoarce doar scorurile compacte.
+    Erorile se întorc ca listă de (categorie, mesaj): recuperările pentru un slice
+    reușit, eroarea finală (ultima din listă) pentru unul eșuat.
+    Un slice cu altă dimensiune decât volumul e analizat separat și își întoarce imaginea.
+    """
+    slice_idx, filename = task
+    detector = _worker_state['detector']
+    volume = _worker_state['volume']
+    try:
+        t0 = time.perf_counter()
+        dicom, pixels, recoveries = read_dicom_slice(os.path.join(detector.data_directory, filename))
+    except SliceReadError as e:
+        return slice_idx, filename, None, None, [(e.category, str(e))], None, None
+    try:
+        if pixels.shape == volume.shape[1:]:
+            img, own_image = volume[slice_idx], None
+            img[...] = pixels
+        else:
+            img = own_image = pixels.astype(np.float32)
+        t1 = time.perf_counter()
+
+        analysis = detector.analyze_anatomic_criteria(img, slice_idx, filename)
+        record = tuple(float(analysis[key]) for key in COMPACT_ANALYSIS_KEYS)
+    except Exception as e:
+        return slice_idx, filename, None, None, recoveries + [(ANALYSIS_ERROR, str(e))], None, None
+    return (slice_idx, filename, record, detector.get_slice_metadata(dicom), recoveries,
+            (t1 - t0, time.perf_counter() - t1), own_image)
+
+
+def _score_chunk_worker(tasks, body):
+    """O bucată de slice-uri consecutive, scorate în același worker"""
+    _worker_state['detector'].body = body
+    return [_score_slice_worker(task) for task in tasks]
+
+
+def _localize_body_worker(dicom_files):
+    """Localizarea corpului seriei, în worker (poate fi oprită de bugetul de timp)"""
+    return _worker_state['detector'].localize_series_body(dicom_files)
+
+
+def _terminate_pool(pool):
+    """Oprește imediat workerii unui ProcessPoolExecutor, fără să aștepte sarcinile în curs"""
+    # ProcessPoolExecutor nu are (înainte de Python 3.14) o metodă publică pentru asta
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+ANCHOR_DESCRIPTIONS = {'chosen_l3': 'slice-ul L3 ales', 'ribs': 'ultima coasta', 'l3_peak': 'varful Y3'}
+
+
+def print_vertebral_levels(detector, l3_slice=None):
+    """Afișează intervalele de slice-uri T12-L5 (numărate de la slice-ul L3 ales, dacă e dat)"""
+    labels = detector.label_vertebral_levels(l3_slice=l3_slice)
+    if labels is None:
+        print("Nivelurile vertebrale nu au putut fi etichetate")
+        return None
+
+    print(f"\nNIVELURI VERTEBRALE (numarate de la {ANCHOR_DESCRIPTIONS[labels['anchor']]}, "
+          f"{len(labels['discs'])} discuri detectate):")
+    for level in VERTEBRAL_LEVELS:
+        info = labels['levels'][level]
+        if info is None:
+            print(f"  {level:>3}: in afara seriei")
+            continue
+        center_file = detector.slice_data.get(info['center'], {}).get('filename', '-')
+        note = '' if info['complete'] else ', partial in serie'
+        print(f"  {level:>3}: slice-uri {info['start'] + 1}-{info['end'] + 1} (centru {center_file}) "
+              f"[{info['source']}{note}]")
+    if labels['consistent'] is False:
+        print(f"  ATENTIE: ultima coasta cade in {labels['rib_level'] or 'afara T12-L5'}, nu in T12 - "
+              f"L3 ales si numaratoarea de la coaste nu se potrivesc")
+    return labels
+
+
+def detect_y3_anatomic(data_directory, report='figure', result_path=None, filenames=None, params=None,
+                       workers=None, levels=False, time_budget=None):
+    """
+    Detectare Y3 bazată pe criteriile anatomice fundamentale.
+    Dacă result_path e dat, rezultatul complet (scoruri per slice) se scrie ca JSON.
+    filenames restrânge analiza la o singură serie dintr-un director de studiu.
+    params: DetectorConfig sau dicționar de parametri (implicit DEFAULT_DETECTOR_PARAMS).
+    workers: numărul de procese pentru analiza slice-urilor (implicit în procesul curent).
+    levels: afișează și etichetarea T12-L5 (din aceeași trecere prin serie).
+    time_budget: secunde pentru tot studiul; la depășire se ridică StudyTimeoutError.
+    """
     print("DETECTOR Y3 ANATOMIC")
     print("Criteriul CHEIE: Forma Y + ABSENȚA coastelor laterale")
     print("=" * 50)
 
-    detector = AnatomicL3Detector(data_directory)
+    detector = AnatomicL3Detector(data_directory, filenames=filenames, params=params, time_budget=time_budget)
 
     # Analizează toate slice-urile
-    detector.load_and_analyze_all_slices()
+    detector.load_and_analyze_all_slices(workers=workers)
 
     if len(detector.slice_data) == 0:
         print("EROARE: Nu s-au gasit imagini valide!")
@@ -425,21 +1195,38 @@ def detect_y3_anatomic(data_directory):
     candidates = detector.find_best_y3_candidates()
 
     # Analiza detaliată
-    best_filename, best_score = detector.create_detailed_analysis(candidates)
+    best_filename, best_score = detector.create_detailed_analysis(candidates, report=report)
+
+    if result_path:
+        from l3_result_export import build_study_result, write_study_json
+        write_study_json(build_study_result(detector, candidates), result_path)
+        print(f"Rezultat JSON salvat: {result_path}")
 
     print(f"\nREZULTAT FINAL:")
     print(f"Y3 detectat în: {best_filename}")
     print(f"Score: {best_score:.1f}")
     print(f"Criteriul anatomic: {'CONFIRMAT' if best_score > 60 else 'NECLAR'}")
 
+    if levels:
+        print_vertebral_levels(detector, l3_slice=candidates[0][0])
+
     return best_filename, best_score
 
 
 if __name__ == "__main__":
+    import sys
+
     data_dir = "data/images/"
 
+    # --time-budget=SECUNDE oprește studiul care durează mai mult,
+    # --params=PROFIL încarcă un profil de parametri JSON/YAML (ex. best_profile.json din tuning)
+    time_budget = next((float(arg.split('=', 1)[1]) for arg in sys.argv[1:]
+                        if arg.startswith('--time-budget=')), None)
+    params_path = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--params=')), None)
+
     if os.path.exists(data_dir):
-        result = detect_y3_anatomic(data_dir)
+        result = detect_y3_anatomic(data_dir, levels='--levels' in sys.argv, time_budget=time_budget,
+                                    params=load_detector_params(params_path) if params_path else None)
     else:
         print(f"Directorul {data_dir} nu exista!")
         print("Specificati calea corecta catre imaginile DICOM.")
\ No newline at end of file
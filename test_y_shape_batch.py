@@ -0,0 +1,94 @@
+# test_y_shape_batch.py - Regresie: caracteristicile Y pe mozaic vs. calculul per slice
+import numpy as np
+import cv2
+import pytest
+
+from l3_y3_detector_anatomic import y_shape_features_batch, y_characteristics
+
+THRESHOLD = 140
+
+
+def reference_features(crop, threshold, kernel):
+    """Calculul per slice de dinainte de mozaic (fostul detect_central_y_shape)"""
+    _, binary = cv2.threshold(crop, threshold, 255, cv2.THRESH_BINARY)
+    cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+    contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return 0.0, 0.0, 0.0
+    main_contour = max(contours, key=cv2.contourArea)
+    return y_characteristics(main_contour, cv2.contourArea(main_contour))
+
+
+def synthetic_crops(h=48, w=40):
+    """Zone centrale fixe: goală, plină, forme la margini, zgomot și un singur pixel"""
+    rng = np.random.default_rng(0)
+    crops = []
+
+    crops.append(np.zeros((h, w), dtype=np.uint8))  # Goală
+    crops.append(np.full((h, w), 255, dtype=np.uint8))  # Plină
+
+    y_shape = np.zeros((h, w), dtype=np.uint8)
+    cv2.line(y_shape, (w // 2, h - 4), (w // 2, h // 2), 220, 5)
+    cv2.line(y_shape, (w // 2, h // 2), (6, 6), 220, 5)
+    cv2.line(y_shape, (w // 2, h // 2), (w - 7, 6), 220, 5)
+    crops.append(y_shape)
+
+    touching = np.zeros((h, w), dtype=np.uint8)
+    touching[:, :6] = 200  # Lipită de marginea stângă
+    touching[10:30, w - 8:] = 250  # Lipită de marginea dreaptă (vecina din mozaic)
+    crops.append(touching)
+
+    two_blobs = np.zeros((h, w), dtype=np.uint8)
+    cv2.circle(two_blobs, (10, 12), 6, 180, -1)
+    cv2.ellipse(two_blobs, (26, 32), (9, 13), 20, 0, 360, 230, -1)
+    crops.append(two_blobs)
+
+    equal_blobs = np.zeros((h, w), dtype=np.uint8)
+    equal_blobs[5:15, 5:15] = 255
+    equal_blobs[30:40, 22:32] = 255  # Arii egale - câștigă primul contur, ca max()
+    crops.append(equal_blobs)
+
+    single = np.zeros((h, w), dtype=np.uint8)
+    single[h // 2, w // 2] = 255
+    crops.append(single)
+
+    for _ in range(6):
+        crops.append(rng.integers(0, 256, (h, w), dtype=np.uint8))  # Zgomot
+        smooth = cv2.GaussianBlur(rng.integers(0, 256, (h, w), dtype=np.uint8), (0, 0), 3)
+        crops.append(cv2.normalize(smooth, None, 0, 255, cv2.NORM_MINMAX))
+
+    crops.append(np.full((h, w), THRESHOLD, dtype=np.uint8))  # Exact la prag (sub THRESH_BINARY)
+    return np.stack(crops)
+
+
+@pytest.mark.parametrize("kernel_size", [3, 5])
+def test_batch_matches_per_slice(kernel_size):
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+    crops = synthetic_crops()
+
+    batch = y_shape_features_batch(crops, THRESHOLD, kernel)
+    expected = np.array([reference_features(crop, THRESHOLD, kernel) for crop in crops])
+
+    np.testing.assert_allclose(batch, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_empty_and_full_tiles():
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    crops = synthetic_crops()[:2]
+
+    empty, full = y_shape_features_batch(crops, THRESHOLD, kernel)
+
+    assert tuple(empty) == (0.0, 0.0, 0.0)
+    h, w = crops.shape[1:]
+    assert full[0] == (h - 1) * (w - 1)  # Conturul zonei întregi, nu al mozaicului
+    assert tuple(full) == reference_features(crops[1], THRESHOLD, kernel)
+
+
+def test_single_crop_and_empty_stack():
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    crops = synthetic_crops()
+
+    single = y_shape_features_batch(crops[2:3], THRESHOLD, kernel)
+    assert tuple(single[0]) == reference_features(crops[2], THRESHOLD, kernel)
+    assert y_shape_features_batch(crops[:0], THRESHOLD, kernel).shape == (0, 3)